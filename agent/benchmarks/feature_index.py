@@ -0,0 +1,79 @@
+"""
+Benchmark: file -> feature lookup, linear scan vs FeatureIndex.
+
+Usage: python benchmarks/feature_index.py [--lookups N]
+
+Lookup time for the index should stay flat as the feature count grows,
+while the linear scan grows with the total number of files.
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from knowledge_loader import FeatureIndex, get_feature_for_file  # noqa: E402
+
+FEATURE_COUNTS = [10, 100, 1_000, 5_000, 20_000]
+FILES_PER_FEATURE = 8
+
+
+def make_features(count: int, rng: random.Random) -> list:
+    """Synthetic monorepo-shaped features."""
+    features = []
+    for i in range(count):
+        package = f"packages/pkg{i % 200}"
+        files = [
+            f"{package}/src/feature{i}/{name}.{rng.choice(['ts', 'tsx', 'py'])}"
+            for name in ("index", "route", "handler", "service", "model", "store", "view", "utils")[:FILES_PER_FEATURE]
+        ]
+        features.append({"name": f"Feature {i}", "category": f"Cat {i % 20}", "files": files})
+    return features
+
+
+def time_per_call(fn, paths) -> float:
+    start = time.perf_counter()
+    for path in paths:
+        fn(path)
+    return (time.perf_counter() - start) / len(paths)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--lookups", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    print(f"{'features':>9} {'build ms':>9} {'index us':>9} {'linear us':>10}")
+    for count in FEATURE_COUNTS:
+        features = make_features(count, rng)
+        all_files = [f for feature in features for f in feature["files"]]
+        # Mix of exact hits, absolute-path suffix hits and misses
+        paths = []
+        for _ in range(args.lookups):
+            roll = rng.random()
+            path = rng.choice(all_files)
+            if roll < 0.5:
+                paths.append(path)
+            elif roll < 0.8:
+                paths.append(f"/home/dev/repo/{path}")
+            else:
+                paths.append(f"packages/unknown/{rng.randrange(10**6)}.ts")
+
+        start = time.perf_counter()
+        index = FeatureIndex(features)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        index_us = time_per_call(index.lookup, paths) * 1e6
+        # The linear scan gets slow quickly; sample fewer paths at large sizes
+        linear_paths = paths[: max(10, args.lookups * 100 // count)]
+        linear_us = time_per_call(lambda p: get_feature_for_file(features, p), linear_paths) * 1e6
+
+        print(f"{count:>9} {build_ms:>9.1f} {index_us:>9.2f} {linear_us:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+"""
+Load harness: N concurrent onboarding sessions against one in-process worker.
+
+Usage: python benchmarks/load_harness.py [--sessions 1 10 50] [--navigations 5]
+
+Runs the real `entrypoint` / `OnboardingAgent` against a fake LiveKit room
+that plays the local server's part (pushes `onboarding-context` and the first
+`file-content`, answers `request-file(s)`) and a fake AgentSession whose
+LLM/TTS are sleeps of configurable length. Intent classification is stubbed
+the same way. Reports, per concurrency level:
+
+- context -> greeting: first context packet until the greeting starts speaking
+- navigation: "next file" transcript until the transition starts speaking
+- event-loop lag: how late a 10 ms ticker wakes up
+- RSS growth per session
+
+Needs the agent's requirements installed (main.py imports livekit).
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+# Keep the harness output readable; the agent logs warnings and up
+os.environ.setdefault("SB_LOG_LEVEL", "warning")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import main  # noqa: E402
+
+
+# --- Fake LiveKit room ------------------------------------------------------
+
+class FakeLocalParticipant:
+    def __init__(self, room: "FakeRoom"):
+        self.identity = f"agent-{room.name}"
+        self._room = room
+
+    async def publish_data(self, payload: bytes, reliable: bool = True, topic: str = "", **kwargs):
+        self._room.sent_bytes += len(payload)
+        if topic != "agent-commands":
+            return
+        message = json.loads(payload)
+        if message.get("type") == "request-file":
+            self._room.answer(message["requestId"], [message["path"]], message)
+        elif message.get("type") == "request-files":
+            self._room.answer(message["requestId"], message["paths"], message)
+
+
+class FakeRoom:
+    """Just enough of rtc.Room for entrypoint, with the UI bridge built in."""
+
+    def __init__(self, name: str, config: argparse.Namespace):
+        self.name = name
+        self.config = config
+        self.local_participant = FakeLocalParticipant(self)
+        self.remote_participants = {"ui": SimpleNamespace(identity="ui-bridge")}
+        self.sent_bytes = 0
+        self._handlers = {}
+        self._ui = SimpleNamespace(identity="ui-bridge")
+
+    def on(self, event: str):
+        def register(handler):
+            self._handlers.setdefault(event, []).append(handler)
+            return handler
+        return register
+
+    def emit(self, event: str, *args):
+        for handler in self._handlers.get(event, []):
+            handler(*args)
+
+    def push(self, message: dict):
+        packet = SimpleNamespace(
+            data=json.dumps(message).encode("utf-8"), topic="server-context", participant=self._ui,
+        )
+        self.emit("data_received", packet)
+
+    def file_content(self, path: str, request: dict = None) -> dict:
+        lines = [f"// {path} line {i}" for i in range(1, self.config.file_lines + 1)]
+        if request and request.get("endLine"):
+            lines = lines[request.get("startLine", 1) - 1:request["endLine"]]
+        return {"type": "file-content", "path": path, "content": "\n".join(lines), "totalLines": self.config.file_lines}
+
+    def answer(self, request_id: str, paths, request: dict):
+        async def reply():
+            await asyncio.sleep(self.config.rtt)
+            for path in paths:
+                self.push({**self.file_content(path, request), "requestId": request_id})
+        asyncio.get_running_loop().create_task(reply())
+
+
+class FakeJobContext:
+    def __init__(self, room: FakeRoom):
+        self.room = room
+        self.proc = SimpleNamespace(userdata={"vad": object()})
+
+    async def connect(self, **kwargs):
+        await asyncio.sleep(0)
+
+
+# --- Fake voice pipeline ----------------------------------------------------
+
+class StubModel:
+    def __init__(self, *args, **kwargs):
+        pass
+
+
+class FakeSpeechHandle:
+    """SpeechHandle stand-in: awaiting it waits for the speech to end or be interrupted."""
+
+    _ids = itertools.count()
+
+    def __init__(self):
+        self.id = f"speech_{next(self._ids)}"
+        self.task: asyncio.Task = None
+
+    def __await__(self):
+        return self._wait().__await__()
+
+    async def _wait(self):
+        try:
+            # Only our own cancellation propagates
+            await asyncio.wait({self.task})
+        except asyncio.CancelledError:
+            self.task.cancel()
+            raise
+
+
+class FakeAgentSession:
+    """AgentSession stand-in: replies are LLM + TTS latency, then speech."""
+
+    config: argparse.Namespace = None
+
+    def __init__(self, *args, **kwargs):
+        self._handlers = {}
+        self._speech = None
+        self.agent = None
+        self.speaking_at = []  # perf_counter() whenever a reply starts speaking
+
+    def on(self, event: str):
+        def register(handler):
+            self._handlers.setdefault(event, []).append(handler)
+            return handler
+        return register
+
+    def emit(self, event: str, *args):
+        for handler in self._handlers.get(event, []):
+            handler(*args)
+
+    async def start(self, agent, room):
+        self.agent = agent
+        agent._harness_session = self
+        HARNESS_SESSIONS[room.name] = self
+
+    def interrupt(self):
+        if self._speech and not self._speech.done():
+            self._speech.cancel()
+
+    def generate_reply(self, instructions: str = "", **kwargs) -> "FakeSpeechHandle":
+        return self._play(generate=True)
+
+    def say(self, text: str, **kwargs) -> "FakeSpeechHandle":
+        # Text written ahead of time: TTS only
+        return self._play(generate=False)
+
+    def _play(self, generate: bool) -> "FakeSpeechHandle":
+        self.interrupt()
+        handle = FakeSpeechHandle()
+        handle.task = self._speech = asyncio.get_running_loop().create_task(self._speak(generate, handle.id))
+        return handle
+
+    async def _speak(self, generate: bool, speech_id: str):
+        if generate:
+            await asyncio.sleep(self.config.llm_latency)
+        await asyncio.sleep(self.config.tts_latency)
+        self.speaking_at.append(time.perf_counter())
+        self.emit("agent_state_changed", SimpleNamespace(new_state="speaking"))
+        if generate:
+            # As in the real session, LLM metrics come once the reply is already playing
+            self.emit("metrics_collected", SimpleNamespace(
+                metrics=SimpleNamespace(ttft=self.config.llm_latency, speech_id=speech_id),
+            ))
+        try:
+            await asyncio.sleep(self.config.speech_seconds)
+        finally:
+            self.emit("agent_state_changed", SimpleNamespace(new_state="listening"))
+
+    def user_says(self, text: str):
+        self.emit("user_input_transcribed", SimpleNamespace(is_final=True, transcript=text))
+
+
+class HarnessAgent(main.OnboardingAgent):
+    # The real Agent.session comes from the running AgentActivity
+    session = property(lambda self: getattr(self, "_harness_session", None))
+
+
+HARNESS_SESSIONS = {}
+
+
+def install_fakes(config: argparse.Namespace):
+    FakeAgentSession.config = config
+    main.AgentSession = FakeAgentSession
+    main.OnboardingAgent = HarnessAgent
+    main.openai = SimpleNamespace(STT=StubModel, LLM=StubModel, TTS=StubModel)
+    # Never build a real AsyncOpenAI: it needs OPENAI_API_KEY and nothing here calls it
+    main.get_openai_client = lambda: SimpleNamespace()
+    main.settings.TTS_CACHE_BYTES = 0  # the fake session never synthesizes
+
+    async def classify(agent, user_text):
+        await asyncio.sleep(config.llm_latency)
+        return "NEXT" if "next" in user_text.lower() else "OTHER"
+
+    async def write_transition(instructions, task):
+        await asyncio.sleep(config.llm_latency)
+        return "Next up: a file that builds on this one."
+
+    main._classify_intent = classify
+    main._generate_transition_text = write_transition
+
+
+# --- Measurement ------------------------------------------------------------
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        # ru_maxrss is a high-water mark (KiB on Linux, bytes on macOS)
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+async def loop_lag_monitor(samples: list, interval: float = 0.01):
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - expected))
+
+
+async def wait_for_speech(session: FakeAgentSession, count: int, timeout: float = 30.0) -> float:
+    deadline = time.perf_counter() + timeout
+    while len(session.speaking_at) < count:
+        if time.perf_counter() > deadline:
+            raise TimeoutError("agent never started speaking")
+        await asyncio.sleep(0.005)
+    return session.speaking_at[count - 1]
+
+
+async def run_session(index: int, config: argparse.Namespace, results: dict):
+    room = FakeRoom(f"load-{index}", config)
+    worker = asyncio.create_task(main.entrypoint(FakeJobContext(room)))
+    await asyncio.sleep(config.join_delay)
+
+    journey = [f"src/module{n}/file{n}.ts" for n in range(config.navigations + 1)]
+    features = [
+        {"name": f"Feature {n}", "category": f"Cat {n % 10}", "description": "Synthetic feature",
+         "userFlows": ["do things"], "files": [f"src/module{n}/file{n}.ts"]}
+        for n in range(config.features)
+    ]
+
+    pushed_at = time.perf_counter()
+    room.push({"type": "onboarding-context", "capabilities": ["request-files", "line-range"],
+               "session": {"userName": f"user{index}", "goal": "load test", "experienceLevel": "intermediate",
+                           "selectedFiles": journey}})
+    # The local server sends features and the first file after the session
+    await asyncio.sleep(config.features_delay)
+    room.push({"type": "onboarding-context", "features": features})
+    room.push(room.file_content(journey[0]))
+
+    while room.name not in HARNESS_SESSIONS:
+        if worker.done():
+            worker.result()  # surface the entrypoint's exception
+            raise RuntimeError("entrypoint returned before starting a session")
+        await asyncio.sleep(0.005)
+    session = HARNESS_SESSIONS[room.name]
+
+    results["greeting"].append(await wait_for_speech(session, 1) - pushed_at)
+
+    for step in range(config.navigations):
+        await asyncio.sleep(config.speech_seconds + config.think_time)
+        said_at = time.perf_counter()
+        session.user_says("next file" if step % 2 == 0 else "okay next")
+        results["navigation"].append(await wait_for_speech(session, step + 2) - said_at)
+
+    room.emit("disconnected")
+    await worker
+
+
+def percentile(values, q):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run_level(sessions: int, config: argparse.Namespace) -> dict:
+    HARNESS_SESSIONS.clear()
+    results = {"greeting": [], "navigation": []}
+    lag = []
+    monitor = asyncio.create_task(loop_lag_monitor(lag))
+    rss_before = rss_bytes()
+    peak_rss = rss_before
+
+    async def track_peak():
+        nonlocal peak_rss
+        while True:
+            peak_rss = max(peak_rss, rss_bytes())
+            await asyncio.sleep(0.05)
+
+    tracker = asyncio.create_task(track_peak())
+    started = time.perf_counter()
+    await asyncio.gather(*(run_session(i, config, results) for i in range(sessions)))
+    elapsed = time.perf_counter() - started
+    monitor.cancel()
+    tracker.cancel()
+
+    return {
+        "sessions": sessions,
+        "elapsed_s": round(elapsed, 2),
+        "greeting_p50_ms": round(percentile(results["greeting"], 0.5) * 1000, 1),
+        "greeting_p95_ms": round(percentile(results["greeting"], 0.95) * 1000, 1),
+        "navigation_p50_ms": round(percentile(results["navigation"], 0.5) * 1000, 1),
+        "navigation_p95_ms": round(percentile(results["navigation"], 0.95) * 1000, 1),
+        "loop_lag_p50_ms": round(percentile(lag, 0.5) * 1000, 2),
+        "loop_lag_p95_ms": round(percentile(lag, 0.95) * 1000, 2),
+        "loop_lag_max_ms": round(max(lag, default=0.0) * 1000, 2),
+        "rss_per_session_kb": round((peak_rss - rss_before) / sessions / 1024, 1),
+        "greeting_mean_ms": round(statistics.fmean(results["greeting"]) * 1000, 1) if results["greeting"] else None,
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--navigations", type=int, default=5, help="'next' commands per session")
+    parser.add_argument("--features", type=int, default=200, help="features pushed per session")
+    parser.add_argument("--file-lines", type=int, default=400)
+    parser.add_argument("--rtt", type=float, default=0.05, help="data channel round trip (s)")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="stub LLM time to first token (s)")
+    parser.add_argument("--tts-latency", type=float, default=0.15, help="stub TTS time to first audio (s)")
+    parser.add_argument("--speech-seconds", type=float, default=0.5, help="how long each reply plays (s)")
+    parser.add_argument("--think-time", type=float, default=0.2, help="user pause after each reply (s)")
+    parser.add_argument("--features-delay", type=float, default=0.0, help="session packet to features + first file (s)")
+    parser.add_argument("--join-delay", type=float, default=0.05, help="agent join to first context push (s)")
+    parser.add_argument("--json", action="store_true", help="print one JSON object per level")
+    config = parser.parse_args()
+
+    install_fakes(config)
+    columns = ["sessions", "greeting_p50_ms", "greeting_p95_ms", "navigation_p50_ms", "navigation_p95_ms",
+               "loop_lag_p95_ms", "loop_lag_max_ms", "rss_per_session_kb"]
+    if not config.json:
+        print(" ".join(f"{c:>18}" for c in columns))
+    for sessions in config.sessions:
+        report = asyncio.run(run_level(sessions, config))
+        if config.json:
+            print(json.dumps(report))
+        else:
+            print(" ".join(f"{report[c]:>18}" for c in columns))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,244 @@
+"""
+Benchmark: knowledge_loader, prompts and retrieval on large-repo inputs.
+
+Usage:
+    python benchmarks/scaling.py [--quick] [--only NAME] [--output FILE]
+    python benchmarks/scaling.py --baseline FILE      # run, then compare
+    python benchmarks/scaling.py --compare OLD NEW    # compare two runs
+
+Synthetic feature sets (10 to 50k features) and knowledge docs (10 KB to
+4 MB) are generated from a fixed seed. Each case reports the best time per
+call and the peak bytes allocated by one call (tracemalloc, measured in a
+separate run so it doesn't skew the timing). Results are written as JSON so
+they can be kept as baselines; comparing flags cases that got slower or
+allocate more than `--threshold`, and exits non-zero if any did.
+"""
+
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import timeit
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import token_budget  # noqa: E402
+from knowledge_loader import format_feature_context, format_features_summary, get_feature_for_file  # noqa: E402
+from prompts import build_system_prompt, make_speakable_path  # noqa: E402
+from retrieval import RetrievalIndex, feature_snippet  # noqa: E402
+
+FEATURE_COUNTS = [10, 100, 1_000, 10_000, 50_000]
+KNOWLEDGE_BYTES = [10_000, 100_000, 1_000_000, 4_000_000]
+PATH_DEPTHS = [2, 8, 32, 128]
+QUICK_LIMIT = 1_000  # --quick caps feature counts, and knowledge sizes at 1000x this
+
+# Anything faster than this is noise, whatever the ratio says
+NOISE_FLOOR_SECONDS = 2e-6
+WORDS = ("auth session token route handler store render cache queue worker config "
+         "schema migration request response payload stream agent journey feature").split()
+
+
+def make_features(count: int, rng: random.Random, files_per_feature: int = 6) -> List[Dict]:
+    """Synthetic monorepo-shaped features with descriptions and flows."""
+    features = []
+    for i in range(count):
+        package = f"packages/pkg{i % 200}"
+        features.append({
+            "name": f"Feature {i}",
+            "category": f"Category {i % 25}",
+            "description": " ".join(rng.choice(WORDS) for _ in range(20)),
+            "userFlows": [" ".join(rng.choice(WORDS) for _ in range(5)) for _ in range(4)],
+            "files": [f"{package}/src/feature{i}/{name}.ts" for name in
+                      ("index", "route", "handler", "service", "model", "store", "view", "utils")[:files_per_feature]],
+            "dependencies": [f"Feature {rng.randrange(max(count, 1))}" for _ in range(3)],
+        })
+    return features
+
+
+def make_knowledge(size: int, rng: random.Random) -> str:
+    """Markdown-ish knowledge doc of roughly `size` bytes."""
+    parts, total, section = [], 0, 0
+    while total < size:
+        if section % 8 == 0:
+            chunk = f"\n## Section {section}\n"
+        elif section % 8 == 5:
+            chunk = "```ts\n" + "\n".join(f"const {rng.choice(WORDS)}{n} = {n};" for n in range(6)) + "\n```\n"
+        else:
+            chunk = " ".join(rng.choice(WORDS) for _ in range(40)) + ".\n"
+        parts.append(chunk)
+        total += len(chunk)
+        section += 1
+    return "".join(parts)
+
+
+def make_path(depth: int, rng: random.Random) -> str:
+    segments = [f"{rng.choice(WORDS)}_{rng.choice(WORDS)}-{n}" for n in range(depth - 1)]
+    return "/".join(segments + [f"{rng.choice(WORDS)}Handler.tsx"])
+
+
+Case = Tuple[str, int, Callable[[], object]]
+
+
+def build_cases(quick: bool, only: str = "") -> List[Case]:
+    """(name, size, call) per function and input size; inputs are built up front."""
+    rng = random.Random(0)
+    feature_counts = [n for n in FEATURE_COUNTS if not quick or n <= QUICK_LIMIT]
+    knowledge_sizes = [n for n in KNOWLEDGE_BYTES if not quick or n <= QUICK_LIMIT * 1000]
+    cases: List[Case] = []
+
+    def wanted(name: str) -> bool:
+        return not only or only in name
+
+    for count in feature_counts:
+        features = make_features(count, rng)
+        if wanted("format_features_summary"):
+            cases.append(("format_features_summary", count, lambda f=features: format_features_summary(f)))
+        if wanted("get_feature_for_file"):
+            # A miss scans every feature: the worst case for the linear lookup
+            miss = "packages/unknown/src/missing.ts"
+            cases.append(("get_feature_for_file", count, lambda f=features: get_feature_for_file(f, miss)))
+        if wanted("format_feature_context"):
+            # One feature listing `count` files: a generated feature that swallowed a directory
+            big = make_features(1, rng)[0]
+            big["files"] = [f"src/generated/module{n}/index.ts" for n in range(count)]
+            big["userFlows"] = big["userFlows"] * max(1, count // 40)
+            cases.append(("format_feature_context", count, lambda b=big: format_feature_context(b)))
+        if wanted("retrieval_search"):
+            index = RetrievalIndex()
+            for n, feature in enumerate(features):
+                index.stage(f"feature:{n}", [feature_snippet(str(n), feature)])
+            index.flush()
+            query = "how does the session token cache handle a stream request"
+            cases.append(("retrieval_search", count, lambda i=index: i.search(query)))
+
+    if wanted("build_system_prompt"):
+        summary = format_features_summary(make_features(1_000, rng))
+        journey = [make_path(4, rng) for _ in range(50)]
+        for size in knowledge_sizes:
+            doc = make_knowledge(size, rng)
+            source = make_knowledge(size, rng)
+
+            def prompt(doc=doc, source=source):
+                return build_system_prompt(
+                    "Ada", "Ship a feature", "intermediate", journey[3], doc, journey,
+                    current_step=3, total_steps=len(journey), features_summary=summary,
+                    current_file_content=source, architecture_doc=doc, tasks_doc=doc,
+                )
+            cases.append(("build_system_prompt", size, prompt))
+
+    if wanted("make_speakable_path"):
+        for depth in PATH_DEPTHS:
+            paths = [make_path(depth, rng) for _ in range(100)]
+            cases.append(("make_speakable_path", depth, lambda p=paths: [make_speakable_path(x) for x in p]))
+
+    return cases
+
+
+def measure(call: Callable[[], object], repeat: int) -> Dict[str, float]:
+    timer = timeit.Timer(call)
+    number, _ = timer.autorange()
+    seconds = min(timer.repeat(repeat=repeat, number=number)) / number
+
+    tracemalloc.start()
+    try:
+        call()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": seconds, "peak_bytes": peak}
+
+
+def run(cases: List[Case], repeat: int) -> Dict:
+    results = {}
+    print(f"{'case':<34} {'time':>12} {'peak alloc':>12}")
+    for name, size, call in cases:
+        key = f"{name}[{size}]"
+        results[key] = measure(call, repeat)
+        print(f"{key:<34} {_fmt_seconds(results[key]['seconds']):>12} {_fmt_bytes(results[key]['peak_bytes']):>12}")
+    return {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            # Token counting is exact with tiktoken and chars/4 without it
+            "tiktoken": token_budget._get_encoding() is not None,
+        },
+        "results": results,
+    }
+
+
+def compare(old: Dict, new: Dict, threshold: float) -> int:
+    """Print per-case ratios; returns how many cases regressed."""
+    if old.get("meta", {}).get("tiktoken") != new.get("meta", {}).get("tiktoken"):
+        print("warning: runs differ in tiktoken availability; build_system_prompt is not comparable")
+
+    regressions = 0
+    print(f"{'case':<34} {'time':>9} {'alloc':>9}")
+    for key, after in new["results"].items():
+        before = old["results"].get(key)
+        if before is None:
+            print(f"{key:<34} {'new':>9}")
+            continue
+        time_ratio = after["seconds"] / before["seconds"] if before["seconds"] else 1.0
+        alloc_ratio = after["peak_bytes"] / before["peak_bytes"] if before["peak_bytes"] else 1.0
+        slower = time_ratio > 1 + threshold and after["seconds"] - before["seconds"] > NOISE_FLOOR_SECONDS
+        bigger = alloc_ratio > 1 + threshold and after["peak_bytes"] - before["peak_bytes"] > 1024
+        flag = "  REGRESSION" if slower or bigger else ""
+        regressions += bool(flag)
+        print(f"{key:<34} {time_ratio:>8.2f}x {alloc_ratio:>8.2f}x{flag}")
+    for key in old["results"].keys() - new["results"].keys():
+        print(f"{key:<34} {'missing':>9}")
+
+    print(f"\n{regressions} regression(s) over {threshold:.0%}")
+    return regressions
+
+
+def _fmt_seconds(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+
+def _fmt_bytes(size: int) -> str:
+    for unit, scale in (("MB", 1 << 20), ("KB", 1 << 10)):
+        if size >= scale:
+            return f"{size / scale:.1f} {unit}"
+    return f"{size} B"
+
+
+def _load(path: str) -> Dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help=f"only sizes up to {QUICK_LIMIT} features / 1 MB")
+    parser.add_argument("--only", default="", help="run cases whose name contains this")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="compare this run against a saved JSON run")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two saved runs and exit")
+    parser.add_argument("--threshold", type=float, default=0.2, help="ratio above 1 that counts as a regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(_load(args.compare[0]), _load(args.compare[1]), args.threshold) else 0)
+
+    report = run(build_cases(args.quick, args.only), args.repeat)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        print()
+        sys.exit(1 if compare(_load(args.baseline), report, args.threshold) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark: agent -> UI packet codecs per UI command type.
+
+Usage: python benchmarks/wire_codec.py [--seconds S]
+
+Compares the old `json.dumps(asdict(...))` serializer with the JSON and
+MessagePack codecs in wire_codec.py: encode and decode throughput and bytes
+on the wire. MessagePack rows are skipped when msgpack isn't installed.
+"""
+
+import argparse
+import json
+import sys
+import timeit
+from dataclasses import asdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from commands import (  # noqa: E402
+    ExpandSectionCommand,
+    HighlightCodeCommand,
+    NavigateCommand,
+    OpenSidebarCommand,
+    ShowConnectionsCommand,
+    ShowFileCommand,
+)
+from wire_codec import JSON, MSGPACK  # noqa: E402
+
+SAMPLES = [
+    NavigateCommand(to="next"),
+    ShowConnectionsCommand(file="src/server/api/context-provider.ts"),
+    ExpandSectionCommand(file="src/server/api/context-provider.ts", section="gotchas"),
+    HighlightCodeCommand(file="src/server/api/context-provider.ts", lines=(12, 48)),
+    OpenSidebarCommand(),
+    ShowFileCommand(
+        file="src/server/api/context-provider.ts",
+        title="context-provider.ts",
+        explanation="Let's start by exploring src/server/api/context-provider.ts.",
+        startLine=1, endLine=50, featureName="Onboarding Context",
+    ),
+]
+
+
+class LegacyCodec:
+    name = "asdict+json"
+
+    def encode_command(self, command):
+        return json.dumps(asdict(command)).encode("utf-8")
+
+    def decode(self, payload):
+        return json.loads(payload.decode("utf-8"))
+
+
+def ops_per_second(fn, seconds: float) -> float:
+    timer = timeit.Timer(fn)
+    number, elapsed = timer.autorange()
+    runs = max(1, int(seconds / elapsed)) if elapsed else 1
+    best = min(timer.repeat(repeat=runs, number=number))
+    return number / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=1.0, help="rough time budget per measurement")
+    args = parser.parse_args()
+
+    codecs = [LegacyCodec(), JSON] + ([MSGPACK] if MSGPACK else [])
+    if MSGPACK is None:
+        print("msgpack not installed; showing JSON only\n")
+
+    print(f"{'command':<16} {'codec':<12} {'bytes':>6} {'encode/s':>11} {'decode/s':>11}")
+    for command in SAMPLES:
+        for codec in codecs:
+            payload = codec.encode_command(command)
+            encode = ops_per_second(lambda: codec.encode_command(command), args.seconds / 4)
+            decode = ops_per_second(lambda: codec.decode(payload), args.seconds / 4)
+            print(f"{command.type:<16} {codec.name:<12} {len(payload):>6} {encode:>11,.0f} {decode:>11,.0f}")
+
+
+if __name__ == "__main__":
+    main()
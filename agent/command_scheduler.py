@@ -0,0 +1,113 @@
+"""
+Outbound UI command scheduling for one room.
+"""
+
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional
+
+from commands import EPHEMERAL_COMMANDS, SUPERSEDE_KEYS, UICommand
+from structured_log import get_logger
+
+# LiveKit drops lossy packets above the MTU and reliable ones above ~15 KiB
+LOSSY_PACKET_BYTES = 1300
+RELIABLE_PACKET_BYTES = 14_000
+
+
+class CommandScheduler:
+    """Batches UI commands per frame window and sends each class on its channel.
+
+    The first command of a window arms a flush `frame_window` seconds later;
+    everything issued until then goes out together, one packet per channel
+    (a `batch` packet when there is more than one command and the UI
+    understands batches). Within a window, a newer state update
+    (SUPERSEDE_KEYS) for the same target replaces the older one, so a stale
+    highlight is never delivered; other commands are all sent, in order.
+    Ephemeral commands (EPHEMERAL_COMMANDS) go over the lossy channel, state changes over the
+    reliable one, which is flushed first so the file a highlight refers to
+    is already shown.
+    """
+
+    def __init__(
+        self,
+        encode: Callable[[List[UICommand]], bytes],
+        publish: Callable[[bytes, bool], Awaitable[None]],
+        frame_window: float = 0.016,
+        can_batch: Callable[[], bool] = lambda: True,
+    ):
+        self.encode = encode  # one command or a batch -> packet
+        self.publish = publish  # (packet, reliable)
+        self.can_batch = can_batch  # False: one packet per command (older UIs)
+        self.frame_window = frame_window
+        self._pending: Dict[Hashable, UICommand] = {}  # insertion-ordered
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._sending: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()  # keeps packets in issue order across flushes
+        self.log = get_logger("ui-commands")
+        self.commands = 0
+        self.packets = 0
+        self.superseded = 0
+        self.failed = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "commands": self.commands,
+            "packets": self.packets,
+            "superseded": self.superseded,
+            "failed": self.failed,
+        }
+
+    def send(self, command: UICommand):
+        """Queue a command for the current frame; never blocks."""
+        fields = SUPERSEDE_KEYS.get(command.type)
+        if fields is None:
+            key: Hashable = self.commands  # unique: never replaced
+        else:
+            key = (command.type,) + tuple(getattr(command, name) for name in fields)
+        if self._pending.pop(key, None) is not None:
+            self.superseded += 1
+        self._pending[key] = command
+        self.commands += 1
+        if self._timer is None:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(self.frame_window, self._flush)
+
+    async def close(self):
+        """Send whatever is still queued and wait for it."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._flush()
+        if self._sending is not None:
+            await asyncio.gather(self._sending, return_exceptions=True)
+        self.log.info("UI commands sent", **self.stats())
+
+    def _flush(self):
+        self._timer = None
+        batch = list(self._pending.values())
+        self._pending.clear()
+        if batch:
+            self._sending = asyncio.get_running_loop().create_task(self._send(batch))
+
+    async def _send(self, batch: List[UICommand]):
+        reliable = [command for command in batch if command.type not in EPHEMERAL_COMMANDS]
+        lossy = [command for command in batch if command.type in EPHEMERAL_COMMANDS]
+        async with self._lock:
+            for commands, is_reliable, limit in ((reliable, True, RELIABLE_PACKET_BYTES), (lossy, False, LOSSY_PACKET_BYTES)):
+                if not commands:
+                    continue
+                for packet in self._packets(commands, limit):
+                    try:
+                        await self.publish(packet, is_reliable)
+                        self.packets += 1
+                    except Exception as e:
+                        self.failed += 1
+                        self.log.error("Error sending UI commands", reliable=is_reliable, error=str(e))
+
+    def _packets(self, commands: List[UICommand], limit: int) -> List[bytes]:
+        """Encode commands, splitting the batch until each packet fits."""
+        if not self.can_batch():
+            return [self.encode([command]) for command in commands]
+        packet = self.encode(commands)
+        if len(packet) <= limit or len(commands) == 1:
+            return [packet]
+        middle = len(commands) // 2
+        return self._packets(commands[:middle], limit) + self._packets(commands[middle:], limit)
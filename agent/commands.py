@@ -3,7 +3,7 @@ UI command definitions for agent-to-frontend communication.
 """
 
 from typing import Literal, Optional, List
-from dataclasses import dataclass, asdict, field
+from dataclasses import dataclass, field, fields
 import json
 
 
@@ -71,7 +71,43 @@ UICommand = (
 )
 
 
+# Wire order of command types and their fields. The index of a type here is
+# its tag in the binary codec (see wire_codec.py), so append only; changing
+# an existing entry needs a new codec version.
+COMMAND_TYPES = (
+    NavigateCommand,
+    ShowConnectionsCommand,
+    ExpandSectionCommand,
+    HighlightCodeCommand,
+    OpenSidebarCommand,
+    ShowFileCommand,
+)
+
+# Visual hints that are harmless to lose or to see replaced by a newer one;
+# these go over the lossy data channel. Everything else changes UI state.
+EPHEMERAL_COMMANDS = frozenset({"highlightCode", "expandSection", "showConnections"})
+
+# Commands that set a piece of UI state, keyed by the fields naming that piece;
+# a newer one with the same key makes the older one redundant. Anything not
+# listed (navigate: "next" twice is two steps) is always delivered.
+SUPERSEDE_KEYS = {
+    "showFile": ("file",),
+    "highlightCode": ("file",),
+    "showConnections": ("file",),
+    "expandSection": ("file", "section"),
+    "openSidebar": (),
+}
+
+# class -> field names in declaration order ("type" included, last)
+COMMAND_FIELDS = {cls: tuple(f.name for f in fields(cls)) for cls in COMMAND_TYPES}
+
+
+def command_to_dict(command: UICommand) -> dict:
+    """Shallow field dict, same shape as asdict without the deep copy."""
+    return {name: getattr(command, name) for name in COMMAND_FIELDS[type(command)]}
+
+
 def serialize_command(command: UICommand) -> bytes:
     """Serialize a command to JSON bytes for data channel."""
-    return json.dumps(asdict(command)).encode("utf-8")
+    return json.dumps(command_to_dict(command)).encode("utf-8")
 
@@ -0,0 +1,63 @@
+"""
+In-session cache of file contents received from the local server.
+"""
+
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class FileContentCache:
+    """Byte-bounded LRU of `file-content` payloads keyed by path."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._entries: "OrderedDict[str, tuple[Dict[str, Any], int]]" = OrderedDict()
+
+    def __contains__(self, path: str) -> bool:
+        return path in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, path: str) -> Optional[Dict[str, Any]]:
+        """Return the cached payload for path and mark it recently used."""
+        entry = self._entries.get(path)
+        if entry is None:
+            return None
+        self._entries.move_to_end(path)
+        return entry[0]
+
+    def put(self, path: str, data: Dict[str, Any]):
+        """Cache a payload, evicting least recently used entries over budget."""
+        size = _payload_size(data)
+        if size > self.max_bytes:
+            # Never let one huge file flush the whole journey
+            self.discard(path)
+            return
+
+        self.discard(path)
+        self._entries[path] = (data, size)
+        self.size_bytes += size
+
+        while self.size_bytes > self.max_bytes and self._entries:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.size_bytes -= evicted_size
+
+    def discard(self, path: str):
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self.size_bytes -= entry[1]
+
+    def clear(self):
+        self._entries.clear()
+        self.size_bytes = 0
+
+
+def _payload_size(data: Dict[str, Any]) -> int:
+    size = 0
+    for key in ("content", "knowledge"):
+        value = data.get(key)
+        if isinstance(value, str):
+            size += len(value.encode("utf-8"))
+    return size
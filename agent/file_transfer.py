@@ -0,0 +1,82 @@
+"""
+Wire helpers for file-content transfer over the data channel.
+
+Large files arrive as several `file-content` packets carrying `seq`/`chunks`
+and a slice of `data`; compressed payloads are base64 in `data` with an
+`encoding` of "zlib" or "zstd".
+"""
+
+import base64
+import time
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # optional: only used when the server offers zstd
+    zstandard = None
+
+
+IDENTITY = "identity"
+
+# Preferred first; zstd only if the library is installed here
+SUPPORTED_ENCODINGS: List[str] = (["zstd"] if zstandard else []) + ["zlib", IDENTITY]
+
+
+def negotiate_encoding(capabilities: Iterable[str]) -> str:
+    """Pick the best content encoding both sides support."""
+    offered = set(capabilities)
+    for encoding in SUPPORTED_ENCODINGS:
+        if encoding in offered:
+            return encoding
+    return IDENTITY
+
+
+def decode_content(encoding: Optional[str], data: str) -> str:
+    """Turn a `data` field back into file text."""
+    if not encoding or encoding == IDENTITY:
+        return data
+    raw = base64.b64decode(data)
+    if encoding == "zlib":
+        return zlib.decompress(raw).decode("utf-8")
+    if encoding == "zstd" and zstandard:
+        return zstandard.ZstdDecompressor().decompressobj().decompress(raw).decode("utf-8")
+    raise ValueError(f"Unsupported content encoding: {encoding}")
+
+
+class ChunkAssembler:
+    """Reassembles chunked file-content packets keyed by requestId and path."""
+
+    def __init__(self, max_age: float = 30.0):
+        self.max_age = max_age
+        # (requestId, path) -> (first seen, total chunks, seq -> packet)
+        self._partial: Dict[Tuple[Optional[str], str], Tuple[float, int, Dict[int, Dict[str, Any]]]] = {}
+
+    def add(self, packet: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Add one chunk; returns the complete payload once every chunk arrived."""
+        self._drop_stale()
+
+        key = (packet.get("requestId"), packet.get("path"))
+        total = int(packet.get("chunks", 1))
+        first_seen, _, chunks = self._partial.get(key, (time.monotonic(), total, {}))
+        chunks[int(packet.get("seq", 0))] = packet
+        if any(seq not in chunks for seq in range(total)):
+            self._partial[key] = (first_seen, total, chunks)
+            return None
+
+        self._partial.pop(key, None)
+        ordered = [chunks[seq] for seq in range(total)]
+        # Metadata (knowledge, totalLines, range) rides on the first chunk
+        payload = {k: v for k, v in ordered[0].items() if k not in ("seq", "chunks", "data")}
+        payload["data"] = "".join(chunk.get("data", "") for chunk in ordered)
+        return payload
+
+    def discard(self, request_id: Optional[str]):
+        """Forget partial transfers for a request that expired."""
+        for key in [key for key in self._partial if key[0] == request_id]:
+            del self._partial[key]
+
+    def _drop_stale(self):
+        now = time.monotonic()
+        for key in [key for key, (seen, _, _) in self._partial.items() if now - seen > self.max_age]:
+            del self._partial[key]
@@ -0,0 +1,158 @@
+"""
+Process-wide cache of classified navigation intents for short utterances.
+"""
+
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Optional, Set
+
+_PUNCTUATION = re.compile(r"[^\w\s']")
+_WHITESPACE = re.compile(r"\s+")
+
+# Words that flip or hold back what a phrase asks for; near-duplicates must agree on them
+_POLARITY = frozenset(
+    "not no never wait stop hold dont cant wont isnt arent didnt doesnt havent shouldnt wouldnt couldnt aint".split()
+)
+
+# Words that don't change an utterance's intent
+_FILLER = frozenset(
+    "i i'm im am a an the to this that it is are we us me my you ok okay so um uh like just please now then let's lets".split()
+)
+
+
+def normalize_utterance(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace."""
+    text = _PUNCTUATION.sub(" ", text.lower())
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def _ngrams(text: str, n: int = 3) -> Set[str]:
+    padded = f" {text} "
+    if len(padded) <= n:
+        return {padded}
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+def _polarity(words) -> FrozenSet[str]:
+    return frozenset(
+        "n't" if word.endswith("n't") else word
+        for word in words
+        if word in _POLARITY or word.endswith("n't")
+    )
+
+
+def _content(words) -> FrozenSet[str]:
+    return frozenset(word for word in words if word not in _FILLER and word not in _POLARITY and not word.endswith("n't"))
+
+
+class IntentCache:
+    """TTL + LRU cache of utterance -> intent (NEXT / BACK / OTHER).
+
+    Lookups try the normalized utterance first, then near-duplicates by
+    character trigram similarity (Dice coefficient), found through an
+    inverted trigram index so only phrases sharing a trigram are compared.
+    Trigrams can't see negation ("I'm not done" is close to "I'm done"), so a
+    near-duplicate only counts if it has the same negation words, and for
+    NEXT / BACK also the same content words; otherwise the utterance goes to
+    the classifier.
+    """
+
+    def __init__(self, max_entries: int = 2048, ttl: float = 3600.0, similarity: float = 0.85):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self._entries: "OrderedDict[str, Tuple[str, float, Set[str]]]" = OrderedDict()
+        self._by_ngram: Dict[str, Set[str]] = {}
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.near_hits + self.misses
+        return (self.hits + self.near_hits) / lookups if lookups else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 3),
+        }
+
+    def get(self, utterance: str) -> Optional[str]:
+        """Cached intent for utterance or a near-duplicate of it, else None."""
+        key = normalize_utterance(utterance)
+        now = time.monotonic()
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self._remove(key)
+
+        match = self._nearest(key, now)
+        if match is not None and not self._same_meaning(key, match):
+            match = None
+        if match is not None:
+            self._entries.move_to_end(match)
+            self.near_hits += 1
+            return self._entries[match][0]
+
+        self.misses += 1
+        return None
+
+    def put(self, utterance: str, intent: str):
+        key = normalize_utterance(utterance)
+        if not key:
+            return
+        self._remove(key)
+
+        grams = _ngrams(key)
+        self._entries[key] = (intent, time.monotonic() + self.ttl, grams)
+        for gram in grams:
+            self._by_ngram.setdefault(gram, set()).add(key)
+
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _nearest(self, key: str, now: float) -> Optional[str]:
+        grams = _ngrams(key)
+        shared: Dict[str, int] = {}
+        for gram in grams:
+            for candidate in self._by_ngram.get(gram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+
+        best, best_score = None, self.similarity
+        for candidate, overlap in shared.items():
+            intent, expires_at, candidate_grams = self._entries[candidate]
+            if expires_at <= now:
+                continue
+            score = 2 * overlap / (len(grams) + len(candidate_grams))
+            if score >= best_score:
+                best, best_score = candidate, score
+        return best
+
+    def _same_meaning(self, key: str, match: str) -> bool:
+        words, match_words = key.split(), match.split()
+        if _polarity(words) != _polarity(match_words):
+            return False
+        return self._entries[match][0] == "OTHER" or _content(words) == _content(match_words)
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for gram in entry[2]:
+            keys = self._by_ngram.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_ngram[gram]
@@ -2,43 +2,99 @@
 Utilities for formatting knowledge context.
 """
 
-from typing import Dict, List, Optional
+import bisect
+from typing import Dict, List, Optional, Set, Tuple
 
 
 def format_features_summary(features: List[Dict]) -> str:
     """Format features into a concise summary for the agent."""
-    if not features:
-        return "No features documented yet."
-    
-    summary_parts = []
-    
-    # Group by category
-    by_category: Dict[str, List[Dict]] = {}
-    for feature in features:
-        category = feature.get("category", "Other")
-        if category not in by_category:
-            by_category[category] = []
-        by_category[category].append(feature)
-    
-    for category, cat_features in by_category.items():
-        summary_parts.append(f"\n### {category}")
-        for f in cat_features:
-            name = f.get("name", "Unknown")
-            desc = f.get("description", "")
-            user_flows = f.get("userFlows", [])
-            files = f.get("files", [])
-            
-            summary_parts.append(f"- **{name}**")
-            if desc:
-                summary_parts.append(f"  {desc}")
-            if user_flows:
-                summary_parts.append(f"  User can: {', '.join(user_flows[:3])}")
-            if files:
-                summary_parts.append(f"  Files: {', '.join(files[:3])}")
-    
+    return FeaturesSummary(features).text
+
+
+def feature_key(feature: Dict) -> str:
+    """Identity of a feature in patches: its id, or its name when it has none."""
+    return str(feature.get("id") or feature.get("name", ""))
+
+
+def _category_block(category: str, cat_features: List[Dict]) -> str:
+    summary_parts = [f"\n### {category}"]
+    for f in cat_features:
+        name = f.get("name", "Unknown")
+        desc = f.get("description", "")
+        user_flows = f.get("userFlows", [])
+        files = f.get("files", [])
+        
+        summary_parts.append(f"- **{name}**")
+        if desc:
+            summary_parts.append(f"  {desc}")
+        if user_flows:
+            summary_parts.append(f"  User can: {', '.join(user_flows[:3])}")
+        if files:
+            summary_parts.append(f"  Files: {', '.join(files[:3])}")
     return "\n".join(summary_parts)
 
 
+class FeaturesSummary:
+    """The features summary, rendered per category.
+
+    Categories appear in the order of their first feature, each listing its
+    features in list order. `patch()` returns a new summary that re-renders
+    only the categories the patch touched and reuses the other blocks, so
+    the text always equals format_features_summary of the patched list.
+    Instances are never mutated (they may be shared between sessions).
+    """
+
+    def __init__(self, features: List[Dict], blocks: Optional[Dict[str, str]] = None):
+        self.features = features
+        
+        # Group by category
+        by_category: Dict[str, List[Dict]] = {}
+        for feature in features:
+            by_category.setdefault(feature.get("category", "Other"), []).append(feature)
+        
+        reusable = blocks or {}
+        self.blocks: Dict[str, str] = {}
+        for category, cat_features in by_category.items():
+            block = reusable.get(category)
+            self.blocks[category] = block if block is not None else _category_block(category, cat_features)
+        self.text = "\n".join(self.blocks.values()) if features else "No features documented yet."
+
+    def patch(
+        self,
+        add: Optional[List[Dict]] = None,
+        update: Optional[List[Dict]] = None,
+        remove: Optional[List[str]] = None,
+    ) -> "FeaturesSummary":
+        """Apply add / update / remove (by feature_key) and return the new summary.
+
+        Adding a feature that already exists updates it; updating one that
+        doesn't exist adds it at the end.
+        """
+        features = list(self.features)
+        positions = {feature_key(f): i for i, f in enumerate(features)}
+        dirty = set()
+
+        for feature in (add or []) + (update or []):
+            key = feature_key(feature)
+            dirty.add(feature.get("category", "Other"))
+            index = positions.get(key)
+            if index is None:
+                positions[key] = len(features)
+                features.append(feature)
+            else:
+                dirty.add(features[index].get("category", "Other"))
+                features[index] = feature
+
+        removed = {key for key in (remove or []) if key in positions}
+        if removed:
+            for key in removed:
+                dirty.add(features[positions[key]].get("category", "Other"))
+            features = [f for f in features if feature_key(f) not in removed]
+
+        blocks = {category: block for category, block in self.blocks.items() if category not in dirty}
+        return FeaturesSummary(features, blocks)
+
+
 def get_feature_for_file(features: List[Dict], file_path: str) -> Optional[Dict]:
     """Find which feature a file belongs to."""
     for feature in features:
@@ -48,6 +104,166 @@ def get_feature_for_file(features: List[Dict], file_path: str) -> Optional[Dict]
     return None
 
 
+class _SuffixNode:
+    """One level of the reversed-path trie (one path segment deep)."""
+
+    __slots__ = ("children", "tails")
+
+    def __init__(self):
+        self.children: Dict[str, "_SuffixNode"] = {}
+        # Leading segment of a feature file -> ordinals of the features
+        # listing it, lowest first. Matched against the *end* of the next
+        # path segment, so partial segments ("oute.ts" vs "route.ts") behave
+        # like str.endswith.
+        self.tails: Dict[str, List[int]] = {}
+
+    def copy(self) -> "_SuffixNode":
+        node = _SuffixNode()
+        node.children = dict(self.children)
+        node.tails = {lead: list(ordinals) for lead, ordinals in self.tails.items()}
+        return node
+
+
+class FeatureIndex:
+    """Precomputed file -> feature lookup built once per features payload.
+
+    Answers exactly what get_feature_for_file would: the first feature (in
+    list order) whose files contain the path or a suffix of it. A lookup
+    walks a reversed-segment trie, so the cost depends on the path length,
+    not on the number of features; results are memoised per path.
+
+    Features are numbered by ordinals that follow list order. A patch keeps
+    the ordinals of existing features and appends new ones, so `patched()`
+    only has to touch the trie paths of the features it changes. It copies
+    those nodes and shares the rest, leaving this index unchanged, since
+    indexes may be shared between sessions.
+    """
+
+    def __init__(self, features: Optional[List[Dict]] = None):
+        self.features = features or []
+        self._root = _SuffixNode()
+        self._by_ordinal: Dict[int, Dict] = {}
+        self._ordinals: Dict[str, List[int]] = {}  # feature_key -> ordinals
+        self._next = 0
+        # Resolved path -> feature ordinal (-1 for no match). Filled on first
+        # lookup since an earlier feature may claim a listed path through a
+        # shorter suffix; repeat lookups of journey files are one dict hit.
+        self._exact: Dict[str, int] = {}
+        self._shared = False  # patching: nodes may belong to another index
+        self._fresh: Set[int] = set()  # ids of nodes this patch already copied
+
+        for feature in self.features:
+            self._add(feature)
+
+    def patched(
+        self,
+        features: List[Dict],
+        add: Optional[List[Dict]] = None,
+        update: Optional[List[Dict]] = None,
+        remove: Optional[List[str]] = None,
+    ) -> "FeatureIndex":
+        """Index of `features`, the result of FeaturesSummary.patch() with the same ops."""
+        index = FeatureIndex.__new__(FeatureIndex)
+        index.features = features
+        index._root = self._root
+        index._by_ordinal = dict(self._by_ordinal)
+        index._ordinals = dict(self._ordinals)  # lists are replaced, never changed in place
+        index._next = self._next
+        index._exact = {}
+        index._shared = True
+        index._fresh = set()
+
+        for feature in (add or []) + (update or []):
+            ordinals = index._ordinals.get(feature_key(feature))
+            if ordinals:
+                # Updated in place: same position in the list, same ordinal
+                ordinal = ordinals[-1]
+                index._unindex(index._by_ordinal[ordinal], ordinal)
+                index._by_ordinal[ordinal] = feature
+                index._index(feature, ordinal)
+            else:
+                index._add(feature)
+        for key in remove or []:
+            for ordinal in index._ordinals.pop(key, ()):
+                index._unindex(index._by_ordinal.pop(ordinal), ordinal)
+
+        index._shared = False
+        index._fresh = set()
+        return index
+
+    def _add(self, feature: Dict):
+        ordinal = self._next
+        self._next += 1
+        self._by_ordinal[ordinal] = feature
+        key = feature_key(feature)
+        self._ordinals[key] = self._ordinals.get(key, []) + [ordinal]
+        self._index(feature, ordinal)
+
+    def _index(self, feature: Dict, ordinal: int):
+        for file_path in feature.get("files") or []:
+            node, lead = self._node(file_path)
+            ordinals = node.tails.setdefault(lead, [])
+            if ordinal not in ordinals:
+                bisect.insort(ordinals, ordinal)
+
+    def _unindex(self, feature: Dict, ordinal: int):
+        for file_path in feature.get("files") or []:
+            node, lead = self._node(file_path)
+            ordinals = node.tails.get(lead)
+            if ordinals and ordinal in ordinals:
+                ordinals.remove(ordinal)
+                if not ordinals:
+                    del node.tails[lead]
+
+    def _node(self, file_path: str) -> Tuple[_SuffixNode, str]:
+        """Writable trie node for a feature file, and its leading segment.
+
+        While patching, nodes shared with the index patched from are copied
+        on the way down (once per patch).
+        """
+        segments = file_path.split("/")
+        self._root = node = self._writable(self._root)
+        for segment in reversed(segments[1:]):
+            child = node.children.get(segment)
+            if child is None:
+                child = _SuffixNode()
+                if self._shared:
+                    self._fresh.add(id(child))
+            else:
+                child = self._writable(child)
+            node.children[segment] = child
+            node = child
+        return node, segments[0]
+
+    def _writable(self, node: _SuffixNode) -> _SuffixNode:
+        if not self._shared or id(node) in self._fresh:
+            return node
+        copy = node.copy()
+        self._fresh.add(id(copy))
+        return copy
+
+    def _walk(self, file_path: str) -> int:
+        best = -1
+        node = self._root
+        for segment in reversed(file_path.split("/")):
+            if node.tails:
+                for start in range(len(segment) + 1):
+                    ordinals = node.tails.get(segment[start:])
+                    if ordinals and (best < 0 or ordinals[0] < best):
+                        best = ordinals[0]
+            node = node.children.get(segment)
+            if node is None:
+                break
+        return best
+
+    def lookup(self, file_path: str) -> Optional[Dict]:
+        """Find which feature a file belongs to."""
+        ordinal = self._exact.get(file_path)
+        if ordinal is None:
+            ordinal = self._exact[file_path] = self._walk(file_path)
+        return self._by_ordinal[ordinal] if ordinal >= 0 else None
+
+
 def format_feature_context(feature: Dict) -> str:
     """Format a feature into detailed context for the agent."""
     if not feature:
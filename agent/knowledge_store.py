@@ -0,0 +1,185 @@
+"""
+Process-wide, content-addressed store for onboarding context blobs.
+
+Rooms on one worker usually onboard onto the same repository and receive
+byte-identical features and knowledge files. Interning them by content hash
+keeps one copy per worker process (plus the derived features summary and
+FeatureIndex, built once) instead of one per session.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Set
+
+import settings
+from knowledge_loader import FeatureIndex, FeaturesSummary
+
+
+class SharedFeatures:
+    """A feature list with everything derived from it."""
+
+    __slots__ = ("features", "summary", "index", "digest", "base_digest", "changed", "removed", "_rendered")
+
+    def __init__(
+        self,
+        features: List[Dict],
+        digest: str,
+        rendered: Optional[FeaturesSummary] = None,
+        index: Optional[FeatureIndex] = None,
+    ):
+        self._rendered = rendered or FeaturesSummary(features)
+        self.features = features
+        self.summary = self._rendered.text
+        self.index = index or FeatureIndex(features)
+        self.digest = digest
+        # Set when this is a patch result: what it changed relative to base_digest
+        self.base_digest: Optional[str] = None
+        self.changed: List[Dict] = []
+        self.removed: List[str] = []
+
+    def patched(self, patch: Dict, digest: str) -> "SharedFeatures":
+        """New SharedFeatures with a features-patch applied; self is unchanged.
+
+        Only the summary blocks and index paths the patch touches are rebuilt.
+        """
+        add, update, remove = patch.get("add"), patch.get("update"), patch.get("remove")
+        rendered = self._rendered.patch(add, update, remove)
+        result = SharedFeatures(
+            rendered.features, digest, rendered, self.index.patched(rendered.features, add, update, remove)
+        )
+        result.base_digest = self.digest
+        result.changed = (add or []) + (update or [])
+        result.removed = list(remove or [])
+        return result
+
+
+class _Entry:
+    __slots__ = ("value", "size", "refs")
+
+    def __init__(self, value: Any, size: int):
+        self.value = value
+        self.size = size
+        self.refs = 0  # sessions holding it
+
+
+class KnowledgeStore:
+    """Interned blobs with per-session reference counts and an LRU byte budget.
+
+    Sessions intern what they receive and get back the shared object; each
+    (session, blob) pair counts as one reference, however often the session
+    interns it. Referenced blobs are never evicted (dropping them would not
+    free anything). Unreferenced ones stay cached for the next session until
+    the store exceeds `max_bytes`, least recently used first.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._entries: Dict[str, _Entry] = {}
+        self._idle: "OrderedDict[str, None]" = OrderedDict()  # unreferenced, oldest first
+        self._owners: Dict[str, Set[str]] = {}  # session -> digests it holds
+        self._lock = threading.Lock()  # thread job executors share the process
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.size_bytes,
+                "idle_entries": len(self._idle),
+                "sessions": len(self._owners),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def intern_text(self, owner: str, text: str) -> str:
+        """Shared copy of a knowledge file or doc."""
+        encoded = text.encode("utf-8")
+        return self._intern(owner, "text:" + _digest(encoded), len(encoded), lambda: text)
+
+    def intern_features(self, owner: str, features: List[Dict]) -> SharedFeatures:
+        """Shared feature list, summary and index."""
+        encoded = json.dumps(features, sort_keys=True, separators=(",", ":")).encode("utf-8")
+        digest = "features:" + _digest(encoded)
+        # Serialized size is a stand-in for the parsed objects plus the summary
+        return self._intern(owner, digest, 2 * len(encoded), lambda: SharedFeatures(features, digest))
+
+    def patch_features(self, owner: str, base: SharedFeatures, patch: Dict) -> SharedFeatures:
+        """Shared result of applying a features-patch to `base`.
+
+        Keyed by the base digest plus the patch, so sessions applying the
+        same patch to the same features share the result without hashing
+        the whole list again.
+        """
+        ops = {op: patch.get(op) or [] for op in ("add", "update", "remove")}
+        encoded = json.dumps(ops, sort_keys=True, separators=(",", ":")).encode("utf-8")
+        digest = "features:" + _digest(base.digest.encode("utf-8") + encoded)
+        with self._lock:
+            base_entry = self._entries.get(base.digest)
+        size = (base_entry.size if base_entry else 0) + 2 * len(encoded)
+        return self._intern(owner, digest, size, lambda: base.patched(ops, digest))
+
+    def release(self, owner: str, digest: str):
+        """Drop one session's reference to a blob (e.g. it was replaced)."""
+        with self._lock:
+            held = self._owners.get(owner)
+            if held is None or digest not in held:
+                return
+            held.discard(digest)
+            if not held:
+                del self._owners[owner]
+            self._unref(digest)
+            self._evict()
+
+    def release_session(self, owner: str):
+        """Drop every reference a finished session holds."""
+        with self._lock:
+            for digest in self._owners.pop(owner, set()):
+                self._unref(digest)
+            self._evict()
+
+    def _intern(self, owner: str, digest: str, size: int, build: Callable[[], Any]) -> Any:
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                self.misses += 1
+                entry = self._entries[digest] = _Entry(build(), size)
+                self.size_bytes += size
+            else:
+                self.hits += 1
+
+            held = self._owners.setdefault(owner, set())
+            if digest not in held:
+                held.add(digest)
+                entry.refs += 1
+                self._idle.pop(digest, None)
+            self._evict()
+            return entry.value
+
+    def _unref(self, digest: str):
+        entry = self._entries[digest]
+        entry.refs -= 1
+        if entry.refs == 0:
+            self._idle[digest] = None
+
+    def _evict(self):
+        while self.size_bytes > self.max_bytes and self._idle:
+            digest, _ = self._idle.popitem(last=False)
+            self.size_bytes -= self._entries.pop(digest).size
+            self.evictions += 1
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+# Shared by every session in this worker process
+store = KnowledgeStore(settings.KNOWLEDGE_STORE_BYTES)
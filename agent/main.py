@@ -5,13 +5,14 @@ Handles voice conversations with users during codebase onboarding.
 
 import asyncio
 import os
-import json
+import time
 import uuid
 from pathlib import Path
-from typing import Dict, Optional, Any
+from typing import Any, AsyncIterable, Callable, Dict, List, Optional
 from livekit.agents import (
     AutoSubscribe,
     JobContext,
+    JobProcess,
     WorkerOptions,
     cli,
     llm,
@@ -20,104 +21,367 @@ from livekit.agents import (
 from livekit.agents.voice import Agent as VoiceAgent, AgentSession
 import livekit.plugins.openai as openai
 import livekit.plugins.silero as silero
-from knowledge_loader import (
-    format_features_summary,
-    get_feature_for_file,
+from knowledge_loader import FeatureIndex, feature_key
+from knowledge_store import store as knowledge_store
+from prompts import PromptBuilder, build_greeting_prompt, build_transition_prompt
+from command_scheduler import CommandScheduler
+from commands import NavigateCommand, ShowFileCommand
+from file_cache import FileContentCache
+from file_transfer import IDENTITY, ChunkAssembler, decode_content, negotiate_encoding
+from intent_cache import IntentCache
+from navigation import NavigationQueue, NavState
+from outline import Outline, build_outline, can_outline
+from retrieval import RetrievalIndex, feature_snippet, format_snippets, knowledge_snippets
+from shared_clients import get_openai_client
+from speculation import Speculation
+from speech_normalizer import normalize_speech
+from task_supervisor import TaskSupervisor
+from token_budget import count_tokens
+from tts_cache import CachedTTS, get_audio_cache
+from wire_codec import JSON, decode_packet, negotiate_codec
+from worker_load import LoadProbe, admit, worker_load
+import settings
+from metrics import registry as metrics
+from structured_log import get_logger
+
+
+log = get_logger("worker")
+
+# Shared by every session on this worker: the same short phrases come up everywhere
+intent_cache = IntentCache(
+    max_entries=settings.INTENT_CACHE_SIZE,
+    ttl=settings.INTENT_CACHE_TTL_SECONDS,
 )
-from prompts import build_system_prompt, build_greeting_prompt, build_transition_prompt
-from commands import NavigateCommand, ShowFileCommand, serialize_command
+
+
+# Pieces of the initial push, in the order the local server sends them
+CONTEXT_STAGES = ("session", "features", "file")
 
 
 class ContextStore:
     """In-memory store for onboarding context received from local server."""
     
-    def __init__(self):
+    def __init__(self, owner: str = ""):
+        self.owner = owner  # session id the shared knowledge is held for
         self.session = None
         self.features = []
         self.knowledge_files = {}  # path -> markdown
         self.current_file = None   # { path, content, knowledge, totalLines }
         self.features_summary = ""
+        self.features_version = 0  # bumped whenever features change
+        self.feature_index = FeatureIndex()
+        self.shared_features = None  # interned features, summary and index
+        self.revisions = {"features": 0, "knowledge": 0}  # server versions patches build on
         self.docs = {}
-        self._context_ready = asyncio.Event()
-        self._pending_requests = {} # requestId -> Future
+        self.file_cache = FileContentCache(settings.FILE_CACHE_BYTES)
+        self._outlines = {}  # path -> (content, Outline or None)
+        self._outline_jobs = {}  # path -> (content, Task) parsing it off the loop
+        self.on_outline: Optional[Callable[[str], None]] = None  # path whose outline is ready
+        self.retrieval = RetrievalIndex()  # knowledge files and features, for free-form questions
+        self.first_packet_at = None  # perf_counter() of the first context packet
+        self.log = get_logger("context")
+        self._stages = {stage: asyncio.Event() for stage in CONTEXT_STAGES}
+        self._context_ready = asyncio.Event()  # every stage has arrived
+        # (stage, first time); also ("features" / "knowledge", False) after a patch
+        self.on_stage: Optional[Callable[[str, bool], None]] = None
+        self.capabilities = set()  # protocol extensions the local server supports
+        self.transfer_encoding = IDENTITY  # negotiated from capabilities
+        self.codec = JSON  # agent -> UI packets, negotiated from capabilities
+        self._chunks = ChunkAssembler()
+        self._pending_requests = {} # requestId -> paths still awaiting a reply
+        self._inflight = {}  # path -> Future shared by every caller awaiting it
 
     def update_context(self, data: Dict[str, Any]):
         """Update store with initial context payload."""
+        if self.first_packet_at is None:
+            self.first_packet_at = time.perf_counter()
+
+        if data.get("capabilities"):
+            self.capabilities.update(data.get("capabilities", []))
+            self.transfer_encoding = negotiate_encoding(self.capabilities)
+            self.codec = negotiate_codec(self.capabilities)
+            self.log.info(
+                "Server capabilities",
+                capabilities=sorted(self.capabilities),
+                encoding=self.transfer_encoding,
+                codec=self.codec.name,
+            )
+
         if data.get("session"):
             self.session = data.get("session")
-            print(f"[ContextStore] Received session. User: {self.session.get('userName')}")
+            self.log.info("Received session", user=self.session.get("userName"))
+            self._mark_stage("session")
             
         if data.get("features"):
-            self.features = data.get("features", [])
-            self.features_summary = format_features_summary(self.features)
-            print(f"[ContextStore] Received features ({len(self.features)} items)")
+            self._set_features(knowledge_store.intern_features(self.owner, data.get("features", [])))
+            self.log.info("Received features", count=len(self.features))
+            self._mark_stage("features")
         
         if data.get("knowledgeFiles"):
-            self.knowledge_files.update(data.get("knowledgeFiles", {}))
-            print(f"[ContextStore] Received knowledge files")
+            # Replaced files stay referenced until the session ends
+            for path, markdown in data.get("knowledgeFiles", {}).items():
+                self.knowledge_files[path] = knowledge_store.intern_text(self.owner, markdown)
+                self.retrieval.stage(path, knowledge_snippets(path, markdown))
+            self.log.info("Received knowledge files")
+
+        # A full push resets the version later patches must build on
+        for kind in ("features", "knowledge"):
+            if isinstance(data.get(f"{kind}Version"), int):
+                self.revisions[kind] = data[f"{kind}Version"]
             
         if data.get("currentFile"):
             self.current_file = data.get("currentFile")
-            print(f"[ContextStore] Received current file: {self.current_file.get('path')}")
-        
-        # Mark as ready ONLY if we have the critical trinity: Session, Features, and First File
-        # This ensures the greeting is fully personalized.
-        if self.session and self.features and self.current_file:
-            if not self._context_ready.is_set():
-                self._context_ready.set()
-                print(f"[ContextStore] FULL CONTEXT READY. Firing ready event.")
+            self.log.info("Received current file", path=self.current_file.get("path"))
+            self.prepare_outline(self.current_file)
+            self._mark_stage("file")
 
     def update_file(self, data: Dict[str, Any]):
         """Update store with file content response."""
+        if "chunks" in data:
+            data = self._chunks.add(data)
+            if data is None:
+                return  # wait for the remaining chunks
+
+        if "data" in data:
+            try:
+                data["content"] = decode_content(data.pop("encoding", None), data.pop("data"))
+            except Exception as e:
+                self.log.error("Could not decode file content", path=data.get("path"), error=str(e))
+                return
+
         request_id = data.get("requestId")
-        if request_id in self._pending_requests:
-            future = self._pending_requests.pop(request_id)
-            if not future.done():
+        path = data.get("path")
+        if path and data.get("content") is not None:
+            self.file_cache.put(path, data)
+            # Parse now, while the file is usually still a prefetch
+            self.prepare_outline(data)
+
+        pending = self._pending_requests.get(request_id)
+        if pending is not None:
+            # A single-path request is answered even if the server normalised the path
+            if path not in pending and len(pending) == 1:
+                path = next(iter(pending))
+            pending.discard(path)
+            if not pending:
+                del self._pending_requests[request_id]
+            future = self._inflight.pop(path, None)
+            if future and not future.done():
                 future.set_result(data)
+        elif request_id:
+            # Reply to a request that already timed out; the cache has it
+            self.log.debug("Late file response", path=path)
         else:
             # Also handle spontaneous file updates (like the initial file push)
             self.current_file = data
-            print(f"[ContextStore] Initial file content received: {data.get('path')}")
-            
-            # If we were just waiting for this to be fully ready
-            if self.session and self.features and not self._context_ready.is_set():
-                self._context_ready.set()
-                print(f"[ContextStore] FULL CONTEXT READY (via file update). Firing ready event.")
+            self.log.info("Initial file content received", path=data.get("path"))
+            self._mark_stage("file")
+
+    def outline_for(self, path: Optional[str], content: Optional[str]) -> Optional[Outline]:
+        """Outline of a file's content once prepare_outline() has built it, else None."""
+        cached = self._outlines.get(path)
+        if cached is not None and content and cached[0] == content:
+            return cached[1]
+        return None
+
+    def prepare_outline(self, file_data: Dict[str, Any]):
+        """Start outlining a received file in a worker thread.
+
+        Files cut short by the line window or over OUTLINE_MAX_BYTES are not
+        outlined; the prompt shows their top instead.
+        """
+        path, content = file_data.get("path"), file_data.get("content")
+        if not settings.SOURCE_OUTLINES or not content or not can_outline(path):
+            return
+        if len(content) > settings.OUTLINE_MAX_BYTES or file_data.get("totalLines", 0) > content.count("\n") + 1:
+            return
+        cached = self._outlines.get(path) or self._outline_jobs.get(path)
+        if cached is not None and cached[0] == content:
+            return
+        task = asyncio.create_task(self._build_outline(path, content))
+        self._outline_jobs[path] = (content, task)
 
-    async def wait_for_context(self, timeout: float = 10.0):
-        """Wait for initial context push."""
+    async def _build_outline(self, path: str, content: str):
         try:
-            print(f"[ContextStore] Waiting for full context (Session+Features+File)...")
-            await asyncio.wait_for(self._context_ready.wait(), timeout)
+            with metrics.span("outline_build", session=self.owner):
+                outline = await asyncio.to_thread(build_outline, path, content)
+        except Exception as e:
+            self.log.warning("Could not outline file", path=path, error=str(e))
+            outline = None
+        finally:
+            job = self._outline_jobs.get(path)
+            if job is not None and job[0] is content:
+                del self._outline_jobs[path]
+        self._outlines[path] = (content, outline)
+        current = self.current_file.get("path") if self.current_file else None
+        # Keep outlines only for files the session still holds
+        if len(self._outlines) > len(self.file_cache) + 1:
+            for stale in [p for p in self._outlines if p not in self.file_cache and p not in (path, current)]:
+                del self._outlines[stale]
+        if outline is not None and path == current and self.on_outline is not None:
+            self.on_outline(path)
+
+    def apply_patch(self, data: Dict[str, Any]) -> bool:
+        """Apply a features-patch or knowledge-patch on top of the current version.
+
+        A patch carries `version` and `baseVersion` (the version it was
+        computed against). Patches at or below the current version are stale
+        and ignored; a baseVersion that doesn't match means an earlier patch
+        was missed, so it is rejected and the context waits for a full push.
+        """
+        kind = "features" if data.get("type") == "features-patch" else "knowledge"
+        current = self.revisions[kind]
+        version = data.get("version")
+        base = data.get("baseVersion", current)
+        if not isinstance(version, int) or version <= current:
+            self.log.debug("Ignoring stale patch", kind=kind, version=version, current=current)
+            return False
+        if base != current:
+            self.log.warning("Rejecting out-of-order patch", kind=kind, base=base, current=current)
+            return False
+
+        if kind == "features":
+            base_features = self.shared_features or knowledge_store.intern_features(self.owner, [])
+            self._set_features(knowledge_store.patch_features(self.owner, base_features, data))
+        else:
+            for path, markdown in {**(data.get("add") or {}), **(data.get("update") or {})}.items():
+                self.knowledge_files[path] = knowledge_store.intern_text(self.owner, markdown)
+                self.retrieval.stage(path, knowledge_snippets(path, markdown))
+            for path in data.get("remove") or []:
+                self.knowledge_files.pop(path, None)
+                self.retrieval.unstage(path)
+        self.revisions[kind] = version
+        self.log.info("Applied patch", kind=kind, version=version)
+
+        if kind == "features":
+            self._mark_stage("features")
+        elif self.on_stage is not None:
+            self.on_stage("knowledge", False)
+        return True
+
+    def _set_features(self, shared):
+        previous = self.shared_features
+        if previous is not None and previous is not shared:
+            knowledge_store.release(self.owner, previous.digest)
+        self.shared_features = shared
+        self.features = shared.features
+        self.features_summary = shared.summary
+        self.feature_index = shared.index
+        self.features_version += 1
+
+        if previous is not None and shared.base_digest == previous.digest:
+            # A patch of what we had: re-index only the features it touched
+            for feature in shared.changed:
+                key = feature_key(feature)
+                self.retrieval.stage(f"feature:{key}", [feature_snippet(key, feature)])
+            for key in shared.removed:
+                self.retrieval.unstage(f"feature:{key}")
+            return
+
+        # Only features whose text changed are re-indexed
+        keys = set()
+        for feature in shared.features:
+            key = feature_key(feature)
+            keys.add(f"feature:{key}")
+            self.retrieval.stage(f"feature:{key}", [feature_snippet(key, feature)])
+        for source in self.retrieval.sources():
+            if source.startswith("feature:") and source not in keys:
+                self.retrieval.unstage(source)
+
+    def _mark_stage(self, stage: str):
+        """Record that a piece of context arrived and tell the agent."""
+        event = self._stages[stage]
+        first = not event.is_set()
+        event.set()
+        if first and all(e.is_set() for e in self._stages.values()):
+            self._context_ready.set()
+            self.log.info("Full context ready")
+        if self.on_stage is not None:
+            self.on_stage(stage, first)
+
+    def missing_stages(self) -> List[str]:
+        return [stage for stage, event in self._stages.items() if not event.is_set()]
+
+    def claim_requests(self, paths: List[str], timeout: float):
+        """Get one shared future per path, registering those not already in flight.
+
+        Returns (request_id, new_paths, futures); only new_paths need to go over
+        the wire. Unanswered paths resolve to None after timeout.
+        """
+        loop = asyncio.get_running_loop()
+        request_id = str(uuid.uuid4())
+        new_paths = []
+        futures = {}
+        for path in dict.fromkeys(paths):
+            future = self._inflight.get(path)
+            if future is None:
+                future = loop.create_future()
+                self._inflight[path] = future
+                new_paths.append(path)
+            futures[path] = future
+
+        if new_paths:
+            self._pending_requests[request_id] = set(new_paths)
+            loop.call_later(timeout, self._expire_request, request_id)
+        return request_id, new_paths, futures
+
+    def _expire_request(self, request_id: str):
+        self._chunks.discard(request_id)
+        for path in self._pending_requests.pop(request_id, ()):
+            self.log.warning("Timeout requesting file", path=path)
+            future = self._inflight.pop(path, None)
+            if future and not future.done():
+                future.set_result(None)
+
+    async def wait_for_stage(self, stage: str = "full", timeout: float = 10.0) -> bool:
+        """Wait until one piece of context (or "full": all of them) has arrived."""
+        event = self._context_ready if stage == "full" else self._stages[stage]
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
             return True
         except asyncio.TimeoutError:
-            status = []
-            if not self.session: status.append("Session")
-            if not self.features: status.append("Features")
-            if not self.current_file: status.append("FirstFile")
-            print(f"[ContextStore] Timeout waiting for: {', '.join(status)}")
-            
-            # Fallback: if we at least have the session, we can proceed but it will be generic
-            if self.session:
-                print("[ContextStore] Proceeding with partial context (Session only)")
-                return True
             return False
 
 
 class OnboardingAgent(VoiceAgent):
     """Voice agent that guides users through codebase onboarding."""
 
-    def __init__(self):
+    def __init__(self, vad_model=None):
         self.room = None
-        self.context = ContextStore()
+        self.session_id = uuid.uuid4().hex[:8]  # metrics/log label; rooms can be reused
+        self.log = get_logger("agent", session=self.session_id)
+        self.context = ContextStore(owner=self.session_id)
+        self.context.log = self.context.log.bind(session=self.session_id)
+        self.context.on_stage = self._on_context_stage
+        self.context.on_outline = self._on_outline
+        self._greeted = False  # later context updates the instructions once set
         self.current_file_index = 0
-        self._last_nav_time = 0  # Cooldown for navigation
+        self.navigation = NavigationQueue(self._navigate_by)
+        self.tasks = TaskSupervisor(settings.MAX_SESSION_TASKS)
+        self.ui_commands = CommandScheduler(
+            encode=lambda commands: self.context.codec.encode_commands(commands),
+            publish=self._publish_ui_commands,
+            frame_window=settings.UI_BATCH_MS / 1000,
+            can_batch=lambda: "command-batch" in self.context.capabilities,
+        )
+        self._prompt_builder = PromptBuilder(settings.PROMPT_TOKEN_BUDGET)
+        self._speculative_builder = PromptBuilder(settings.PROMPT_TOKEN_BUDGET)  # for the next file's prompt
+        self.transitions = Speculation(self.tasks, "transition")  # the reply to the next "next"
+        self._pending_reply = None  # (kind, perf_counter()) until first audio
+        self._reply_kinds: Dict[str, str] = {}  # speech id -> kind, until its LLM metrics arrive
         
-        # Initialize STT, LLM, and TTS
-        stt_model = openai.STT(model="whisper-1")
-        llm_model = openai.LLM(model="gpt-4o-mini", temperature=0.7)
-        tts_model = openai.TTS(voice="nova", model="tts-1")
-        vad_model = silero.VAD.load()
+        # Initialize STT, LLM, and TTS on the worker's pooled HTTP client
+        client = get_openai_client()
+        stt_model = openai.STT(model="whisper-1", client=client)
+        llm_model = openai.LLM(model="gpt-4o-mini", temperature=0.7, client=client)
+        tts_model = openai.TTS(voice="nova", model="tts-1", client=client)
+        audio_cache = get_audio_cache()
+        if audio_cache is not None:
+            # Repeated lines are replayed from disk instead of synthesized again
+            tts_model = CachedTTS(tts_model, voice="nova", model="tts-1", cache=audio_cache)
+        self.cached_tts = tts_model if audio_cache is not None else None
+        if vad_model is None:
+            # Not prewarmed (e.g. run outside the worker); load it now
+            vad_model = silero.VAD.load()
 
         # Initialize the voice agent with passive instructions.
         super().__init__(
@@ -129,79 +393,126 @@ class OnboardingAgent(VoiceAgent):
             chat_ctx=llm.ChatContext(),
         )
 
+    def attach_room(self, room):
+        """Use room for data messages and label logs with its name."""
+        self.room = room
+        self.log = self.log.bind(room=room.name)
+        self.context.log = self.context.log.bind(room=room.name)
+        self.tasks.log = self.log.child("tasks")
+        self.navigation.log = self.log.child("navigation")
+        self.ui_commands.log = self.log.child("ui-commands")
+        self.transitions.log = self.log.child("speculation")
+
     async def _request_file_from_server(self, file_path: str) -> Optional[Dict[str, Any]]:
         """Request file content from the local server via data channel."""
-        if not self.room:
-            return None
-            
-        request_id = str(uuid.uuid4())
-        future = asyncio.get_event_loop().create_future()
-        self.context._pending_requests[request_id] = future
-        
-        payload = json.dumps({
-            "type": "request-file",
-            "requestId": request_id,
-            "path": file_path
-        }).encode("utf-8")
-        
-        print(f"[Agent] Requesting file content: {file_path}")
-        await self.room.local_participant.publish_data(
-            payload=payload,
-            reliable=True,
-            topic="agent-commands"
-        )
-        
+        results = await self._request_files_from_server([file_path])
+        return results.get(file_path)
+
+    async def _request_files_from_server(self, file_paths: List[str], timeout: float = 3.0) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Request several files in one round trip.
+
+        Paths already in flight are not requested again; every caller awaits
+        the same future. Missing or timed-out files map to None.
+        """
+        if not self.room or not file_paths:
+            return {}
+
+        with self._span("file_request"):
+            request_id, new_paths, futures = self.context.claim_requests(file_paths, timeout)
+            if new_paths:
+                await self._publish_file_request(request_id, new_paths)
+
+            # Shield the shared futures so one cancelled caller doesn't cancel them for everyone
+            results = await asyncio.gather(*(asyncio.shield(f) for f in futures.values()))
+        return dict(zip(futures.keys(), results))
+
+    async def _publish_file_request(self, request_id: str, paths: List[str]):
+        # Only pull what will end up in front of the LLM: the top of the file,
+        # or up to OUTLINE_MAX_LINES of it when it gets outlined
+        windowed = "line-range" in self.context.capabilities and settings.FILE_WINDOW_LINES > 0
+        groups = [paths] if paths else []
+        if windowed and settings.SOURCE_OUTLINES:
+            whole = [path for path in paths if can_outline(path)]
+            groups = [group for group in (whole, [path for path in paths if not can_outline(path)]) if group]
+
+        messages = []
+        for group in groups:
+            if len(group) > 1 and "request-files" in self.context.capabilities:
+                group_messages = [{"type": "request-files", "requestId": request_id, "paths": group}]
+            else:
+                # Older servers only understand single requests; send them back to back
+                group_messages = [
+                    {"type": "request-file", "requestId": request_id, "path": path}
+                    for path in group
+                ]
+            if windowed:
+                outlined = settings.SOURCE_OUTLINES and can_outline(group[0])
+                end_line = max(settings.OUTLINE_MAX_LINES, settings.FILE_WINDOW_LINES) if outlined else settings.FILE_WINDOW_LINES
+                for message in group_messages:
+                    message.update(startLine=1, endLine=end_line)
+            messages.extend(group_messages)
+
+        # Compressed if negotiated
+        if self.context.transfer_encoding != IDENTITY:
+            for message in messages:
+                message["encoding"] = self.context.transfer_encoding
+
+        self.log.debug("Requesting file content", paths=paths)
         try:
-            # Wait for response with timeout
-            return await asyncio.wait_for(future, timeout=3.0)
-        except asyncio.TimeoutError:
-            print(f"[Agent] Timeout requesting file: {file_path}")
-            if request_id in self.context._pending_requests:
-                del self.context._pending_requests[request_id]
-            return None
+            for message in messages:
+                await self.room.local_participant.publish_data(
+                    payload=self.context.codec.encode_message(message),
+                    reliable=True,
+                    topic="agent-commands"
+                )
+        except Exception as e:
+            # Futures resolve to None when the request expires
+            self.log.error("Error requesting files", paths=paths, error=str(e))
+
+    async def _get_file(self, file_path: str) -> Optional[Dict[str, Any]]:
+        """Get file content, serving from the session cache when possible."""
+        cached = self.context.file_cache.get(file_path)
+        if cached is not None:
+            self.log.debug("File cache hit", path=file_path)
+            return cached
+        return await self._request_file_from_server(file_path)
+
+    def _schedule_prefetch(self):
+        """Warm the cache with journey files around the current index in the background."""
+        if not self.context.session or settings.PREFETCH_DEPTH <= 0:
+            return
+
+        selected_files = self.context.session.get("selectedFiles", [])
+        # Nearest neighbours first, next before previous
+        paths = []
+        for distance in range(1, settings.PREFETCH_DEPTH + 1):
+            for index in (self.current_file_index + distance, self.current_file_index - distance):
+                if 0 <= index < len(selected_files):
+                    path = selected_files[index]
+                    if path not in self.context.file_cache and path not in paths:
+                        paths.append(path)
+        if not paths:
+            return
+
+        # A newer navigation makes the previous prefetch window stale
+        self.tasks.spawn(self._prefetch_files(paths), group="prefetch", supersede=True)
+
+    async def _prefetch_files(self, paths: List[str]):
+        paths = [path for path in paths if path not in self.context.file_cache]
+        if paths:
+            self.log.debug("Prefetching files", paths=paths)
+            # update_file stores the responses in the cache
+            await self._request_files_from_server(paths)
 
     def _update_system_instructions(self):
         """Update LLM instructions using current context."""
         if not self.context.session:
             return
 
-        selected_files = self.context.session.get("selectedFiles", [])
-        current_file_path = (
-            selected_files[self.current_file_index]
-            if self.current_file_index < len(selected_files)
-            else None
-        )
-        
-        # Use current file context from store if it matches
-        file_knowledge = None
-        current_feature = None
-        current_file_content = None
-        
-        if current_file_path:
-            file_knowledge = self.context.knowledge_files.get(current_file_path)
-            current_feature = get_feature_for_file(self.context.features, current_file_path)
-            
-            # If the current_file in context matches the one we want, use its data
-            if self.context.current_file and self.context.current_file.get("path") == current_file_path:
-                current_file_content = self.context.current_file.get("content")
-
-        new_instructions = build_system_prompt(
-            user_name=self.context.session.get("userName"),
-            goal=self.context.session.get("goal"),
-            experience_level=self.context.session.get("experienceLevel"),
-            current_file=current_file_path,
-            file_knowledge=file_knowledge,
-            journey_files=selected_files,
-            current_step=self.current_file_index + 1,
-            total_steps=len(selected_files),
-            features_summary=self.context.features_summary,
-            current_feature=current_feature,
-            current_file_content=current_file_content,
-            architecture_doc=None, 
-            setup_doc=None,
-            tasks_doc=None,
+        current_file_path, new_instructions = self._build_instructions(
+            self.current_file_index, self.context.current_file, self._prompt_builder,
         )
-        
+
         # Update the instructions property
         self._instructions = new_instructions
         
@@ -214,154 +525,256 @@ class OnboardingAgent(VoiceAgent):
                 # for some LLM configurations, or just rely on self._instructions.
                 pass
         except Exception as e:
-            print(f"[Agent] Could not update chat context: {e}")
+            self.log.warning("Could not update chat context", error=str(e))
         
-        print(f"[Agent] Updated persona instructions for {current_file_path}")
+        self.log.info(
+            "Updated persona instructions",
+            path=current_file_path,
+            tokens=self._prompt_builder.last_token_count,
+            rebuilt=self._prompt_builder.last_rebuilt,
+        )
+
+    def _build_instructions(self, index: int, file_data: Optional[Dict[str, Any]], builder: PromptBuilder):
+        """(path, system prompt) for journey step `index`, quoting file_data if it is that file."""
+        selected_files = self.context.session.get("selectedFiles", [])
+        current_file_path = (
+            selected_files[index]
+            if index < len(selected_files)
+            else None
+        )
+        
+        # Use current file context from store if it matches
+        file_knowledge = None
+        current_feature = None
+        current_file_content = None
+        
+        if current_file_path:
+            file_knowledge = self.context.knowledge_files.get(current_file_path)
+            current_feature = self.context.feature_index.lookup(current_file_path)
+            
+            # If the file data we have is the one we want, use its content
+            if file_data and file_data.get("path") == current_file_path:
+                current_file_content = file_data.get("content")
+                # Source files go in as an outline plus the bodies that matter most
+                outline = self.context.outline_for(current_file_path, current_file_content)
+                if outline is not None:
+                    current_file_content = outline.excerpt(current_file_content, file_knowledge)
+
+        with self._span("build_system_prompt"):
+            new_instructions = builder.build(
+                user_name=self.context.session.get("userName"),
+                goal=self.context.session.get("goal"),
+                experience_level=self.context.session.get("experienceLevel"),
+                current_file=current_file_path,
+                file_knowledge=file_knowledge,
+                journey_files=selected_files,
+                current_step=index + 1,
+                total_steps=len(selected_files),
+                features_summary=self.context.features_summary,
+                current_feature=current_feature,
+                current_file_content=current_file_content,
+                architecture_doc=None, 
+                setup_doc=None,
+                tasks_doc=None,
+                features_version=self.context.features_version,
+            )
+        return current_file_path, new_instructions
 
-    async def _advance_to_next_file(self):
-        """Advance to the next file in the journey."""
+    def request_navigation(self, delta: int):
+        """Queue a jump of delta files (+1 next, -1 back)."""
         if not self.context.session:
             return
-        
-        # 1. Interrupt IMMEDIATELY to stop generic talk
+        # Interrupt IMMEDIATELY to stop generic talk
         if self.session:
-            print("[Agent] Interrupting for NEXT command...")
+            self.log.debug("Interrupting for navigation", delta=delta)
             self.session.interrupt()
+        self.navigation.submit(delta)
 
-        # Cooldown check: prevent double-navigation
-        now = asyncio.get_event_loop().time()
-        if now - self._last_nav_time < 3.0:
-            print(f"[Agent] Navigation cooldown active, ignoring request.")
+    async def _navigate_by(self, delta: int):
+        """Move delta files through the journey. Only the navigation queue calls this."""
+        if not self.context.session or delta == 0:
             return
-        self._last_nav_time = now
 
         selected_files = self.context.session.get("selectedFiles", [])
         total_files = len(selected_files)
-        
-        if self.current_file_index < total_files - 1:
-            from_file = selected_files[self.current_file_index]
-            self.current_file_index += 1
-            to_file = selected_files[self.current_file_index]
-            
-            print(f"[Agent] Advancing from {from_file} to {to_file}")
-            
-            # 2. Request full content for the new file
-            file_data = await self._request_file_from_server(to_file)
-            if file_data:
-                self.context.current_file = file_data
-            
-            # 3. Get feature context
-            to_feature = get_feature_for_file(self.context.features, to_file)
-            
-            # 4. Update UI
-            await self._show_file_in_ui(
-                file=to_file,
-                title=to_file.split("/")[-1],
-                explanation=f"Now let's look at {to_file}. This connects to what we just learned.",
-                start_line=1,
-                end_line=50,
-            )
-            
-            # 5. Update LLM instructions for the new file
+        from_index = self.current_file_index
+        to_index = max(0, min(total_files - 1, from_index + delta))
+
+        if to_index == from_index:
+            if delta > 0 and total_files:
+                # Reached end
+                user_name = self.context.session.get("userName", "you")
+                completion_prompt = f"Celebrate {user_name} completing the journey! Recp what they learned and encourage them."
+                self.navigation.state = NavState.SPEAKING
+                await self._generate_reply("completion", completion_prompt)
+            return
+
+        from_file = selected_files[from_index]
+        to_file = selected_files[to_index]
+        self.log.info("Moving through journey", delta=to_index - from_index, from_file=from_file, to_file=to_file)
+
+        # 1. Get full content for the target file: prepared with the whole
+        # transition when this is the "next" we speculated on, else usually prefetched
+        self.navigation.state = NavState.FETCHING
+        speculated = await self.transitions.take(self._transition_key(from_index, to_index))
+        if speculated is not None:
+            file_data, instructions, transition_text = speculated
+        else:
+            file_data, instructions, transition_text = await self._get_file(to_file), None, None
+
+        # 2. Commit the move in one step, now that nothing else is awaited
+        self.current_file_index = to_index
+        if file_data:
+            self.context.current_file = file_data
+        self._schedule_prefetch()
+
+        # 3. Update UI and LLM instructions for the new file
+        self.navigation.state = NavState.UPDATING
+        to_feature = self.context.feature_index.lookup(to_file)
+        if to_index > from_index:
+            explanation = f"Now let's look at {to_file}. This connects to what we just learned."
+        else:
+            explanation = f"Let's head back to {to_file}."
+        start_line, end_line = self._focus_lines(to_file, self.context.knowledge_files.get(to_file))
+        await self._show_file_in_ui(
+            file=to_file,
+            title=to_file.split("/")[-1],
+            explanation=explanation,
+            start_line=start_line,
+            end_line=end_line,
+        )
+        if instructions is not None:
+            self._instructions = instructions
+            self.log.info("Using speculated instructions", path=to_file)
+        else:
             self._update_system_instructions()
-            
-            # 6. Generate transition message with new context
-            user_name = self.context.session.get("userName")
-            transition_prompt = build_transition_prompt(
-                user_name=user_name,
-                from_file=from_file,
+        self._schedule_speculation()
+
+        # 4. Speak the transition, written ahead of time if we speculated
+        self.navigation.state = NavState.SPEAKING
+        if transition_text:
+            self.log.debug("Speaking speculated transition", path=to_file)
+            await self._say("transition", transition_text)
+            return
+        self.log.debug("Generating transition reply", path=to_file)
+        transition_prompt = self._transition_prompt(from_index, to_index, to_feature)
+        # Use the full updated persona as base for this transition
+        await self._generate_reply("transition", f"{self._instructions}\n\nTASK: {transition_prompt}")
+
+    def _transition_prompt(self, from_index: int, to_index: int, to_feature: Optional[Dict]) -> str:
+        selected_files = self.context.session.get("selectedFiles", [])
+        to_file = selected_files[to_index]
+        if to_index > from_index:
+            return build_transition_prompt(
+                user_name=self.context.session.get("userName"),
+                from_file=selected_files[from_index],
                 to_file=to_file,
                 to_feature=to_feature,
             )
-            
-            print(f"[Agent] Generating transition reply for {to_file}")
-            # Use the full updated persona as base for this transition
-            await self.session.generate_reply(instructions=f"{self._instructions}\n\nTASK: {transition_prompt}")
-        else:
-            # Reached end
-            user_name = self.context.session.get("userName", "you")
-            completion_prompt = f"Celebrate {user_name} completing the journey! Recp what they learned and encourage them."
-            await self.session.generate_reply(instructions=completion_prompt)
+        return f"Smoothly transition back to {to_file}. Briefly explain that we're re-examining it."
 
-    async def _go_to_previous_file(self):
-        """Go back to the previous file in the journey."""
-        if not self.context.session:
+    def _transition_key(self, from_index: int, to_index: int) -> tuple:
+        """Everything a prepared transition depends on; a different key means it's stale."""
+        session = self.context.session or {}
+        selected_files = tuple(session.get("selectedFiles", []))
+        to_file = selected_files[to_index] if 0 <= to_index < len(selected_files) else None
+        return (
+            selected_files, from_index, to_index,
+            session.get("userName"), session.get("goal"), session.get("experienceLevel"),
+            self.context.features_version, self.context.revisions["knowledge"],
+            self.context.knowledge_files.get(to_file),
+        )
+
+    def _schedule_speculation(self):
+        """Prepare the transition to the next file while the user is on this one."""
+        if not settings.SPECULATIVE_TRANSITIONS or not self.context.session:
             return
-            
-        # Cooldown check
-        now = asyncio.get_event_loop().time()
-        if now - self._last_nav_time < 3.0: return
-        self._last_nav_time = now
+        from_index = self.current_file_index
+        to_index = from_index + 1
+        if to_index >= len(self.context.session.get("selectedFiles", [])):
+            self.transitions.discard("end of journey")
+            return
+        self.transitions.prepare(
+            self._transition_key(from_index, to_index),
+            self._speculate_transition(from_index, to_index),
+        )
 
-        selected_files = self.context.session.get("selectedFiles", [])
-        
-        if self.current_file_index > 0:
-            from_file = selected_files[self.current_file_index]
-            self.current_file_index -= 1
-            to_file = selected_files[self.current_file_index]
-            
-            print(f"[Agent] Going back from {from_file} to {to_file}")
-            
-            if self.session: self.session.interrupt()
+    async def _speculate_transition(self, from_index: int, to_index: int):
+        """(file data, instructions, transition text) for moving from_index -> to_index.
 
-            file_data = await self._request_file_from_server(to_file)
-            if file_data: self.context.current_file = file_data
-            
-            to_feature = get_feature_for_file(self.context.features, to_file)
-            
-            await self._show_file_in_ui(
-                file=to_file, title=to_file.split("/")[-1],
-                explanation=f"Let's head back to {to_file}.",
-                start_line=1, end_line=50,
-            )
-            
-            self._update_system_instructions()
-            
-            transition_prompt = f"Smoothly transition back to {to_file}. Briefly explain that we're re-examining it."
-            await self.session.generate_reply(instructions=f"{self._instructions}\n\nTASK: {transition_prompt}")
+        Built with a prompt builder of its own so the live one keeps its
+        cached sections. The text is written without the conversation so far,
+        which a transition doesn't need.
+        """
+        to_file = self.context.session.get("selectedFiles", [])[to_index]
+        file_data = await self._get_file(to_file)
+        _, instructions = self._build_instructions(to_index, file_data, self._speculative_builder)
+        prompt = self._transition_prompt(from_index, to_index, self.context.feature_index.lookup(to_file))
+        with self._span("speculate_transition"):
+            text = await _generate_transition_text(instructions, prompt)
+        self.log.debug("Prepared transition", path=to_file, chars=len(text))
+        return file_data, instructions, text
     
-    async def _send_ui_command(self, command):
-        """Send a UI command via data channel."""
-        try:
-            if not self.room: return
-            data = serialize_command(command)
-            await self.room.local_participant.publish_data(
-                payload=data, reliable=True, topic="agent-commands",
-            )
-        except Exception as e:
-            print(f"[Agent] Error sending UI command: {e}")
+    def _send_ui_command(self, command):
+        """Queue a UI command; the scheduler batches and sends it."""
+        if not self.room: return
+        self.ui_commands.send(command)
+
+    async def _publish_ui_commands(self, payload: bytes, reliable: bool):
+        await self.room.local_participant.publish_data(
+            payload=payload, reliable=reliable, topic="agent-commands",
+        )
+
+    def _focus_lines(self, path: str, knowledge: Optional[str], max_lines: int = 50):
+        """Lines to open a file on: its most relevant symbol, else the top."""
+        current = self.context.current_file
+        if current and current.get("path") == path:
+            outline = self.context.outline_for(path, current.get("content"))
+            focus = outline.focus_range(knowledge, max_lines) if outline is not None else None
+            if focus:
+                return focus
+        return 1, max_lines
 
     async def _show_file_in_ui(self, file: str, title: str, explanation: str, start_line: int = None, end_line: int = None):
-        feature = get_feature_for_file(self.context.features, file)
+        feature = self.context.feature_index.lookup(file)
         feature_name = feature.get("name") if feature else None
         
         command = ShowFileCommand(
             file=file, title=title, explanation=explanation,
             startLine=start_line, endLine=end_line, featureName=feature_name,
         )
-        await self._send_ui_command(command)
+        self._send_ui_command(command)
 
     async def greet_user(self):
-        """Generate the initial greeting once context is ready."""
-        print("[Agent] Generating greeting...")
+        """Greet as soon as the session is known; the rest of the context can follow."""
+        # The features and first file are usually right behind the session packet
+        if not await self.context.wait_for_stage("full", settings.GREETING_GRACE_MS / 1000):
+            self.log.info("Greeting before full context", missing=self.context.missing_stages())
+        self._greeted = True
         self._update_system_instructions()
         
         user_name = self.context.session.get('userName', 'there')
         goal = self.context.session.get('goal', 'explore the codebase')
         experience_level = self.context.session.get('experienceLevel', 'intermediate')
         
-        first_file = None
+        # The journey is known from the session even before the file content arrives
+        selected_files = self.context.session.get("selectedFiles", [])
+        first_file = selected_files[0] if selected_files else None
         first_file_knowledge = None
         if self.context.current_file:
             first_file = self.context.current_file.get('path')
             first_file_knowledge = self.context.current_file.get('knowledge')
-            
+        elif first_file:
+            first_file_knowledge = self.context.knowledge_files.get(first_file)
+
+        if first_file:
             # Show first file in UI
+            start_line, end_line = self._focus_lines(first_file, first_file_knowledge)
             await self._show_file_in_ui(
                 file=first_file,
                 title=first_file.split("/")[-1],
                 explanation=f"Let's start by exploring {first_file}.",
-                start_line=1, end_line=50,
+                start_line=start_line, end_line=end_line,
             )
         
         greeting_prompt = build_greeting_prompt(
@@ -373,8 +786,117 @@ class OnboardingAgent(VoiceAgent):
             first_file_knowledge=first_file_knowledge,
         )
         
+        self._schedule_prefetch()
+        self._schedule_speculation()
+
         # Use full instructions + specific greeting task
-        await self.session.generate_reply(instructions=f"{self._instructions}\n\nTASK: {greeting_prompt}")
+        await self._generate_reply("greeting", f"{self._instructions}\n\nTASK: {greeting_prompt}")
+
+    def _on_context_stage(self, stage: str, first: bool):
+        """A piece of context arrived: time it and fold it into the instructions."""
+        if first and self.context.first_packet_at is not None:
+            self._observe("context_stage", time.perf_counter() - self.context.first_packet_at, stage=stage)
+        # Before the greeting, greet_user builds from whatever has arrived
+        if self._greeted:
+            self._update_system_instructions()
+            # The prepared transition was built from the old context
+            self.transitions.discard(f"{stage} changed")
+            self._schedule_speculation()
+        if self.context.retrieval.staged:
+            self.tasks.spawn(self.context.retrieval.warm(), group="retrieval", supersede=True)
+
+    def _on_outline(self, path: str):
+        """The current file's outline is ready: show it to the LLM instead of the raw top."""
+        if self._greeted:
+            self._update_system_instructions()
+
+    async def on_user_turn_completed(self, turn_ctx: llm.ChatContext, new_message: llm.ChatMessage):
+        """Hand the reply the knowledge that best matches what the user just asked.
+
+        The prompt only carries the current file's knowledge; this brings in
+        the rest of the repo's, a few snippets at a time.
+        """
+        query = new_message.text_content or ""
+        if settings.RETRIEVAL_TOKENS <= 0 or not query.strip():
+            return
+        current = self.context.current_file.get("path") if self.context.current_file else None
+        with self._span("retrieval"):
+            snippets = self.context.retrieval.search(
+                query,
+                k=settings.RETRIEVAL_TOP_K,
+                token_budget=settings.RETRIEVAL_TOKENS,
+                exclude=[current] if current else [],  # already in the prompt
+            )
+        if not snippets:
+            return
+        self.log.debug("Retrieved knowledge", labels=[snippet.label for snippet in snippets])
+        turn_ctx.add_message(
+            role="assistant",
+            content=f"Knowledge relevant to the user's question:\n{format_snippets(snippets)}",
+        )
+
+    async def tts_node(self, text: AsyncIterable[str], model_settings: Any):
+        """Speak paths, identifiers and code symbols the way a developer says them."""
+        if settings.SPEECH_NORMALIZER:
+            text = normalize_speech(text)
+        async for frame in VoiceAgent.default.tts_node(self, text, model_settings):
+            yield frame
+
+    def _span(self, name: str, **labels):
+        """Latency span labelled with this session and room."""
+        return metrics.span(name, session=self.session_id, room=self.room.name if self.room else None, **labels)
+
+    def _observe(self, name: str, seconds: float, **labels):
+        metrics.observe(name, seconds, session=self.session_id, room=self.room.name if self.room else None, **labels)
+
+    async def _generate_reply(self, kind: str, instructions: str):
+        """generate_reply, timed until the agent starts speaking (see _on_agent_state)."""
+        self._pending_reply = (kind, time.perf_counter())
+        handle = self.session.generate_reply(instructions=instructions)
+        # Its LLM metrics only arrive once it is speaking, so label them by speech id
+        self._reply_kinds[handle.id] = kind
+        await handle
+
+    async def _say(self, kind: str, text: str):
+        """say() for text written ahead of time, timed like _generate_reply."""
+        self._pending_reply = (kind, time.perf_counter())
+        await self.session.say(text)  # no LLM call, so no LLM metrics to label
+
+    def _on_agent_state(self, new_state: str):
+        """Record time to first audio for the reply in progress."""
+        if new_state != "speaking" or self._pending_reply is None:
+            return
+        kind, started = self._pending_reply
+        self._pending_reply = None
+        now = time.perf_counter()
+        self._observe("reply_first_audio", now - started, kind=kind)
+        if kind == "greeting" and self.context.first_packet_at is not None:
+            self._observe("context_to_greeting_audio", now - self.context.first_packet_at)
+
+    def _on_model_metrics(self, model_metrics: Any):
+        """LLM time to first token / TTS time to first byte from the session's metrics events."""
+        ttft = getattr(model_metrics, "ttft", None)
+        if ttft is not None and ttft >= 0:
+            # Replies the user's speech triggered aren't ours to label
+            kind = self._reply_kinds.pop(getattr(model_metrics, "speech_id", None), "conversation")
+            self._observe("reply_first_token", ttft, kind=kind)
+        ttfb = getattr(model_metrics, "ttfb", None)
+        if ttfb is not None and ttfb >= 0 and type(model_metrics).__name__ == "TTSMetrics":
+            self._observe("tts_first_byte", ttfb)
+
+
+def prewarm(proc: JobProcess):
+    """Load per-process resources once, before this process takes any job."""
+    proc.userdata["vad"] = silero.VAD.load()
+    # Loads the tokenizer's BPE table so the first prompt doesn't pay for it
+    count_tokens("warmup")
+    # Indexes the on-disk TTS cache once per process
+    audio_cache = get_audio_cache()
+    log.info("Worker process prewarmed (VAD, tokenizer)", tts_cache=audio_cache.stats() if audio_cache else None)
+
+    if settings.METRICS_PORT:
+        # The worker process serves these merged with every other job process
+        metrics.publish_every()
 
 
 async def entrypoint(ctx: JobContext):
@@ -383,12 +905,19 @@ async def entrypoint(ctx: JobContext):
     
     # Identify ourselves
     me = ctx.room.local_participant
-    print(f"[Agent] CONNECTED | Room: {ctx.room.name}")
-    print(f"[Agent] MY IDENTITY: {me.identity}")
-    print(f"[Agent] CURRENT REMOTE PARTICIPANTS: {[p.identity for p in ctx.room.remote_participants.values()]}")
 
-    agent = OnboardingAgent()
-    agent.room = ctx.room
+    agent = OnboardingAgent(vad_model=ctx.proc.userdata.get("vad"))
+    agent.attach_room(ctx.room)
+    # Reports this session's event-loop lag to the worker's load function
+    load_probe = LoadProbe(ctx.room.name)
+    load_probe.start()
+    agent.log.info(
+        "Connected",
+        identity=me.identity,
+        participants=[p.identity for p in ctx.room.remote_participants.values()],
+    )
+    data_log = agent.log.child("data")
+    conversation_log = agent.log.child("conversation")
     
     # Listen for context messages from local server
     @ctx.room.on("data_received")
@@ -399,41 +928,44 @@ async def entrypoint(ctx: JobContext):
         participant = packet.participant
         
         p_identity = participant.identity if participant else 'unknown'
-        print(f"[Agent] DATA RECEIVED | Topic: {topic} | From: {p_identity} | Size: {len(payload)} bytes")
+        data_log.debug("Data received", topic=topic, sender=p_identity, bytes=len(payload))
         
         try:
-            decoded = payload.decode("utf-8")
-            data = json.loads(decoded)
-            print(f"[Agent] DATA TYPE: {data.get('type')}")
+            data = decode_packet(payload)
+            data_log.debug("Data type", type=data.get("type"))
             
             if topic == "server-context":
                 if data.get("type") == "onboarding-context":
-                    print(f"[Agent] SUCCESS: Received onboarding context from {p_identity}")
+                    data_log.debug("Received onboarding context", sender=p_identity)
                     agent.context.update_context(data)
                 elif data.get("type") == "file-content":
-                    print(f"[Agent] SUCCESS: Received file content for {data.get('path')}")
+                    data_log.debug("Received file content", path=data.get("path"))
                     agent.context.update_file(data)
+                elif data.get("type") in ("features-patch", "knowledge-patch"):
+                    agent.context.apply_patch(data)
             else:
                 # Debug: check if context was sent on wrong topic
                 if data.get("type") == "onboarding-context":
-                    print(f"[Agent] WARNING: Received context on WRONG topic: {topic}")
+                    data_log.warning("Received context on wrong topic", topic=topic)
                     agent.context.update_context(data)
         except Exception as e:
-            print(f"[Agent] PARSE ERROR: {e}")
+            data_log.error("Could not parse data packet", topic=topic, error=str(e))
 
-    # Wait for context
-    print("Starting onboarding agent (Context-Push mode)...")
-    print(f"[Agent] WAITING for context push (25s timeout)...")
+    # Only the session is needed to start talking; features and the first
+    # file are folded into the instructions as they arrive
+    agent.log.info("Waiting for session context", timeout=25.0)
     
-    context_received = await agent.context.wait_for_context(timeout=25.0)
+    with agent._span("wait_for_context"):
+        context_received = await agent.context.wait_for_stage("session", timeout=25.0)
     
     if not context_received:
-        print("[Agent] CRITICAL TIMEOUT: No context received.")
-        print(f"[Agent] FINAL ROOM MEMBERS: {[p.identity for p in ctx.room.remote_participants.values()]}")
-        print("[Agent] Falling back to generic mode.")
+        agent.log.error(
+            "No session context received; falling back to generic mode",
+            participants=[p.identity for p in ctx.room.remote_participants.values()],
+        )
 
     # Start the agent session
-    print("[Agent] Starting session...")
+    agent.log.info("Starting session")
     session = AgentSession()
     
     # Listen for transcription for navigation
@@ -441,7 +973,12 @@ async def entrypoint(ctx: JobContext):
     def on_user_input(event: UserInputTranscribedEvent):
         if not event.is_final: return
         user_text = event.transcript.strip()
-        print(f"[Conversation] USER: {user_text}")
+        conversation_log.info("User", text=user_text)
+        
+        # Anything the user says makes pending classifications stale
+        superseded = agent.tasks.cancel_group("classify")
+        if superseded:
+            agent.log.debug("Cancelled stale intent classifications", count=superseded)
         
         word_count = len(user_text.split())
         if word_count >= 15: return
@@ -451,25 +988,34 @@ async def entrypoint(ctx: JobContext):
         
         # "next" commands
         if any(nav in text_lower for nav in ["next file", "move forward", "go forward", "proceed"]):
-            print(f"[Agent] Keyword NEXT detected in \"{user_text}\"")
-            asyncio.create_task(agent._advance_to_next_file())
+            agent.log.info("Keyword navigation", intent="NEXT", text=user_text)
+            agent.request_navigation(+1)
             return
             
         # "previous" commands
         if any(nav in text_lower for nav in ["previous file", "go back", "move back", "backtrack"]):
-            print(f"[Agent] Keyword BACK detected in \"{user_text}\"")
-            asyncio.create_task(agent._go_to_previous_file())
+            agent.log.info("Keyword navigation", intent="BACK", text=user_text)
+            agent.request_navigation(-1)
             return
 
         # 2. Ambiguous short phrases -> classify
-        asyncio.create_task(classify_and_handle_intent(agent, user_text))
+        agent.tasks.spawn(classify_and_handle_intent(agent, user_text), group="classify", supersede=True)
+
+    @session.on("agent_state_changed")
+    def on_agent_state(event: Any):
+        agent._on_agent_state(getattr(event, "new_state", None))
+
+    @session.on("metrics_collected")
+    def on_metrics(event: Any):
+        agent._on_model_metrics(getattr(event, "metrics", None))
 
     # Log agent replies
     @session.on("agent_speech_committed")
     def on_agent_speech(msg: llm.ChatMessage):
-        print(f"[Conversation] AGENT: {msg.content}")
+        conversation_log.info("Agent", text=msg.content)
 
     await session.start(agent=agent, room=ctx.room)
+    agent.navigation.start()
 
     # Greet once started if we have context
     if agent.context.session:
@@ -482,45 +1028,100 @@ async def entrypoint(ctx: JobContext):
         disconnect_event.set()
         
     await disconnect_event.wait()
-    print("[Agent] Room disconnected, shutting down.")
+    agent.log.info("Room disconnected, shutting down")
+    await agent.navigation.close()
+    await agent.tasks.drain()
+    await agent.ui_commands.close()
+    await load_probe.aclose()
+    agent.log.child("speculation").info("Transition speculation", **agent.transitions.stats())
+    if agent.cached_tts is not None:
+        agent.log.child("tts-cache").info(
+            "TTS cache", session=agent.cached_tts.stats(), worker=agent.cached_tts.cache.stats(),
+        )
+    agent.log.child("metrics").info("Session latency", spans=metrics.summary(agent.session_id))
+    metrics.forget_session(agent.session_id)
+    if settings.METRICS_PORT:
+        metrics.publish()
+    knowledge_store.release_session(agent.session_id)
+    agent.log.child("knowledge").info("Released shared knowledge", **knowledge_store.stats())
 
 
 async def classify_and_handle_intent(agent, user_text: str):
     """Classify user intent for navigation with improved prompt."""
     try:
-        from openai import AsyncOpenAI
-        client = AsyncOpenAI()
-        
-        current_file = agent.context.current_file.get("path") if agent.context.current_file else "unknown"
+        started = time.perf_counter()
+        intent = intent_cache.get(user_text)
+        if intent is None:
+            intent = await _classify_intent(agent, user_text)
+            if intent in ("NEXT", "BACK", "OTHER"):
+                intent_cache.put(user_text, intent)
+            agent._observe("classify_intent", time.perf_counter() - started, source="llm")
+            agent.log.info("Classified intent", intent=intent, text=user_text, source="llm")
+        else:
+            agent._observe("classify_intent", time.perf_counter() - started, source="cache")
+            agent.log.info("Classified intent", intent=intent, text=user_text, source="cache", hit_rate=round(intent_cache.hit_rate, 3))
         
-        response = await client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{
-                "role": "system",
-                "content": """Classify user intent as NEXT, BACK, or OTHER. 
-                
+        # Hand off to the navigation queue: once queued, a newer utterance
+        # superseding this classification can't cut the jump off half-way
+        if "NEXT" == intent:
+            agent.request_navigation(+1)
+        elif "BACK" == intent:
+            agent.request_navigation(-1)
+    except Exception as e:
+        agent.log.error("Intent error", error=str(e))
+
+
+async def _generate_transition_text(instructions: str, task: str) -> str:
+    """Write a transition reply outside the voice pipeline, to be spoken later."""
+    client = get_openai_client()
+    response = await client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": instructions},
+            {"role": "user", "content": f"TASK: {task}"},
+        ],
+        max_tokens=200, temperature=0.7
+    )
+    return (response.choices[0].message.content or "").strip()
+
+
+async def _classify_intent(agent, user_text: str) -> str:
+    """Ask the LLM whether the user wants NEXT, BACK or OTHER."""
+    client = get_openai_client()
+    
+    current_file = agent.context.current_file.get("path") if agent.context.current_file else "unknown"
+    
+    response = await client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[{
+            "role": "system",
+            "content": """Classify user intent as NEXT, BACK, or OTHER. 
+            
 NEXT: User explicitly wants to move to the NEXT file in the journey (e.g., "next", "move on", "I'm done with this").
 BACK: User explicitly wants to go back to the PREVIOUS file (e.g., "go back", "previous").
 OTHER: General questions, comments, or confirmation of readiness (e.g., "I'm ready", "Okay", "Tell me more about this").
 
 ONLY respond with one of these three words: NEXT, BACK, or OTHER."""
-            }, {
-                "role": "user", 
-                "content": f"Context: Codebase onboarding. Current file: {current_file}. User said: \"{user_text}\""
-            }],
-            max_tokens=5, temperature=0
-        )
-        
-        intent = response.choices[0].message.content.strip().upper()
-        print(f"[Agent] Classified intent: {intent} for \"{user_text}\"")
-        
-        if "NEXT" == intent:
-            await agent._advance_to_next_file()
-        elif "BACK" == intent:
-            await agent._go_to_previous_file()
-    except Exception as e:
-        print(f"[Agent] Intent error: {e}")
+        }, {
+            "role": "user", 
+            "content": f"Context: Codebase onboarding. Current file: {current_file}. User said: \"{user_text}\""
+        }],
+        max_tokens=5, temperature=0
+    )
+    
+    return response.choices[0].message.content.strip().upper()
 
 
 if __name__ == "__main__":
-    cli.run_app(WorkerOptions(entrypoint_fnc=entrypoint))
+    if settings.METRICS_PORT:
+        if metrics.serve(settings.METRICS_PORT):
+            log.info("Serving OpenMetrics", url=f"http://127.0.0.1:{settings.METRICS_PORT}/metrics")
+        else:
+            log.warning("Metrics port in use; endpoint disabled", port=settings.METRICS_PORT)
+    cli.run_app(WorkerOptions(
+        entrypoint_fnc=entrypoint,
+        prewarm_fnc=prewarm,
+        request_fnc=admit,
+        load_fnc=worker_load,
+        load_threshold=settings.LOAD_DRAIN_PERCENT / 100,
+    ))
@@ -0,0 +1,293 @@
+"""
+Latency spans aggregated into histograms, with an optional OpenMetrics endpoint.
+
+Every span is recorded twice: under its session/room labels (dropped when the
+session ends, so long-running workers don't accumulate series) and under an
+aggregate with no session labels.
+
+Sessions run in separate job processes, each with its own registry. The
+worker process serves a single endpoint. Its job processes, which inherit
+the worker's pid through the environment, each publish a snapshot of their
+registry to the worker's directory under SNAPSHOT_DIR every few seconds. The
+endpoint merges the worker's own registry with those snapshots. When a job
+process exits, its aggregates are folded into the worker's totals, so the
+counters never go backwards.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import psutil
+
+# One directory per serving worker, named after its pid
+SNAPSHOT_DIR = os.path.join(tempfile.gettempdir(), "sb-metrics")
+
+# Set by serve(); tells job processes which worker to publish to
+_WORKER_ENV = "SB_METRICS_WORKER"
+
+# Seconds between snapshots written by a job process
+SNAPSHOT_INTERVAL = 2.0
+
+# Seconds; voice latency lives between tens of milliseconds and a few seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0, 30.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Cumulative-bucket histogram of durations in seconds."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bucket bound containing the q-quantile (None if empty)."""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for i, bound in enumerate(self.buckets):
+            seen += self.counts[i]
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+class MetricsRegistry:
+    """Thread-safe span histograms keyed by span name and labels."""
+
+    def __init__(self, prefix: str = "sb_agent"):
+        self.prefix = prefix
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, seconds: float, session: Optional[str] = None, room: Optional[str] = None, **labels: str):
+        extra = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        keys = [extra]
+        if session or room:
+            keys.append((("room", room or ""), ("session", session or "")) + extra)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            for key in keys:
+                histogram = series.get(key)
+                if histogram is None:
+                    histogram = series[key] = Histogram()
+                histogram.observe(seconds)
+
+    @contextmanager
+    def span(self, name: str, session: Optional[str] = None, room: Optional[str] = None, **labels: str) -> Iterator[None]:
+        """Time the enclosed block (sync or inside a coroutine)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, session=session, room=room, **labels)
+
+    def snapshot(self) -> List[List[Any]]:
+        """Every series as JSON-able [name, labels, counts, count, sum]."""
+        with self._lock:
+            return [
+                [name, [list(label) for label in key], list(h.counts), h.count, h.sum]
+                for name, series in self._histograms.items()
+                for key, h in series.items()
+            ]
+
+    def merge(self, snapshot: List[List[Any]], aggregates_only: bool = False):
+        """Add a snapshot() of another registry into this one."""
+        with self._lock:
+            for name, key, counts, count, total in snapshot:
+                key = tuple(tuple(label) for label in key)
+                if aggregates_only and any(k == "session" for k, _ in key):
+                    continue
+                series = self._histograms.setdefault(name, {})
+                histogram = series.get(key)
+                if histogram is None:
+                    histogram = series[key] = Histogram()
+                histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+                histogram.count += count
+                histogram.sum += total
+
+    def publish(self):
+        """Write this process's snapshot for the worker's endpoint (atomically).
+
+        A no-op unless a worker serves the endpoint, and in the worker itself
+        (thread executor), whose registry the endpoint reads directly.
+        """
+        worker = os.environ.get(_WORKER_ENV)
+        if not worker or worker == str(os.getpid()):
+            return
+        directory = os.path.join(SNAPSHOT_DIR, worker)
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        tmp = f"{path}.tmp"
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(tmp, "w") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp, path)
+        except OSError:
+            pass  # the worker keeps serving the last snapshot it read
+
+    def publish_every(self, interval: float = SNAPSHOT_INTERVAL):
+        """Publish snapshots from a daemon thread, off the event loop."""
+        def run():
+            while True:
+                self.publish()
+                time.sleep(interval)
+
+        threading.Thread(target=run, name="metrics-snapshot", daemon=True).start()
+
+    def forget_session(self, session: str):
+        """Drop a finished session's series; the aggregates keep its data."""
+        with self._lock:
+            for series in self._histograms.values():
+                for key in [key for key in series if ("session", session) in key]:
+                    del series[key]
+
+    def summary(self, session: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+        """count / p50 / p95 per span, for one session or the aggregate."""
+        result = {}
+        with self._lock:
+            for name, series in sorted(self._histograms.items()):
+                for key, histogram in series.items():
+                    in_session = ("session", session) in key if session else not any(k == "session" for k, _ in key)
+                    if in_session and histogram.count:
+                        label = name + "".join(f"[{v}]" for k, v in key if k not in ("session", "room"))
+                        result[label] = {
+                            "count": histogram.count,
+                            "p50": histogram.quantile(0.5),
+                            "p95": histogram.quantile(0.95),
+                        }
+        return result
+
+    def render(self) -> str:
+        """OpenMetrics text exposition of every histogram."""
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._histograms.items()):
+                metric = f"{self.prefix}_{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                lines.append(f"# UNIT {metric} seconds")
+                for key, histogram in series.items():
+                    base = ",".join(f'{k}="{_escape(v)}"' for k, v in key)
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        bucket_labels = _join(base, f'le="{le}"')
+                        lines.append(f"{metric}_bucket{{{bucket_labels}}} {cumulative}")
+                    suffix = f"{{{base}}}" if base else ""
+                    lines.append(f"{metric}_count{suffix} {histogram.count}")
+                    lines.append(f"{metric}_sum{suffix} {histogram.sum}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> bool:
+        """Serve /metrics for the whole worker from a daemon thread, off the event loop.
+
+        Call it in the worker process before it starts job processes.
+        Returns False if the port is taken.
+        """
+        workers = WorkerMetrics(self, os.path.join(SNAPSHOT_DIR, str(os.getpid())))
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = workers.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/openmetrics-text; version=1.0.0; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass  # scrapes are not worth a log line
+
+        try:
+            server = ThreadingHTTPServer((host, port), Handler)
+        except OSError:
+            return False
+        os.environ[_WORKER_ENV] = str(os.getpid())
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        return True
+
+
+class WorkerMetrics:
+    """The worker's own registry merged with its job processes' snapshots."""
+
+    def __init__(self, own: MetricsRegistry, directory: str):
+        self.own = own
+        self.directory = directory
+        self.retired = MetricsRegistry(own.prefix)  # aggregates of exited job processes
+        self._lock = threading.Lock()
+        shutil.rmtree(directory, ignore_errors=True)  # left by an earlier process with this pid
+
+    def render(self) -> str:
+        with self._lock:
+            merged = MetricsRegistry(self.own.prefix)
+            merged.merge(self.own.snapshot())
+            for pid, snapshot in self._read_snapshots():
+                if psutil.pid_exists(pid):
+                    merged.merge(snapshot)
+                else:
+                    # Its last snapshot is final: keep the aggregates, drop session series
+                    self.retired.merge(snapshot, aggregates_only=True)
+                    _unlink(os.path.join(self.directory, f"{pid}.json"))
+            merged.merge(self.retired.snapshot())
+        return merged.render()
+
+    def _read_snapshots(self) -> List[Tuple[int, List[List[Any]]]]:
+        snapshots = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return snapshots
+        for name in names:
+            head, _, ext = name.partition(".")
+            if ext != "json" or not head.isdigit():
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    snapshots.append((int(head), json.load(f)))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+
+def _unlink(path: str):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _join(*parts: str) -> str:
+    return ",".join(part for part in parts if part)
+
+
+# Process-wide registry shared by every session in this worker process
+registry = MetricsRegistry()
@@ -0,0 +1,80 @@
+"""
+Serialized journey navigation for one session.
+"""
+
+import asyncio
+from enum import Enum
+from typing import Awaitable, Callable, Optional
+
+from structured_log import get_logger
+
+
+class NavState(str, Enum):
+    IDLE = "idle"
+    FETCHING = "fetching"  # getting the target file
+    UPDATING = "updating"  # UI + instructions
+    SPEAKING = "speaking"  # transition reply
+
+
+class NavigationQueue:
+    """Single consumer for next/back commands.
+
+    Commands are step deltas (+1 next, -1 back). A command that finds the
+    queue idle is handed to `handler` at once. Commands that arrive while a
+    jump is in flight pile up and are then handed over as one net jump, so
+    "next, next, next" becomes +1 followed by a single +2 with one fetch,
+    prompt rebuild and reply. Only the consumer moves the journey, so nothing
+    races on the current index. The handler advances `state` through its
+    stages.
+    """
+
+    def __init__(self, handler: Callable[[int], Awaitable[None]]):
+        self.handler = handler
+        self.state = NavState.IDLE
+        self.jumps = 0
+        self.coalesced = 0
+        self._queue: "asyncio.Queue[int]" = asyncio.Queue()
+        self._consumer: Optional[asyncio.Task] = None
+        self.log = get_logger("navigation")
+
+    def start(self):
+        if self._consumer is None:
+            self._consumer = asyncio.create_task(self._run())
+
+    def submit(self, delta: int):
+        """Queue a navigation command; never blocks."""
+        self._queue.put_nowait(delta)
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    async def close(self):
+        if self._consumer is not None:
+            self._consumer.cancel()
+            await asyncio.gather(self._consumer, return_exceptions=True)
+            self._consumer = None
+        self.state = NavState.IDLE
+
+    async def _run(self):
+        while True:
+            delta = await self._queue.get()
+            commands = 1
+            # Commands that piled up while the last jump was handled
+            while not self._queue.empty():
+                delta += self._queue.get_nowait()
+                commands += 1
+
+            self.coalesced += commands - 1
+            if commands > 1:
+                self.log.info("Coalesced navigation commands", commands=commands, delta=delta)
+
+            try:
+                self.jumps += 1
+                await self.handler(delta)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.log.error("Jump failed", delta=delta, error=str(e))
+            finally:
+                self.state = NavState.IDLE
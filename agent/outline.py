@@ -0,0 +1,537 @@
+"""
+Structural outlines of source files: symbols, line ranges and docstrings.
+
+Python is parsed with `ast`; TypeScript/JavaScript goes through a small
+token-level scanner (strings, template literals, comments and regex
+literals are skipped, braces tracked) that finds functions, classes and
+their methods, interfaces, types, enums and top-level constants. Neither
+needs the file to be complete or even valid: a Python file that doesn't
+parse simply has no outline.
+"""
+
+import ast
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+PYTHON_EXTENSIONS = (".py", ".pyi")
+SCRIPT_EXTENSIONS = (".ts", ".tsx", ".js", ".jsx", ".mjs", ".cjs", ".mts", ".cts")
+
+# Longest body quoted for one symbol in an excerpt; the rest is elided
+MAX_BODY_LINES = 60
+# Classes longer than this are quoted method by method instead of whole
+MAX_WHOLE_CLASS_LINES = 80
+
+
+@dataclass
+class OutlineSymbol:
+    name: str
+    kind: str  # function, method, class, interface, type, enum, const
+    start_line: int  # 1-based, decorators / export included
+    end_line: int
+    doc: Optional[str] = None  # first line of the docstring / doc comment
+    parent: Optional[str] = None  # enclosing class
+    children: List["OutlineSymbol"] = field(default_factory=list)
+
+    @property
+    def line_count(self) -> int:
+        return self.end_line - self.start_line + 1
+
+
+class Outline:
+    """Symbols of one file, with cached prompt excerpts."""
+
+    def __init__(self, path: str, symbols: List[OutlineSymbol], comment: str):
+        self.path = path
+        self.symbols = symbols  # top level, in file order; methods are children
+        self.comment = comment  # line comment marker of the language
+        self._excerpts: Dict[Optional[str], str] = {}
+
+    def __iter__(self):
+        for symbol in self.symbols:
+            yield symbol
+            yield from symbol.children
+
+    def __len__(self) -> int:
+        return sum(1 + len(symbol.children) for symbol in self.symbols)
+
+    def render(self) -> str:
+        """Compact outline, one symbol per line."""
+        c = self.comment
+        lines = [f"{c} Outline of {self.path} (line ranges):"]
+        for symbol in self:
+            indent = "  " if symbol.parent else ""
+            doc = f" - {symbol.doc}" if symbol.doc else ""
+            lines.append(f"{c} {indent}{symbol.start_line}-{symbol.end_line} {symbol.kind} {symbol.name}{doc}")
+        return "\n".join(lines)
+
+    def ranked(self, hints: Optional[str] = None) -> List[OutlineSymbol]:
+        """Symbols worth quoting, most relevant first.
+
+        Symbols named in `hints` (the file's knowledge doc) come first, then
+        top-level ones, then larger ones; ties keep file order. A class short
+        enough to quote whole stands in for its methods.
+        """
+        mentions = _mention_counts(hints or "", {symbol.name for symbol in self})
+        candidates = []
+        for symbol in self.symbols:
+            if symbol.kind == "class" and symbol.children and symbol.line_count > MAX_WHOLE_CLASS_LINES:
+                candidates.extend(symbol.children)
+            elif symbol.line_count > 1 or symbol.kind != "const":
+                candidates.append(symbol)
+        order = {id(symbol): i for i, symbol in enumerate(self)}
+        return sorted(
+            candidates,
+            key=lambda s: (-mentions.get(s.name, 0), s.parent is not None, -min(s.line_count, MAX_BODY_LINES), order[id(s)]),
+        )
+
+    def excerpt(self, content: str, hints: Optional[str] = None) -> str:
+        """Outline followed by symbol bodies in relevance order.
+
+        Meant to be cut from the end to fit a token budget: the least
+        relevant bodies go first.
+        """
+        cached = self._excerpts.get(hints)
+        if cached is not None:
+            return cached
+
+        lines = content.split("\n")
+        parts = [self.render()]
+        for symbol in self.ranked(hints):
+            end = min(symbol.end_line, symbol.start_line + MAX_BODY_LINES - 1)
+            body = "\n".join(lines[symbol.start_line - 1:end])
+            if not body.strip():
+                continue
+            parts.append(f"{self.comment} --- {symbol.name}, lines {symbol.start_line}-{symbol.end_line} ---\n{body}")
+            if end < symbol.end_line:
+                parts.append(f"{self.comment} ... {symbol.end_line - end} more lines")
+        text = "\n\n".join(parts)
+        self._excerpts = {hints: text}  # knowledge rarely changes; keep one
+        return text
+
+    def focus_range(self, hints: Optional[str] = None, max_lines: int = 50) -> Optional[Tuple[int, int]]:
+        """Line range of the most relevant symbol, for a UI excerpt.
+
+        Without any symbol named in `hints`, the first one in the file.
+        """
+        ranked = self.ranked(hints)
+        if not ranked:
+            return None
+        symbol = ranked[0]
+        if not _mention_counts(hints or "", {symbol.name}):
+            symbol = min(ranked, key=lambda s: s.start_line)
+        return symbol.start_line, min(symbol.end_line, symbol.start_line + max_lines - 1)
+
+
+def can_outline(path: Optional[str]) -> bool:
+    return bool(path) and path.lower().endswith(PYTHON_EXTENSIONS + SCRIPT_EXTENSIONS)
+
+
+def build_outline(path: str, content: str) -> Optional[Outline]:
+    """Outline of a source file.
+
+    None for other files, unparsable Python and files without any symbols
+    (scripts, config), which read better as they are.
+    """
+    lower = (path or "").lower()
+    if lower.endswith(PYTHON_EXTENSIONS):
+        symbols, comment = _python_symbols(content), "#"
+    elif lower.endswith(SCRIPT_EXTENSIONS):
+        symbols, comment = _script_symbols(content), "//"
+    else:
+        return None
+    return Outline(path, symbols, comment) if symbols else None
+
+
+def _mention_counts(text: str, names: set) -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    if not text or not names:
+        return counts
+    for word in re.findall(r"[A-Za-z_$][\w$]*", text):
+        if word in names:
+            counts[word] = counts.get(word, 0) + 1
+    return counts
+
+
+def _first_line(doc: Optional[str]) -> Optional[str]:
+    if not doc:
+        return None
+    for line in doc.strip().splitlines():
+        line = line.strip().lstrip("*").strip()
+        if line:
+            return line[:120]
+    return None
+
+
+# --- Python -----------------------------------------------------------------
+
+def _python_symbols(content: str) -> Optional[List[OutlineSymbol]]:
+    try:
+        tree = ast.parse(content)
+    except (SyntaxError, ValueError):
+        return None
+
+    def make(node, kind: str, parent: Optional[str] = None) -> OutlineSymbol:
+        start = min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+        return OutlineSymbol(
+            name=node.name, kind=kind, start_line=start,
+            end_line=getattr(node, "end_lineno", None) or node.lineno,
+            doc=_first_line(ast.get_docstring(node)), parent=parent,
+        )
+
+    symbols = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            symbols.append(make(node, "function"))
+        elif isinstance(node, ast.ClassDef):
+            symbol = make(node, "class")
+            symbol.children = [
+                make(child, "method", parent=node.name)
+                for child in node.body
+                if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef))
+            ]
+            symbols.append(symbol)
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)) and node.col_offset == 0:
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            for target in targets:
+                if isinstance(target, ast.Name) and target.id.isupper():
+                    symbols.append(OutlineSymbol(
+                        name=target.id, kind="const", start_line=node.lineno,
+                        end_line=getattr(node, "end_lineno", None) or node.lineno,
+                    ))
+    return symbols
+
+
+# --- TypeScript / JavaScript ------------------------------------------------
+
+_IDENT_START = re.compile(r"[A-Za-z_$]")
+_IDENT = re.compile(r"[A-Za-z_$][\w$]*")
+_NUMBER = re.compile(r"\d[\w.]*")
+_PUNCT = ("=>", "...", "?.")
+# After these a "/" starts a regex literal rather than a division
+_REGEX_AFTER = set("(,=:[!&|?{};+-*%<>~^") | {"return", "typeof", "case", "do", "else", "in", "of", "yield", "await", "=>"}
+
+_MODIFIERS = {"export", "default", "declare", "abstract", "async", "public", "private", "protected",
+              "static", "readonly", "override", "get", "set", "accessor"}
+
+
+def _tokenize(src: str) -> List[Tuple[str, str, int, Optional[str]]]:
+    """(kind, text, line, preceding doc comment) for significant tokens.
+
+    Strings, template literals, regex literals and comments never reach the
+    parser, so braces inside them don't count.
+    """
+    tokens = []
+    i, line, n = 0, 1, len(src)
+    doc, doc_end_line = None, 0
+    prev = None
+
+    while i < n:
+        ch = src[i]
+        if ch == "\n":
+            line += 1
+            i += 1
+            continue
+        if ch in " \t\r\f\v﻿":
+            i += 1
+            continue
+        if src.startswith("//", i):
+            end = src.find("\n", i)
+            i = n if end < 0 else end
+            continue
+        if src.startswith("/*", i):
+            end = src.find("*/", i + 2)
+            end = n if end < 0 else end + 2
+            text = src[i:end]
+            if text.startswith("/**"):
+                doc = text[3:-2]
+            line += text.count("\n")
+            doc_end_line = line
+            i = end
+            continue
+        if ch in "'\"":
+            i, line = _skip_string(src, i, line)
+            prev = "str"
+            continue
+        if ch == "`":
+            i, line = _skip_template(src, i, line)
+            prev = "str"
+            continue
+        if ch == "/" and (prev is None or prev in _REGEX_AFTER):
+            j = _skip_regex(src, i)
+            if j is not None:
+                i = j
+                prev = "regex"
+                continue
+
+        attached = doc if doc is not None and line - doc_end_line <= 1 else None
+        if _IDENT_START.match(ch):
+            text = _IDENT.match(src, i).group()
+            tokens.append(("ident", text, line, attached))
+        elif ch.isdigit():
+            text = _NUMBER.match(src, i).group()
+            tokens.append(("num", text, line, None))
+        else:
+            text = next((p for p in _PUNCT if src.startswith(p, i)), ch)
+            tokens.append(("punct", text, line, attached))
+        doc = None
+        prev = text
+        i += len(text)
+    return tokens
+
+
+def _skip_string(src: str, i: int, line: int) -> Tuple[int, int]:
+    quote = src[i]
+    i += 1
+    while i < len(src):
+        ch = src[i]
+        if ch == "\\":
+            i += 2
+            continue
+        if ch == quote:
+            return i + 1, line
+        if ch == "\n":
+            return i, line  # unterminated; let the newline be counted
+        i += 1
+    return i, line
+
+
+def _skip_template(src: str, i: int, line: int) -> Tuple[int, int]:
+    i += 1
+    while i < len(src):
+        ch = src[i]
+        if ch == "\\":
+            i += 2
+            continue
+        if ch == "\n":
+            line += 1
+        elif ch == "`":
+            return i + 1, line
+        elif src.startswith("${", i):
+            i, line = _skip_interpolation(src, i + 2, line)
+            continue
+        i += 1
+    return i, line
+
+
+def _skip_interpolation(src: str, i: int, line: int) -> Tuple[int, int]:
+    depth = 1
+    while i < len(src) and depth:
+        ch = src[i]
+        if ch in "'\"":
+            i, line = _skip_string(src, i, line)
+            continue
+        if ch == "`":
+            i, line = _skip_template(src, i, line)
+            continue
+        if ch == "\n":
+            line += 1
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+        i += 1
+    return i, line
+
+
+def _skip_regex(src: str, i: int) -> Optional[int]:
+    """End of a regex literal starting at i, or None if it isn't one."""
+    j, in_class = i + 1, False
+    while j < len(src):
+        ch = src[j]
+        if ch == "\n":
+            return None
+        if ch == "\\":
+            j += 2
+            continue
+        if ch == "[":
+            in_class = True
+        elif ch == "]":
+            in_class = False
+        elif ch == "/" and not in_class:
+            if j == i + 1:
+                return None  # "//" is a comment, handled elsewhere
+            j += 1
+            while j < len(src) and (src[j].isalnum() or src[j] == "_"):
+                j += 1  # flags
+            return j
+        j += 1
+    return None
+
+
+def _script_symbols(content: str) -> List[OutlineSymbol]:
+    tokens = _tokenize(content)
+    symbols: List[OutlineSymbol] = []
+    depth = 0  # braces
+    nesting = 0  # parens and brackets
+    open_bodies: List[Tuple[OutlineSymbol, int]] = []  # (symbol, depth its body closes back to)
+    class_bodies: Dict[int, OutlineSymbol] = {}  # brace depth inside a class body -> class
+    pending: Optional[Tuple[OutlineSymbol, int, int]] = None  # declared, body not yet opened
+    last_line = 1
+
+    def close_pending(end_line: int):
+        nonlocal pending
+        if pending is not None:
+            pending[0].end_line = max(pending[0].start_line, end_line)
+            pending = None
+
+    for index, (kind, text, line, doc) in enumerate(tokens):
+        prev_text = tokens[index - 1][1] if index else None
+        prev_line = tokens[index - 1][2] if index else 0
+        at_statement = nesting == 0 and (index == 0 or prev_text in (";", "{", "}") or line > prev_line)
+
+        if (kind == "ident" or text == "#") and at_statement and pending is None:
+            member_of = class_bodies.get(depth)
+            # Top-level declarations and class members only; locals stay inside their symbol
+            found = None
+            if member_of is not None or depth == 0:
+                found = _declaration(tokens, index, member_of is not None, depth == 0)
+            if found is not None:
+                name, symbol_kind = found
+                symbol = OutlineSymbol(
+                    name=name, kind=symbol_kind, start_line=line, end_line=line,
+                    doc=_first_line(doc), parent=member_of.name if member_of else None,
+                )
+                (member_of.children if member_of else symbols).append(symbol)
+                pending = (symbol, depth, nesting)
+
+        if kind != "punct":
+            last_line = line
+            continue
+
+        if text in "([":
+            nesting += 1
+        elif text in ")]":
+            nesting = max(0, nesting - 1)
+        elif text == "{":
+            if pending is not None and nesting == pending[2] and depth == pending[1]:
+                symbol = pending[0]
+                open_bodies.append((symbol, depth))
+                if symbol.kind == "class":
+                    class_bodies[depth + 1] = symbol
+                pending = None
+            depth += 1
+        elif text == "}":
+            depth = max(0, depth - 1)
+            class_bodies.pop(depth + 1, None)
+            if pending is not None and depth < pending[1]:
+                close_pending(last_line)
+            while open_bodies and open_bodies[-1][1] >= depth:
+                symbol, _ = open_bodies.pop()
+                symbol.end_line = line
+        elif text == ";" and pending is not None and nesting == pending[2] and depth == pending[1]:
+            close_pending(line)
+        last_line = line
+
+    close_pending(last_line)
+    for symbol, _ in open_bodies:
+        symbol.end_line = last_line
+    return symbols
+
+
+def _declaration(tokens, index: int, in_class: bool, top_level: bool) -> Optional[Tuple[str, str]]:
+    """(name, kind) if a declaration starts at tokens[index]."""
+    i = index
+    words = []
+    while i < len(tokens) and tokens[i][0] == "ident" and tokens[i][1] in _MODIFIERS:
+        # "get"/"set"/"async" can also be the member's own name: get() {}
+        if i + 1 < len(tokens) and tokens[i + 1][1] in ("(", "=", ":", "<"):
+            break
+        words.append(tokens[i][1])
+        i += 1
+    if i >= len(tokens):
+        return ("default", "function") if "default" in words else None
+
+    def at(k: int) -> str:
+        return tokens[k][1] if k < len(tokens) else ""
+
+    word = at(i)
+    if not in_class:
+        if word == "function":
+            j = i + 1 + (at(i + 1) == "*")
+            name = at(j) if j < len(tokens) and tokens[j][0] == "ident" else "default"
+            return name, "function"
+        if word in ("class", "interface", "enum") or (word == "type" and at(i + 2) in ("=", "<")):
+            name = at(i + 1)
+            if word == "class" and (name in ("extends", "implements", "{") or not name):
+                name = "default"
+            return name, word
+        if word in ("const", "let", "var") and i + 1 < len(tokens) and tokens[i + 1][0] == "ident":
+            name = at(i + 1)
+            value = i + 3 if at(i + 2) == "=" else _skip_type(tokens, i + 3) if at(i + 2) == ":" else len(tokens)
+            if _is_function_value(tokens, value):
+                return name, "function"
+            if top_level and ("export" in words or name.isupper()):
+                return name, "const"
+        if word == "default" or (words and words[-1] == "default" and word in ("(", "async")):
+            return "default", "function"
+        return None
+
+    # Class members: name(...) {, name<T>(...) {, name = (...) => ...
+    if tokens[i][0] != "ident" and word != "#":
+        return None
+    if word == "#":
+        i += 1
+        word = "#" + at(i)
+    if at(i + 1) in ("(", "<"):
+        return word, "method"
+    if at(i + 1) in ("=", ":") and _is_function_value(tokens, i + 2 if at(i + 1) == "=" else _skip_type(tokens, i + 2)):
+        return word, "method"
+    return None
+
+
+def _skip_type(tokens, i: int) -> int:
+    """Index of the "=" after a member's type annotation (or where it stopped)."""
+    nesting = 0
+    while i < len(tokens):
+        text = tokens[i][1]
+        if text in "([{<":
+            nesting += 1
+        elif text in ")]}>":
+            nesting -= 1
+        elif nesting <= 0 and text in ("=", ";"):
+            return i + 1 if text == "=" else i
+        i += 1
+    return i
+
+
+def _is_function_value(tokens, i: int) -> bool:
+    """Does an initializer starting at tokens[i] evaluate to a function?"""
+    if i >= len(tokens):
+        return False
+    text = tokens[i][1]
+    if text == "async":
+        i += 1
+        text = tokens[i][1] if i < len(tokens) else ""
+    if text == "function":
+        return True
+    if tokens[i][0] == "ident" and i + 1 < len(tokens) and tokens[i + 1][1] == "=>":
+        return True
+    if text == "<":  # generic arrow: <T>(x: T) => ...
+        return True
+    if text != "(":
+        # Wrapped components: memo(() => ...), forwardRef(function ...)
+        if tokens[i][0] == "ident" and i + 1 < len(tokens) and tokens[i + 1][1] == "(":
+            return _is_function_value(tokens, i + 2)
+        return False
+    depth = 0
+    while i < len(tokens):
+        text = tokens[i][1]
+        if text in "([":
+            depth += 1
+        elif text in ")]":
+            depth -= 1
+            if depth == 0:
+                nxt = tokens[i + 1][1] if i + 1 < len(tokens) else ""
+                if nxt == "=>":
+                    return True
+                if nxt == ":":  # return type annotation, then =>
+                    j = i + 2
+                    while j < len(tokens) and tokens[j][1] not in ("=>", ";", "{", "="):
+                        j += 1
+                    return j < len(tokens) and tokens[j][1] == "=>"
+                return False
+        elif text in ("{", "}", ";") and depth <= 0:
+            return False
+        i += 1
+    return False
@@ -2,7 +2,36 @@
 System prompts for the onboarding agent.
 """
 
-from typing import Optional, List, Dict
+from typing import Callable, Optional, List, Dict, Tuple
+
+import settings
+from token_budget import allocate_budget, count_tokens, truncate_to_tokens
+
+
+# How path segments and extensions are spoken (also used by speech_normalizer)
+SPEAKABLE_EXPANSIONS = {
+    "api": "API",
+    "mcp": "MCP",
+    "ts": "typescript",
+    "tsx": "TSX",
+    "js": "javascript", 
+    "jsx": "JSX",
+    "py": "python",
+    "src": "source",
+    "lib": "lib",
+    "utils": "utilities",
+    "config": "config",
+}
+
+
+# Only needed when speech_normalizer is off (SB_SPEECH_NORMALIZER=0)
+PRONUNCIATION_RULES = """- Say file names naturally ("route dot typescript", not "route.ts")
+- Never read slashes, paths or code symbols literally"""
+
+
+def pronunciation_rules() -> str:
+    """Rule lines for the LLM when nothing rewrites its output for speech, else ""."""
+    return "" if settings.SPEECH_NORMALIZER else "\n" + PRONUNCIATION_RULES
 
 
 def make_speakable_path(file_path: str) -> str:
@@ -19,19 +48,7 @@ def make_speakable_path(file_path: str) -> str:
     name, ext = filename.rsplit(".", 1) if "." in filename else (filename, "")
     
     # Expand common abbreviations
-    expansions = {
-        "api": "API",
-        "mcp": "MCP",
-        "ts": "typescript",
-        "tsx": "TSX",
-        "js": "javascript", 
-        "jsx": "JSX",
-        "py": "python",
-        "src": "source",
-        "lib": "lib",
-        "utils": "utilities",
-        "config": "config",
-    }
+    expansions = SPEAKABLE_EXPANSIONS
     
     ext_spoken = expansions.get(ext.lower(), ext)
     
@@ -45,6 +62,23 @@ def make_speakable_path(file_path: str) -> str:
         return f"{name} dot {ext_spoken}"
 
 
+# Total prompt budget and how spare tokens are shared between the sections
+# that can be shortened (everything else is always included in full)
+DEFAULT_PROMPT_TOKENS = 3000
+SECTION_PRIORITIES = {
+    "source": 3.0,
+    "file_knowledge": 3.0,
+    "features": 2.0,
+    "architecture": 1.0,
+    "tasks": 1.0,
+}
+# Headings and fences around each budgeted section body
+_SECTION_OVERHEAD_TOKENS = 16
+
+# File knowledge teaser included in the greeting task
+GREETING_KNOWLEDGE_TOKENS = 125
+
+
 def build_system_prompt(
     user_name: Optional[str],
     goal: Optional[str],
@@ -60,20 +94,159 @@ def build_system_prompt(
     architecture_doc: Optional[str] = None,
     setup_doc: Optional[str] = None,
     tasks_doc: Optional[str] = None,
+    token_budget: int = DEFAULT_PROMPT_TOKENS,
 ) -> str:
     """Build the system prompt for the agent with rich context."""
-    
+    return PromptBuilder(token_budget).build(
+        user_name, goal, experience_level, current_file, file_knowledge,
+        journey_files, current_step, total_steps, features_summary,
+        current_feature, current_file_content, architecture_doc, setup_doc,
+        tasks_doc,
+    )
+
+
+class PromptBuilder:
+    """Incremental build_system_prompt that only re-renders changed sections.
+
+    Fixed sections are always included; the rest share what is left of
+    `token_budget` by SECTION_PRIORITIES. Each section is cached with the
+    inputs (and token allowance) it was rendered from. Pass
+    `features_version` (bumped whenever the features change) so the features
+    summary is keyed by a number instead of being compared as a string.
+    After each build, `last_rebuilt` lists the sections that were rendered
+    and `last_token_count` is the size of the prompt.
+    """
+
+    def __init__(self, token_budget: int = DEFAULT_PROMPT_TOKENS):
+        self.token_budget = token_budget
+        self._sections: Dict[str, Tuple[tuple, str, int]] = {}
+        self._demands: Dict[str, Tuple[tuple, int]] = {}
+        self.last_rebuilt: List[str] = []
+        self.last_token_count = 0
+
+    def build(
+        self,
+        user_name: Optional[str],
+        goal: Optional[str],
+        experience_level: Optional[str],
+        current_file: Optional[str],
+        file_knowledge: Optional[str],
+        journey_files: list,
+        current_step: int = 0,
+        total_steps: int = 0,
+        features_summary: Optional[str] = None,
+        current_feature: Optional[Dict] = None,
+        current_file_content: Optional[str] = None,
+        architecture_doc: Optional[str] = None,
+        setup_doc: Optional[str] = None,
+        tasks_doc: Optional[str] = None,
+        features_version: Optional[int] = None,
+    ) -> str:
+        """Same arguments and output as build_system_prompt."""
+        sections = _system_prompt_sections(
+            user_name, goal, experience_level, current_file, file_knowledge,
+            journey_files, current_step, total_steps, features_summary,
+            current_feature, current_file_content, architecture_doc, tasks_doc,
+        )
+        self.last_rebuilt = []
+
+        # 1. Fixed sections, and how much every budgeted body would like
+        fixed_tokens = 0
+        demands = {}
+        body_keys = {}
+        for name, args, render, body in sections:
+            if body is None:
+                fixed_tokens += self._render(name, args, lambda: render(*args))[1]
+                continue
+            if not body:
+                continue
+            body_key = (features_version,) if name == "features" and features_version is not None else (body,)
+            body_keys[name] = body_key
+            cached = self._demands.get(name)
+            # Tuple comparison short-circuits on identity, so unchanged
+            # strings passed through from the store compare in O(1)
+            if cached is None or cached[0] != body_key:
+                cached = (body_key, count_tokens(body))
+                self._demands[name] = cached
+            demands[name] = cached[1]
+            fixed_tokens += _SECTION_OVERHEAD_TOKENS
+
+        # 2. Split what is left between the budgeted sections
+        allocation = allocate_budget(self.token_budget - fixed_tokens, demands, SECTION_PRIORITIES)
+
+        parts = []
+        total_tokens = 0
+        for name, args, render, body in sections:
+            if body is None:
+                # Already rendered above; this is a cache hit
+                text, tokens = self._render(name, args, lambda: render(*args))
+            elif not body or not allocation.get(name):
+                text, tokens = "", 0
+            else:
+                limit = allocation[name]
+                text, tokens = self._render(
+                    name, body_keys[name] + (limit,),
+                    lambda: render(truncate_to_tokens(body, limit)),
+                )
+            parts.append(text)
+            total_tokens += tokens
+
+        self.last_token_count = total_tokens
+        return "".join(parts)
+
+    def _render(self, name: str, key: tuple, produce: Callable[[], str]) -> Tuple[str, int]:
+        """Cached (text, tokens) for a section, re-rendered only when key changes."""
+        cached = self._sections.get(name)
+        if cached is None or cached[0] != key:
+            text = produce()
+            cached = (key, text, count_tokens(text))
+            self._sections[name] = cached
+            self.last_rebuilt.append(name)
+        return cached[1], cached[2]
+
+
+def _system_prompt_sections(
+    user_name, goal, experience_level, current_file, file_knowledge,
+    journey_files, current_step, total_steps, features_summary,
+    current_feature, current_file_content, architecture_doc, tasks_doc,
+) -> List[Tuple[str, tuple, Callable[..., str], Optional[str]]]:
+    """(name, inputs, renderer, budgeted body) for each section, in order.
+
+    Fixed sections have a body of None and render from their inputs alone;
+    budgeted ones are rendered with their body cut to the allotted tokens.
+    """
     name = user_name or "friend"
     level = experience_level or "intermediate"
     user_goal = goal or "understand this codebase"
-    
-    prompt = f"""You are an expert senior developer and mentor helping {name} onboard to this codebase.
+
+    has_knowledge = bool(current_file and file_knowledge and "No knowledge available" not in file_knowledge)
+    return [
+        ("about", (name, user_goal, level, current_step, total_steps), _about_section, None),
+        ("guidelines", (name, level), _guidelines_section, None),
+        ("architecture", (), _architecture_section, architecture_doc or ""),
+        ("features", (), _features_section, features_summary or ""),
+        ("current_file", (current_file, current_feature), _current_file_section, None),
+        ("file_knowledge", (), _file_knowledge_section, file_knowledge if has_knowledge else ""),
+        ("source", (), _source_section, (current_file_content or "") if current_file else ""),
+        ("journey", (name, tuple(journey_files or ())), _journey_section, None),
+        # Only beginners get suggested tasks
+        ("tasks", (), _tasks_section, (tasks_doc or "") if level == "beginner" else ""),
+        ("rules", (), _rules_section, None),
+    ]
+
+
+def _about_section(name: str, user_goal: str, level: str, current_step: int, total_steps: int) -> str:
+    return f"""You are an expert senior developer and mentor helping {name} onboard to this codebase.
 
 ## About {name}
 - **Goal**: {user_goal}
 - **Experience Level**: {level}
 - **Journey Progress**: Step {current_step} of {total_steps}
+"""
+
 
+def _guidelines_section(name: str, level: str) -> str:
+    return f"""
 ## Your Personality
 You're warm, encouraging, and genuinely excited to help. You explain things clearly using analogies and real-world examples. You celebrate small wins and make learning feel approachable.
 
@@ -86,68 +259,74 @@ You're warm, encouraging, and genuinely excited to help. You explain things clea
 - When the user wants to move on, the system handles it. Your job is to smoothly explain the NEW context once it arrives.
 """
 
-    # Add architecture context if available
-    if architecture_doc:
-        # Extract key sections
-        prompt += f"""
+
+def _architecture_section(architecture_doc: str) -> str:
+    return f"""
 ## Codebase Architecture
-{_truncate_section(architecture_doc, 1500)}
+{architecture_doc}
 """
 
-    # Add features summary if available
-    if features_summary:
-        prompt += f"""
+
+def _features_section(features_summary: str) -> str:
+    return f"""
 ## System Features (What This Codebase Does)
 {features_summary}
 """
 
-    # Add current context
-    if current_file:
-        prompt += f"""
+
+def _current_file_section(current_file: Optional[str], current_feature: Optional[Dict]) -> str:
+    if not current_file:
+        return ""
+
+    section = f"""
 ## Currently Viewing: {current_file}
 """
-        
-        # Add feature context if we know which feature this file belongs to
-        if current_feature:
-            prompt += f"""
+
+    # Add feature context if we know which feature this file belongs to
+    if current_feature:
+        section += f"""
 This file is part of the **{current_feature.get('name', 'Unknown')}** feature.
 """
-            user_flows = current_feature.get('userFlows', [])
-            if user_flows:
-                prompt += f"Users can: {', '.join(user_flows[:3])}\n"
+        user_flows = current_feature.get('userFlows', [])
+        if user_flows:
+            section += f"Users can: {', '.join(user_flows[:3])}\n"
+    return section
+
 
-        # Add file knowledge if available
-        if file_knowledge and "No knowledge available" not in file_knowledge:
-            prompt += f"""
+def _file_knowledge_section(file_knowledge: str) -> str:
+    return f"""
 ### What We Know About This File:
-{_truncate_section(file_knowledge, 800)}
+{file_knowledge}
 """
 
-        # Add raw file content if available
-        if current_file_content:
-            prompt += f"""
+
+def _source_section(current_file_content: str) -> str:
+    return f"""
 ### Source Code Preview:
 ```
-{_truncate_section(current_file_content, 2000)}
+{current_file_content}
 ```
 """
 
-    # Add journey context
-    if journey_files:
-        prompt += f"""
+
+def _journey_section(name: str, journey_files: tuple) -> str:
+    if not journey_files:
+        return ""
+    return f"""
 ## {name}'s Learning Journey
 Files in their path: {', '.join(journey_files[:6])}{'...' if len(journey_files) > 6 else ''}
 """
 
-    # Add tasks context if this is a beginner
-    if level == "beginner" and tasks_doc:
-        prompt += f"""
+
+def _tasks_section(tasks_doc: str) -> str:
+    return f"""
 ## Suggested Learning Tasks
-{_truncate_section(tasks_doc, 500)}
+{tasks_doc}
 """
 
-    # Add behavioral instructions
-    prompt += """
+
+def _rules_section() -> str:
+    return """
 ## What You Should Do
 1. **Greet warmly** - Make them feel welcome and excited
 2. **Explain the current file** - What it does, why it matters, how it fits
@@ -164,8 +343,6 @@ Files in their path: {', '.join(journey_files[:6])}{'...' if len(journey_files)
 Remember: You have real knowledge about this codebase. Use it! Reference specific features, files, and patterns when relevant.
 """
 
-    return prompt
-
 
 def build_greeting_prompt(
     user_name: Optional[str],
@@ -194,16 +371,14 @@ Generate a warm, personal greeting that:
 4. Asks if they're ready to start
 
 IMPORTANT RULES:
-- When speaking file names, say them naturally (e.g., "route dot typescript" not "route.ts")
-- Do NOT read slashes or special characters literally
 - Keep it to 2-3 short sentences
-- Be warm and conversational, not formal"""
+- Be warm and conversational, not formal{pronunciation_rules()}"""
 
     if first_file and first_file_knowledge:
         prompt += f"""
 
 CONTEXT ABOUT THIS FILE:
-{first_file_knowledge[:500]}
+{truncate_to_tokens(first_file_knowledge, GREETING_KNOWLEDGE_TOKENS)}
 
 Use this context to give a specific teaser about what this file does."""
 
@@ -234,11 +409,7 @@ Your transition should:
 IMPORTANT: 
 - DO NOT ask "Are you ready?" or "Shall we move on?" - we are ALREADY moving.
 - DO NOT ask for the file path; you already have it.
-- DO NOT list other files in the journey; just focus on the transition to {to_speakable}.
-- When speaking file names, say them naturally:
-  - Say "route dot typescript" not "route.ts"
-  - Say "features dot typescript" not "features.ts"  
-  - Never read slashes or paths literally
+- DO NOT list other files in the journey; just focus on the transition to {to_speakable}.{pronunciation_rules()}
 
 Make it feel like a natural conversation, not a lecture."""
 
@@ -250,15 +421,3 @@ Make it feel like a natural conversation, not a lecture."""
 
     return prompt
 
-
-def _truncate_section(content: str, max_chars: int) -> str:
-    """Truncate content to max_chars while preserving whole lines."""
-    if len(content) <= max_chars:
-        return content
-    
-    truncated = content[:max_chars]
-    last_newline = truncated.rfind('\n')
-    if last_newline > max_chars // 2:
-        truncated = truncated[:last_newline]
-    
-    return truncated + "\n..."
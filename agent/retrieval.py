@@ -0,0 +1,264 @@
+"""
+BM25 retrieval over the session's knowledge files and features.
+
+Knowledge files are split into snippets (one per markdown section, long
+sections in several pieces) and every feature is one snippet. Sources are
+staged as they arrive and indexed in small slices, so a large knowledge
+push never stalls the event loop; a search indexes whatever is still
+staged first. Scoring walks the posting lists of the query terms only,
+each one vectorized with NumPy.
+"""
+
+import asyncio
+import math
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from token_budget import count_tokens
+
+# BM25 term-frequency saturation and length normalisation
+K1 = 1.2
+B = 0.75
+
+# Words per snippet before a section is split
+SNIPPET_WORDS = 120
+
+# Rebuild posting lists once removed snippets outnumber live ones
+_COMPACT_RATIO = 1.0
+
+_WORD = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+_HEADING = re.compile(r"^#{1,6}\s+(.*)$", re.MULTILINE)
+_STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from has have how i if in into is it its "
+    "me my of on or so that the their then there these this to was we what when where which "
+    "who why will with you your".split()
+)
+
+
+def terms(text: str) -> List[str]:
+    """Index terms: words split at camelCase / snake_case, lowercased, lightly stemmed."""
+    result = []
+    for word in _WORD.findall(text):
+        word = word.lower()
+        if word in _STOPWORDS or len(word) < 2:
+            continue
+        for suffix in ("ing", "ed", "es", "s"):
+            if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+                word = word[:-len(suffix)]
+                break
+        result.append(word)
+    return result
+
+
+@dataclass
+class Snippet:
+    source: str  # knowledge file path, or "feature:<key>"
+    label: str  # where it came from, as shown to the LLM
+    text: str
+    _tokens: int = -1
+
+    @property
+    def tokens(self) -> int:
+        if self._tokens < 0:
+            self._tokens = count_tokens(self.text)
+        return self._tokens
+
+
+def knowledge_snippets(path: str, markdown: str) -> List[Snippet]:
+    """Split a knowledge file into per-section snippets of at most SNIPPET_WORDS words."""
+    snippets = []
+    starts = [m.start() for m in _HEADING.finditer(markdown)]
+    bounds = zip([0] + starts, starts + [len(markdown)])
+    for start, end in bounds:
+        section = markdown[start:end].strip()
+        if not section:
+            continue
+        heading = _HEADING.match(section)
+        label = f"{path} > {heading.group(1).strip()}" if heading else path
+        words = section.split()
+        for i in range(0, len(words), SNIPPET_WORDS):
+            snippets.append(Snippet(path, label, " ".join(words[i:i + SNIPPET_WORDS])))
+    return snippets
+
+
+def feature_snippet(key: str, feature: Dict) -> Snippet:
+    parts = [f"{feature.get('name', 'Unknown')} ({feature.get('category', 'Other')})."]
+    if feature.get("description"):
+        parts.append(feature["description"])
+    if feature.get("userFlows"):
+        parts.append("User can: " + ", ".join(feature["userFlows"]) + ".")
+    if feature.get("files"):
+        parts.append("Files: " + ", ".join(feature["files"]) + ".")
+    return Snippet(f"feature:{key}", f"feature {feature.get('name', key)}", " ".join(parts))
+
+
+class RetrievalIndex:
+    """Incremental BM25 inverted index over snippets.
+
+    `stage()` / `unstage()` queue a source's snippets (or their removal);
+    `flush()` indexes queued sources, `warm()` does so in slices from a
+    background task. Replacing a source removes its old snippets first;
+    removed snippets stay in the posting lists, masked out, until enough
+    pile up to compact.
+    """
+
+    def __init__(self):
+        self._term_ids: Dict[str, int] = {}
+        self._postings: List[Tuple[List[int], List[int]]] = []  # term -> (snippet ids, term frequencies)
+        self._arrays: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}  # term -> postings as arrays, built lazily
+        self._df: List[int] = []  # live snippets containing each term
+        self._snippets: List[Optional[Snippet]] = []  # id -> snippet, None once removed
+        self._snippet_terms: List[Tuple[int, ...]] = []  # id -> distinct terms, for removal
+        self._lengths: List[int] = []
+        self._lengths_array: Optional[np.ndarray] = None  # with _live_mask, rebuilt after changes
+        self._live_mask: Optional[np.ndarray] = None
+        self._live_length = 0
+        self._live = 0
+        self._by_source: Dict[str, List[int]] = {}
+        self._texts: Dict[str, Tuple[str, ...]] = {}  # source -> snippet texts, to skip unchanged ones
+        self._staged: Dict[str, Optional[List[Snippet]]] = {}  # insertion-ordered; None = remove
+
+    def __len__(self) -> int:
+        return self._live
+
+    @property
+    def staged(self) -> int:
+        return len(self._staged)
+
+    def stage(self, source: str, snippets: List[Snippet]):
+        """Queue (re)indexing of a source; a no-op when its snippets didn't change."""
+        if source not in self._staged and self._texts.get(source) == tuple(s.text for s in snippets):
+            return
+        self._staged[source] = snippets
+
+    def unstage(self, source: str):
+        """Queue removal of a source."""
+        if source in self._by_source or source in self._staged:
+            self._staged[source] = None
+
+    def sources(self) -> Iterable[str]:
+        """Indexed and staged sources (staged removals excluded)."""
+        indexed = (source for source in self._by_source if source not in self._staged)
+        staged = (source for source, snippets in self._staged.items() if snippets is not None)
+        return list(indexed) + list(staged)
+
+    def flush(self, limit: Optional[int] = None) -> int:
+        """Index up to `limit` staged sources (all by default); returns how many are left."""
+        while self._staged and (limit is None or limit > 0):
+            source = next(iter(self._staged))
+            snippets = self._staged.pop(source)
+            self._remove(source)
+            if snippets:
+                for snippet in snippets:
+                    self._add(snippet)
+                self._texts[source] = tuple(s.text for s in snippets)
+            if limit is not None:
+                limit -= 1
+        if len(self._snippets) - self._live > max(64, self._live * _COMPACT_RATIO):
+            self._compact()
+        return len(self._staged)
+
+    async def warm(self, slice_size: int = 8):
+        """Index everything staged, yielding to the event loop between slices."""
+        while self.flush(slice_size):
+            await asyncio.sleep(0)
+
+    def search(self, query: str, k: int = 4, token_budget: int = 400, exclude: Iterable[str] = ()) -> List[Snippet]:
+        """Best-scoring snippets for `query`, at most `k` and `token_budget` tokens in total."""
+        self.flush()
+        query_terms = [self._term_ids[t] for t in set(terms(query)) if t in self._term_ids]
+        if not query_terms or not self._live:
+            return []
+
+        if self._lengths_array is None:
+            self._lengths_array = np.asarray(self._lengths, dtype=np.float32)
+            self._live_mask = np.asarray([s is not None for s in self._snippets])
+        lengths = self._lengths_array
+        average_length = self._live_length / self._live
+        scores = np.zeros(len(self._snippets), dtype=np.float32)
+        for term in query_terms:
+            df = self._df[term]
+            if not df:
+                continue
+            docs, tfs = self._posting_arrays(term)
+            idf = math.log(1 + (self._live - df + 0.5) / (df + 0.5))
+            norm = K1 * (1 - B + B * lengths[docs] / average_length)
+            scores[docs] += idf * tfs * (K1 + 1) / (tfs + norm)
+
+        for source in exclude:
+            scores[self._by_source.get(source, [])] = 0
+        candidates = np.flatnonzero((scores > 0) & self._live_mask)
+        if len(candidates) > k * 4:
+            # Only the best few can make it; skip sorting the rest
+            candidates = candidates[np.argpartition(scores[candidates], -k * 4)[-k * 4:]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+
+        picked, used = [], 0
+        for snippet_id in candidates:
+            snippet = self._snippets[snippet_id]
+            if used + snippet.tokens > token_budget:
+                continue
+            picked.append(snippet)
+            used += snippet.tokens
+            if len(picked) >= k:
+                break
+        return picked
+
+    def _posting_arrays(self, term: int) -> Tuple[np.ndarray, np.ndarray]:
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            docs, tfs = self._postings[term]
+            arrays = (np.asarray(docs, dtype=np.int64), np.asarray(tfs, dtype=np.float32))
+            self._arrays[term] = arrays
+        return arrays
+
+    def _add(self, snippet: Snippet):
+        snippet_id = len(self._snippets)
+        counts: Dict[int, int] = {}
+        words = terms(snippet.label) + terms(snippet.text)
+        for word in words:
+            term = self._term_ids.get(word)
+            if term is None:
+                term = self._term_ids[word] = len(self._postings)
+                self._postings.append(([], []))
+                self._df.append(0)
+            counts[term] = counts.get(term, 0) + 1
+        for term, count in counts.items():
+            docs, tfs = self._postings[term]
+            docs.append(snippet_id)
+            tfs.append(count)
+            self._df[term] += 1
+            self._arrays.pop(term, None)
+        self._snippets.append(snippet)
+        self._snippet_terms.append(tuple(counts))
+        self._lengths.append(len(words))
+        self._lengths_array = None
+        self._live += 1
+        self._live_length += len(words)
+        self._by_source.setdefault(snippet.source, []).append(snippet_id)
+
+    def _remove(self, source: str):
+        self._texts.pop(source, None)
+        for snippet_id in self._by_source.pop(source, ()):
+            self._snippets[snippet_id] = None
+            for term in self._snippet_terms[snippet_id]:
+                self._df[term] -= 1
+            self._live -= 1
+            self._live_length -= self._lengths[snippet_id]
+            self._lengths_array = None
+
+    def _compact(self):
+        """Rebuild the posting lists from live snippets only."""
+        live = [snippet for snippet in self._snippets if snippet is not None]
+        texts, staged = self._texts, self._staged
+        self.__init__()
+        for snippet in live:
+            self._add(snippet)
+        self._texts, self._staged = texts, staged
+
+
+def format_snippets(snippets: List[Snippet]) -> str:
+    return "\n".join(f"- [{snippet.label}] {snippet.text}" for snippet in snippets)
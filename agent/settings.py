@@ -0,0 +1,116 @@
+"""
+Runtime tuning knobs for the agent, read from the environment.
+"""
+
+import os
+import tempfile
+from typing import Dict
+
+
+def _env_int(name: str, default: int) -> int:
+    """Read an integer env var, falling back to default when unset or invalid."""
+    value = os.environ.get(name)
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        print(f"[Settings] Ignoring invalid {name}={value!r}, using {default}")
+        return default
+
+
+def _env_map(name: str) -> Dict[str, str]:
+    """Read "key=value,key=value" pairs from an env var."""
+    result = {}
+    for item in os.environ.get(name, "").split(","):
+        key, sep, value = item.partition("=")
+        if sep and key.strip():
+            result[key.strip()] = value.strip()
+    return result
+
+
+# How many journey files on each side of the current one to prefetch
+PREFETCH_DEPTH = _env_int("SB_PREFETCH_DEPTH", 1)
+
+# Upper bound on file contents kept in memory per session
+FILE_CACHE_BYTES = _env_int("SB_FILE_CACHE_BYTES", 8 * 1024 * 1024)
+
+# Lines of each requested file to transfer (0 = whole file); the prompt only
+# ever shows the top of a file, so there is no point pulling the rest
+FILE_WINDOW_LINES = _env_int("SB_FILE_WINDOW_LINES", 120)
+
+# Show Python / TS / JS files to the LLM as a symbol outline plus the most
+# relevant bodies (0 = raw top of the file). Outlined files are transferred
+# up to OUTLINE_MAX_LINES, since symbols anywhere in them may be quoted;
+# longer files, and files over OUTLINE_MAX_BYTES, show their top instead.
+SOURCE_OUTLINES = _env_int("SB_SOURCE_OUTLINES", 1)
+OUTLINE_MAX_LINES = _env_int("SB_OUTLINE_MAX_LINES", 3000)
+OUTLINE_MAX_BYTES = _env_int("SB_OUTLINE_MAX_BYTES", 256 * 1024)
+
+# How long the greeting waits for the features and first file once the
+# session has arrived; past that it greets with what it has
+GREETING_GRACE_MS = _env_int("SB_GREETING_GRACE_MS", 200)
+
+# Token budget for the system prompt; sections are shortened to fit
+PROMPT_TOKEN_BUDGET = _env_int("SB_PROMPT_TOKEN_BUDGET", 3000)
+
+# Process-wide store of features and knowledge files shared by sessions;
+# blobs no session holds are evicted past this budget
+KNOWLEDGE_STORE_BYTES = _env_int("SB_KNOWLEDGE_STORE_BYTES", 64 * 1024 * 1024)
+
+# Knowledge snippets retrieved for each user turn, and their token budget
+# (0 = no retrieval)
+RETRIEVAL_TOP_K = _env_int("SB_RETRIEVAL_TOP_K", 4)
+RETRIEVAL_TOKENS = _env_int("SB_RETRIEVAL_TOKENS", 400)
+
+# Rewrite paths, identifiers and code symbols in replies into speakable text
+# on the way to the TTS (0 = speak the LLM output as is)
+SPEECH_NORMALIZER = _env_int("SB_SPEECH_NORMALIZER", 1)
+
+# On-disk cache of synthesized speech shared by every session on the machine
+# (0 = disabled)
+TTS_CACHE_BYTES = _env_int("SB_TTS_CACHE_BYTES", 256 * 1024 * 1024)
+TTS_CACHE_DIR = os.environ.get("SB_TTS_CACHE_DIR", os.path.join(tempfile.gettempdir(), "sb-tts-cache"))
+
+# Process-wide cache of classified short utterances (NEXT / BACK / OTHER)
+INTENT_CACHE_SIZE = _env_int("SB_INTENT_CACHE_SIZE", 2048)
+INTENT_CACHE_TTL_SECONDS = _env_int("SB_INTENT_CACHE_TTL", 3600)
+
+# Keep-alive connections in the worker's shared OpenAI HTTP pool
+OPENAI_MAX_CONNECTIONS = _env_int("SB_OPENAI_MAX_CONNECTIONS", 50)
+
+# Background tasks (classification, navigation, prefetch) one session may run at once
+MAX_SESSION_TASKS = _env_int("SB_MAX_SESSION_TASKS", 8)
+
+# UI commands issued within this window go out as one packet
+UI_BATCH_MS = _env_int("SB_UI_BATCH_MS", 16)
+
+# Prepare the transition to the next file (content, prompt and reply text)
+# while the user is on the current one (0 = generate it on "next")
+SPECULATIVE_TRANSITIONS = _env_int("SB_SPECULATIVE_TRANSITIONS", 1)
+
+# Worker admission control. Load is measured against these budgets, 1.0
+# meaning one is used up: CPU of the worker and its job processes (percent of
+# the cores available to the container), p95 event-loop lag of the worst
+# session, and their RSS (0 = 80% of the container's memory). CPU and lag
+# budgets of 0 leave them out.
+LOAD_CPU_PERCENT = _env_int("SB_LOAD_CPU_PERCENT", 80)
+LOAD_LAG_MS = _env_int("SB_LOAD_LAG_MS", 100)
+LOAD_RSS_MB = _env_int("SB_LOAD_RSS_MB", 0)
+
+# Load (percent) past which the worker stops being offered jobs while its
+# sessions carry on; jobs offered anyway are rejected if one more session
+# would overrun a budget, or past MAX_SESSIONS sessions (0 = no cap)
+LOAD_DRAIN_PERCENT = _env_int("SB_LOAD_DRAIN_PERCENT", 70)
+MAX_SESSIONS = _env_int("SB_MAX_SESSIONS", 0)
+
+# Local OpenMetrics endpoint for latency histograms (0 = disabled). The
+# worker process serves it, merging the histograms of all its job processes.
+METRICS_PORT = _env_int("SB_METRICS_PORT", 0)
+
+# Structured logging: default level, per-category levels and sample rates,
+# e.g. SB_LOG_LEVELS="data=debug" SB_LOG_SAMPLE="data=0.1"
+LOG_LEVEL = os.environ.get("SB_LOG_LEVEL", "info")
+LOG_LEVELS = _env_map("SB_LOG_LEVELS")
+LOG_SAMPLE = _env_map("SB_LOG_SAMPLE")
+LOG_QUEUE_SIZE = _env_int("SB_LOG_QUEUE_SIZE", 10000)
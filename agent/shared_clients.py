@@ -0,0 +1,37 @@
+"""
+Model clients shared by every session running in a worker process.
+"""
+
+import asyncio
+import weakref
+
+import httpx
+from openai import AsyncOpenAI
+
+import settings
+from structured_log import get_logger
+
+log = get_logger("clients")
+
+# One client per event loop: httpx connections can't move between loops
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = weakref.WeakKeyDictionary()
+
+
+def get_openai_client() -> AsyncOpenAI:
+    """AsyncOpenAI client backed by a keep-alive connection pool."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = AsyncOpenAI(
+            http_client=httpx.AsyncClient(
+                timeout=httpx.Timeout(30.0, connect=5.0),
+                limits=httpx.Limits(
+                    max_connections=settings.OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.OPENAI_MAX_CONNECTIONS,
+                    keepalive_expiry=120.0,
+                ),
+            ),
+        )
+        _clients[loop] = client
+        log.info("Created shared OpenAI client", pool_size=settings.OPENAI_MAX_CONNECTIONS)
+    return client
@@ -0,0 +1,81 @@
+"""
+Work prepared for one session before it is asked for.
+"""
+
+import asyncio
+from typing import Any, Coroutine, Dict, Hashable, Optional
+
+from structured_log import get_logger
+from task_supervisor import TaskSupervisor
+
+
+class Speculation:
+    """One result produced ahead of time, used only if nothing changed since.
+
+    `prepare(key, coro)` runs coro in the background for the state described
+    by `key`, which must change whenever the result would. Preparing again
+    for the same key is a no-op; for another key it replaces the old
+    speculation. `take(key)` hands the result over if it was prepared for
+    that key, waiting for it if it is still in flight, and returns None
+    otherwise (the caller does the work itself). `discard()` drops it when
+    the state it was built from changes in a way the key can't see.
+    """
+
+    def __init__(self, tasks: TaskSupervisor, name: str):
+        self.tasks = tasks
+        self.name = name
+        self._key: Optional[Hashable] = None
+        self._task: Optional[asyncio.Task] = None
+        self.log = get_logger("speculation", kind=name)
+        self.prepared = 0
+        self.hits = 0
+        self.misses = 0
+        self.discarded = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "prepared": self.prepared,
+            "hits": self.hits,
+            "misses": self.misses,
+            "discarded": self.discarded,
+        }
+
+    def prepare(self, key: Hashable, coro: Coroutine):
+        if self._task is not None and self._key == key and not self._task.cancelled():
+            coro.close()
+            return
+        self.discard()
+        task = self.tasks.spawn(coro, group=f"speculate-{self.name}", supersede=True)
+        if task is not None:
+            self._key, self._task = key, task
+            self.prepared += 1
+
+    def discard(self, reason: Optional[str] = None):
+        if self._task is None:
+            return
+        self._task.cancel()
+        self._key = self._task = None
+        self.discarded += 1
+        if reason:
+            self.log.debug("Discarded speculation", reason=reason)
+
+    async def take(self, key: Hashable) -> Optional[Any]:
+        task, prepared_for = self._task, self._key
+        self._key = self._task = None
+        if task is None or prepared_for != key:
+            if task is not None:
+                task.cancel()
+            self.misses += 1
+            return None
+
+        try:
+            # wait() doesn't raise if the task failed or was cancelled
+            await asyncio.wait({task})
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        if task.cancelled() or task.exception() is not None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return task.result()
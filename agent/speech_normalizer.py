@@ -0,0 +1,143 @@
+"""
+Streaming rewrite of LLM output into text a TTS reads naturally.
+
+File paths, file names, identifiers and code operators are spoken the way a
+developer would say them ("route dot typescript, in the source api folder",
+"get feature for file", "arrow") instead of being read out character by
+character. Text is rewritten one word at a time: a chunk is passed on up to
+its last whitespace and only the word still being written is held back,
+since the next token may turn "route" into "route.ts".
+"""
+
+import re
+from typing import AsyncIterable, AsyncIterator, Optional, Union
+
+from prompts import SPEAKABLE_EXPANSIONS, make_speakable_path
+
+# Extensions that mark a token as a file name
+FILE_EXTENSIONS = frozenset(
+    "ts tsx js jsx mjs cjs py pyi json md mdx css scss html yml yaml toml sh rs go java rb sql txt env lock".split()
+)
+
+OPERATORS = {
+    "=>": "arrow",
+    "->": "arrow",
+    "===": "equals",
+    "==": "equals",
+    "!==": "not equals",
+    "!=": "not equals",
+    "&&": "and",
+    "||": "or",
+    "??": "or else",
+    "++": "plus plus",
+}
+
+# Longest word held back waiting for whitespace; past it the word is let go as is
+MAX_HELD_CHARS = 80
+
+_WHITESPACE = re.compile(r"\s")
+_EDGES = re.compile(r"^([\"'(\[{*`]*)(.*?)([\"')\]}*`.,;:!?]*)$", re.DOTALL)
+_IDENTIFIER = re.compile(r"^[A-Za-z_$][\w$]*$")
+_CAMEL_PARTS = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+
+def speak_identifier(name: str) -> str:
+    """camelCase / snake_case / kebab-case name as separate words."""
+    words = _CAMEL_PARTS.findall(name)
+    return " ".join(SPEAKABLE_EXPANSIONS.get(word.lower(), word) for word in words) or name
+
+
+def _is_code_identifier(word: str) -> bool:
+    if not _IDENTIFIER.match(word):
+        return False
+    return "_" in word.strip("_") or bool(re.search(r"[a-z][A-Z]", word)) or word.startswith("__")
+
+
+def speak_word(word: str) -> str:
+    """Speakable form of one whitespace-delimited word (punctuation around it kept)."""
+    match = _EDGES.match(word.replace("()", ""))
+    lead, core, trail = match.groups()
+    if not core or "://" in core:
+        return word
+    lead = lead.replace("`", "").replace("*", "")
+    trail = trail.replace("`", "").replace("*", "")
+
+    if core in OPERATORS:
+        return f"{lead}{OPERATORS[core]}{trail}"
+
+    if "/" in core:
+        name = core.rstrip("/").rsplit("/", 1)[-1]
+        if "." in name and name.rsplit(".", 1)[1].lower() in FILE_EXTENSIONS:
+            return f"{lead}{make_speakable_path(core.lstrip('./'))}{trail}"
+        if all(_IDENTIFIER.match(part) or part in (".", "..") for part in core.strip("/").split("/") if part):
+            folders = [SPEAKABLE_EXPANSIONS.get(p.lower(), p) for p in core.strip("/").split("/") if p not in ("", ".", "..")]
+            return f"{lead}{' '.join(folders)}{trail}"
+        return f"{lead}{core}{trail}"
+
+    if "." in core:
+        stem, ext = core.rsplit(".", 1)
+        if ext.lower() in FILE_EXTENSIONS and (not stem or _IDENTIFIER.match(stem.replace("-", "_").replace(".", "_"))):
+            spoken_ext = SPEAKABLE_EXPANSIONS.get(ext.lower(), ext)
+            return f"{lead}{stem + ' ' if stem else ''}dot {spoken_ext}{trail}"
+        parts = core.split(".")
+        # Member access (self.context, knowledge_store.store); skips "e.g" and "1.5"
+        if len(parts) > 1 and all(_IDENTIFIER.match(p) and len(p) > 1 for p in parts):
+            return f"{lead}{' dot '.join(speak_identifier(p) for p in parts)}{trail}"
+        return f"{lead}{core}{trail}"
+
+    if _is_code_identifier(core):
+        return f"{lead}{speak_identifier(core)}{trail}"
+    return f"{lead}{core}{trail}"
+
+
+class SpeechNormalizer:
+    """Incremental speak_word over a stream of text chunks.
+
+    `push()` returns the rewritten text that is complete so far (everything
+    up to the last whitespace); `flush()` returns the rest at the end.
+    """
+
+    def __init__(self):
+        self._held = ""
+
+    def push(self, chunk: str) -> str:
+        text = self._held + chunk
+        cut = max(text.rfind(" "), text.rfind("\n"), text.rfind("\t"))
+        if cut < 0:
+            if len(text) > MAX_HELD_CHARS:
+                self._held = ""
+                return text
+            self._held = text
+            return ""
+        self._held = text[cut + 1:]
+        return self._rewrite(text[:cut + 1])
+
+    def flush(self) -> str:
+        text, self._held = self._held, ""
+        return self._rewrite(text)
+
+    @staticmethod
+    def _rewrite(text: str) -> str:
+        parts = re.split(r"(\s+)", text)
+        return "".join(part if not part or _WHITESPACE.match(part) else speak_word(part) for part in parts)
+
+
+async def normalize_speech(text: AsyncIterable[Union[str, object]]) -> AsyncIterator[Union[str, object]]:
+    """Normalize text from the LLM on its way to the TTS.
+
+    Anything that isn't a string (the framework's flush markers) ends the
+    current word and is passed through in order.
+    """
+    normalizer = SpeechNormalizer()
+    async for chunk in text:
+        if isinstance(chunk, str):
+            ready: Optional[str] = normalizer.push(chunk)
+        else:
+            ready = normalizer.flush()
+        if ready:
+            yield ready
+        if not isinstance(chunk, str):
+            yield chunk
+    tail = normalizer.flush()
+    if tail:
+        yield tail
@@ -0,0 +1,153 @@
+"""
+Queue-backed structured logging that keeps stdout off the event loop.
+
+Callers only check the level/sample and enqueue a tuple; a writer thread
+builds the JSON line and writes it. Each line carries the category, the
+message and any bound fields (session, room, ...):
+
+    {"ts": 1700000000.123, "level": "info", "category": "context",
+     "msg": "Received session", "session": "1a2b3c4d", "room": "onboard-x",
+     "user": "Ada"}
+
+Levels and sampling are per category (see settings.LOG_LEVEL, LOG_LEVELS
+and LOG_SAMPLE), so chatty debug traces can be switched on without edits.
+"""
+
+import atexit
+import json
+import queue
+import random
+import sys
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import settings
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+_LEVEL_NAMES = {DEBUG: "debug", INFO: "info", WARNING: "warning", ERROR: "error"}
+_LEVELS_BY_NAME = {name: level for level, name in _LEVEL_NAMES.items()}
+
+
+def _parse_level(name: str, default: int = INFO) -> int:
+    return _LEVELS_BY_NAME.get(name.strip().lower(), default)
+
+
+_default_level = _parse_level(settings.LOG_LEVEL)
+_category_levels = {category: _parse_level(level) for category, level in settings.LOG_LEVELS.items()}
+_category_samples: Dict[str, float] = {}
+for _category, _rate in settings.LOG_SAMPLE.items():
+    try:
+        _category_samples[_category] = min(max(float(_rate), 0.0), 1.0)
+    except ValueError:
+        pass
+
+
+class _Writer:
+    """Daemon thread draining log records to stdout."""
+
+    def __init__(self, max_queued: int):
+        self.queue: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=max_queued)
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name="structured-log", daemon=True)
+        self._thread.start()
+
+    def put(self, record: tuple):
+        """Queue a record, tagged with how many were dropped since the last one got through."""
+        dropped = self.dropped
+        try:
+            self.queue.put_nowait(record + (dropped,))
+        except queue.Full:
+            # Never block the loop on a slow stdout; count what we lose
+            self.dropped += 1
+            return
+        # Subtract rather than reset: drops counted meanwhile by other threads stay
+        self.dropped -= dropped
+
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                break
+            try:
+                sys.stdout.write(_format(record) + "\n")
+                if self.queue.empty():
+                    sys.stdout.flush()
+            except Exception:
+                pass  # logging must never take the worker down
+
+    def close(self, timeout: float = 1.0):
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+
+def _format(record: tuple) -> str:
+    ts, level, category, message, fields, dropped = record
+    line: Dict[str, Any] = {
+        "ts": round(ts, 3),
+        "level": _LEVEL_NAMES.get(level, str(level)),
+        "category": category,
+        "msg": message,
+    }
+    line.update(fields)
+    if dropped:
+        line["dropped_before"] = dropped
+    return json.dumps(line, default=str, ensure_ascii=False)
+
+
+_writer = _Writer(settings.LOG_QUEUE_SIZE)
+atexit.register(_writer.close)
+
+
+class StructuredLogger:
+    """Logger for one category with bound fields (session, room, ...)."""
+
+    __slots__ = ("category", "fields", "level", "sample")
+
+    def __init__(self, category: str, fields: Optional[Dict[str, Any]] = None):
+        self.category = category
+        self.fields = fields or {}
+        self.level = _category_levels.get(category, _default_level)
+        self.sample = _category_samples.get(category, 1.0)
+
+    def bind(self, **fields: Any) -> "StructuredLogger":
+        """Same category with extra bound fields."""
+        return StructuredLogger(self.category, {**self.fields, **fields})
+
+    def child(self, category: str) -> "StructuredLogger":
+        """Different category, same bound fields."""
+        return StructuredLogger(category, dict(self.fields))
+
+    def is_enabled(self, level: int) -> bool:
+        return level >= self.level
+
+    def debug(self, message: str, **fields: Any):
+        self._log(DEBUG, message, fields)
+
+    def info(self, message: str, **fields: Any):
+        self._log(INFO, message, fields)
+
+    def warning(self, message: str, **fields: Any):
+        self._log(WARNING, message, fields)
+
+    def error(self, message: str, **fields: Any):
+        self._log(ERROR, message, fields)
+
+    def _log(self, level: int, message: str, fields: Dict[str, Any]):
+        if level < self.level:
+            return
+        # Sampling only thins out routine traces; warnings and errors always go out
+        if level < WARNING and self.sample < 1.0 and random.random() >= self.sample:
+            return
+        _writer.put((time.time(), level, self.category, message, {**self.fields, **fields}))
+
+
+def get_logger(category: str, **fields: Any) -> StructuredLogger:
+    return StructuredLogger(category, fields)
@@ -0,0 +1,109 @@
+"""
+Supervised background tasks for one agent session.
+"""
+
+import asyncio
+from typing import Coroutine, Dict, Optional
+
+from structured_log import get_logger
+
+
+class TaskSupervisor:
+    """Owns every background task a session starts.
+
+    Tasks are spawned into named groups. Spawning with `supersede=True`
+    cancels the group's older tasks first (a newer utterance makes a pending
+    classification stale). At most `max_in_flight` tasks run at once: when
+    full, the oldest supersedable task is cancelled to make room, otherwise
+    the new task is dropped. `drain()` cancels whatever is left.
+    """
+
+    def __init__(self, max_in_flight: int = 8, name: str = "session"):
+        self.max_in_flight = max_in_flight
+        self.name = name
+        self._tasks: Dict[asyncio.Task, str] = {}  # insertion-ordered: oldest first
+        self._supersedable = set()
+        self._closed = False
+        self.log = get_logger("tasks", supervisor=name)
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._tasks),
+            "started": self.started,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "dropped": self.dropped,
+        }
+
+    def spawn(self, coro: Coroutine, group: str = "default", supersede: bool = False) -> Optional[asyncio.Task]:
+        """Run coro as a supervised task; returns None if it was dropped."""
+        if self._closed:
+            coro.close()
+            self.dropped += 1
+            return None
+
+        if supersede:
+            self.cancel_group(group)
+
+        if len(self._tasks) >= self.max_in_flight:
+            victim = next((t for t in self._tasks if t in self._supersedable), None)
+            if victim is None:
+                self.log.warning("Too many tasks in flight, dropping new task", in_flight=len(self._tasks), group=group)
+                coro.close()
+                self.dropped += 1
+                return None
+            victim.cancel()
+            # Forget it now so the slot is free; the done callback still counts it
+            self._forget(victim)
+
+        task = asyncio.create_task(coro)
+        self._tasks[task] = group
+        if supersede:
+            self._supersedable.add(task)
+        self.started += 1
+        task.add_done_callback(self._on_done)
+        return task
+
+    def cancel_group(self, group: str) -> int:
+        """Cancel in-flight tasks of one group; returns how many were cancelled."""
+        stale = [task for task, task_group in self._tasks.items() if task_group == group and not task.done()]
+        for task in stale:
+            task.cancel()
+            self._forget(task)
+        return len(stale)
+
+    async def drain(self, timeout: float = 5.0):
+        """Cancel every in-flight task and wait for them to finish."""
+        self._closed = True
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
+        self.log.info("Drained", **self.stats())
+
+    def _forget(self, task: asyncio.Task):
+        self._tasks.pop(task, None)
+        self._supersedable.discard(task)
+
+    def _on_done(self, task: asyncio.Task):
+        group = self._tasks.get(task, "default")
+        self._forget(task)
+        if task.cancelled():
+            self.cancelled += 1
+            return
+        exc = task.exception()
+        if exc is not None:
+            self.failed += 1
+            self.log.error("Task failed", group=group, error=repr(exc))
+        else:
+            self.completed += 1
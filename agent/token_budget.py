@@ -0,0 +1,113 @@
+"""
+Token counting and budget allocation for prompt assembly.
+"""
+
+from typing import Dict, Optional
+
+from structured_log import get_logger
+
+try:
+    import tiktoken
+except ImportError:  # optional: fall back to a character estimate
+    tiktoken = None
+
+
+# Tokenizer used by gpt-4o / gpt-4o-mini
+ENCODING_NAME = "o200k_base"
+
+# Rough chars-per-token when no tokenizer is available
+_CHARS_PER_TOKEN = 4
+
+log = get_logger("tokens")
+
+_encoding = None
+_encoding_failed = False
+
+
+def _get_encoding():
+    """Load the tokenizer once; stay on the estimate if it can't be loaded."""
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed:
+        if tiktoken is None:
+            _encoding_failed = True
+        else:
+            try:
+                _encoding = tiktoken.get_encoding(ENCODING_NAME)
+            except Exception as e:
+                # The BPE file is downloaded on first use; offline workers estimate
+                log.warning("Could not load tokenizer, estimating", encoding=ENCODING_NAME, error=str(e))
+                _encoding_failed = True
+    return _encoding
+
+
+def count_tokens(text: Optional[str]) -> int:
+    """Number of tokens text takes up in the prompt."""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return -(-len(text) // _CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(content: str, max_tokens: int) -> str:
+    """Truncate content to max_tokens while preserving whole lines."""
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_encoding()
+    if encoding is None:
+        max_chars = max_tokens * _CHARS_PER_TOKEN
+        if len(content) <= max_chars:
+            return content
+        truncated = content[:max_chars]
+    else:
+        # Only tokenize a prefix, so cutting a huge section costs O(budget)
+        window = max_tokens * _CHARS_PER_TOKEN * 2
+        while True:
+            tokens = encoding.encode(content[:window], disallowed_special=())
+            if len(tokens) > max_tokens:
+                truncated = encoding.decode(tokens[:max_tokens])
+                break
+            if window >= len(content):
+                return content
+            window *= 2
+
+    last_newline = truncated.rfind('\n')
+    if last_newline > len(truncated) // 2:
+        truncated = truncated[:last_newline]
+
+    return truncated + "\n..."
+
+
+def allocate_budget(budget: int, demands: Dict[str, int], priorities: Dict[str, float]) -> Dict[str, int]:
+    """Split budget across sections by priority weight.
+
+    Sections that need less than their share keep only what they need and the
+    remainder is re-split among the others, until the budget or the demand
+    runs out.
+    """
+    allocation = {name: 0 for name in demands}
+    active = {name for name, demand in demands.items() if demand > 0}
+    remaining = max(budget, 0)
+
+    while active and remaining > 0:
+        total_weight = sum(priorities.get(name, 1.0) for name in active)
+        shares = {
+            name: int(remaining * priorities.get(name, 1.0) / total_weight)
+            for name in active
+        }
+        satisfied = {name for name in active if demands[name] - allocation[name] <= shares[name]}
+
+        if not satisfied:
+            # Everyone wants more than their share: hand it out and stop
+            for name in active:
+                allocation[name] += shares[name]
+            break
+
+        for name in satisfied:
+            need = demands[name] - allocation[name]
+            allocation[name] += need
+            remaining -= need
+        active -= satisfied
+
+    return allocation
@@ -0,0 +1,256 @@
+"""
+On-disk cache of synthesized speech, shared by every session on a machine.
+
+Transition and completion lines, and greetings for the same user on the
+same repo, come out (nearly) word for word again and again. The agent's TTS
+is wrapped in CachedTTS: each utterance is looked up by (voice, model,
+normalized text, audio format); a miss is synthesized by the wrapped TTS and
+streamed to the listener while the PCM is collected, then written to the
+cache once the utterance completes (an interrupted one never is). A hit
+streams the stored PCM without calling the TTS provider.
+
+AudioCache is the store on its own: files named by key digest in one
+directory, bounded by total bytes, least recently used evicted first. It
+keeps recency in file mtimes, so a restarted worker (or another job process
+on the same disk) picks up where the last one left off.
+"""
+
+import asyncio
+import hashlib
+import os
+import re
+import threading
+import unicodedata
+import uuid
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from livekit.agents import APIConnectOptions, tts
+from livekit.agents.types import DEFAULT_API_CONNECT_OPTIONS
+
+import settings
+from structured_log import get_logger
+
+# Bytes pushed to the listener at a time when replaying from the cache
+REPLAY_CHUNK_BYTES = 8192
+
+_WHITESPACE = re.compile(r"\s+")
+_QUOTES = str.maketrans({"‘": "'", "’": "'", "“": '"', "”": '"', "–": "-", "—": "-"})
+
+
+def normalize_text(text: str) -> str:
+    """Text as it is spoken: Unicode-normalized, plain quotes, single spaces."""
+    text = unicodedata.normalize("NFKC", text).translate(_QUOTES)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def cache_key(voice: str, model: str, text: str, sample_rate: int, num_channels: int) -> str:
+    raw = "\x00".join((voice, model, str(sample_rate), str(num_channels), normalize_text(text)))
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=20).hexdigest()
+
+
+class AudioCache:
+    """Size-bounded LRU of audio blobs in a directory, keyed by cache_key().
+
+    Safe to share between sessions and threads. Several processes may use
+    the same directory: writes are atomic renames, and a file another
+    process evicted is just a miss.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # key -> bytes, oldest first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.log = get_logger("tts-cache")
+        self._load()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pcm")
+
+    def _load(self):
+        """Index files left by earlier runs, oldest first."""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            found = []
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".pcm") and entry.is_file():
+                        stat = entry.stat()
+                        found.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+        except OSError as e:
+            self.log.warning("TTS cache directory unavailable", directory=self.directory, error=str(e))
+            return
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self.size_bytes += size
+        self._evict()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.size_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "evictions": self.evictions,
+            }
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Cached audio for key, or None; a hit becomes most recently used."""
+        with self._lock:
+            known = key in self._entries
+            if known:
+                self._entries.move_to_end(key)
+        data = None
+        if known:
+            try:
+                with open(self._path(key), "rb") as f:
+                    data = f.read()
+                os.utime(self._path(key))  # recency survives restarts
+            except OSError:
+                self._forget(key)  # evicted by another process
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes):
+        """Store audio for key (atomically), evicting the least recently used over budget."""
+        if not data or len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            self.log.warning("Could not write TTS cache entry", error=str(e))
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            self.size_bytes -= self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self.size_bytes += len(data)
+            self.stores += 1
+        self._evict()
+
+    def _forget(self, key: str):
+        with self._lock:
+            self.size_bytes -= self._entries.pop(key, 0)
+
+    def _evict(self):
+        while True:
+            with self._lock:
+                if self.size_bytes <= self.max_bytes or not self._entries:
+                    return
+                key, size = self._entries.popitem(last=False)
+                self.size_bytes -= size
+                self.evictions += 1
+            try:
+                os.unlink(self._path(key))
+            except OSError:
+                pass
+
+
+class CachedTTS(tts.TTS):
+    """Wraps a TTS so repeated utterances are served from an AudioCache.
+
+    `voice` and `model` are part of the key (the wrapped TTS doesn't expose
+    them uniformly). Works with any non-streaming tts.TTS, including a stub
+    that yields fixed frames, which is how the cache is exercised without a
+    provider. `hits` and `misses` count this wrapper's utterances; the cache
+    keeps totals across sessions.
+    """
+
+    def __init__(self, wrapped: tts.TTS, *, voice: str, model: str, cache: AudioCache):
+        super().__init__(
+            capabilities=tts.TTSCapabilities(streaming=False),
+            sample_rate=wrapped.sample_rate,
+            num_channels=wrapped.num_channels,
+        )
+        self.wrapped = wrapped
+        self.voice = voice
+        self.model_name = model
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+        # Errors still reach the session; metrics come from our own streams
+        wrapped.on("error", lambda error: self.emit("error", error))
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+    def synthesize(
+        self, text: str, *, conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS
+    ) -> "CachedChunkedStream":
+        return CachedChunkedStream(tts=self, input_text=text, conn_options=conn_options)
+
+    def prewarm(self):
+        self.wrapped.prewarm()
+
+    async def aclose(self):
+        await self.wrapped.aclose()
+
+
+class CachedChunkedStream(tts.ChunkedStream):
+    def __init__(self, *, tts: CachedTTS, input_text: str, conn_options: APIConnectOptions):
+        super().__init__(tts=tts, input_text=input_text, conn_options=conn_options)
+        self._cached_tts = tts
+
+    async def _run(self, output_emitter: tts.AudioEmitter):
+        owner = self._cached_tts
+        key = cache_key(owner.voice, owner.model_name, self.input_text, owner.sample_rate, owner.num_channels)
+        output_emitter.initialize(
+            request_id=uuid.uuid4().hex[:12],
+            sample_rate=owner.sample_rate,
+            num_channels=owner.num_channels,
+            mime_type="audio/pcm",
+        )
+
+        cached = await asyncio.to_thread(owner.cache.get, key)
+        if cached is not None:
+            owner.hits += 1
+            for start in range(0, len(cached), REPLAY_CHUNK_BYTES):
+                output_emitter.push(cached[start:start + REPLAY_CHUNK_BYTES])
+            output_emitter.flush()
+            return
+
+        # Stream the wrapped TTS through, keeping the audio for the cache
+        owner.misses += 1
+        chunks = []
+        async with owner.wrapped.synthesize(self.input_text, conn_options=self._conn_options) as stream:
+            async for audio in stream:
+                data = bytes(audio.frame.data)
+                chunks.append(data)
+                output_emitter.push(data)
+        output_emitter.flush()
+        # Only complete utterances get here: an interruption cancels _run
+        await asyncio.to_thread(owner.cache.put, key, b"".join(chunks))
+
+
+_cache: Optional[AudioCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_audio_cache() -> Optional[AudioCache]:
+    """The process-wide AudioCache, or None when SB_TTS_CACHE_BYTES is 0."""
+    global _cache
+    if settings.TTS_CACHE_BYTES <= 0:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = AudioCache(settings.TTS_CACHE_DIR, settings.TTS_CACHE_BYTES)
+        return _cache
@@ -0,0 +1,130 @@
+"""
+Codecs for data channel packets.
+
+JSON is always available and is what the local server speaks by default.
+When the UI lists "msgpack/1" in its `onboarding-context` capabilities,
+agent -> UI packets switch to MessagePack:
+
+- UI commands are arrays `[tag, field, ...]`, where tag is the command's
+  index in commands.COMMAND_TYPES and fields follow the dataclass order
+  (without "type"); trailing unset (None) fields are dropped.
+- Several commands sent together are a map `{"type": "batch",
+  "commands": [[tag, ...], ...]}`.
+- Other messages (request-file, request-files) are plain maps.
+
+The "/1" versions the command layout: a layout change ships as "msgpack/2"
+and the agent picks the newest version both sides list. Inbound packets
+are sniffed, so the UI can move to MessagePack without a handshake change.
+"""
+
+import json
+from typing import Any, Dict, Iterable, List, Optional
+
+from commands import COMMAND_FIELDS, COMMAND_TYPES, UICommand, command_to_dict
+
+try:
+    import msgpack
+except ImportError:  # in requirements.txt; fall back to JSON if it's missing anyway
+    msgpack = None
+
+
+class JsonCodec:
+    name = "json"
+
+    def encode_command(self, command: UICommand) -> bytes:
+        return json.dumps(command_to_dict(command)).encode("utf-8")
+
+    def encode_commands(self, commands: List[UICommand]) -> bytes:
+        """One command as itself, several as a `batch` packet."""
+        if len(commands) == 1:
+            return self.encode_command(commands[0])
+        return self.encode_message({"type": "batch", "commands": [command_to_dict(c) for c in commands]})
+
+    def encode_message(self, message: Dict[str, Any]) -> bytes:
+        return json.dumps(message).encode("utf-8")
+
+    def decode(self, payload: bytes) -> Dict[str, Any]:
+        # Decoding first skips json's byte-encoding detection, which is slower
+        return json.loads(payload.decode("utf-8"))
+
+
+class MsgpackCodec:
+    """MessagePack with positional command layouts (version 1)."""
+
+    name = "msgpack/1"
+
+    def __init__(self):
+        # class -> (tag, fields without "type"), computed once
+        self._layouts = {
+            cls: (tag, tuple(name for name in COMMAND_FIELDS[cls] if name != "type"))
+            for tag, cls in enumerate(COMMAND_TYPES)
+        }
+        # tag -> (type name, fields) for decoding
+        self._by_tag = [
+            (cls.__dataclass_fields__["type"].default, names)
+            for cls, (_, names) in self._layouts.items()
+        ]
+        self._packer = msgpack.Packer(use_bin_type=True) if msgpack else None
+
+    def encode_command(self, command: UICommand) -> bytes:
+        return self._packer.pack(self._values(command))
+
+    def encode_commands(self, commands: List[UICommand]) -> bytes:
+        """One command as itself, several as a `batch` map."""
+        if len(commands) == 1:
+            return self.encode_command(commands[0])
+        return self._packer.pack({"type": "batch", "commands": [self._values(c) for c in commands]})
+
+    def _values(self, command: UICommand) -> List[Any]:
+        tag, names = self._layouts[type(command)]
+        values = [tag]
+        values.extend(getattr(command, name) for name in names)
+        while len(values) > 1 and values[-1] is None:
+            values.pop()
+        return values
+
+    def encode_message(self, message: Dict[str, Any]) -> bytes:
+        return self._packer.pack(message)
+
+    def decode(self, payload: bytes) -> Dict[str, Any]:
+        value = msgpack.unpackb(payload, raw=False)
+        if isinstance(value, list):
+            return self._expand(value)
+        if value.get("type") == "batch":
+            value["commands"] = [self._expand(c) if isinstance(c, list) else c for c in value.get("commands", [])]
+        return value
+
+    def _expand(self, value: List[Any]) -> Dict[str, Any]:
+        type_name, names = self._by_tag[value[0]]
+        decoded = dict(zip(names, value[1:]))
+        decoded["type"] = type_name
+        return decoded
+
+
+JSON = JsonCodec()
+MSGPACK = MsgpackCodec() if msgpack else None
+
+# Preferred first
+SUPPORTED_CODECS: List[Any] = ([MSGPACK] if MSGPACK else []) + [JSON]
+
+
+def negotiate_codec(capabilities: Iterable[str]):
+    """Pick the best codec both sides support; JSON when nothing else matches."""
+    offered = set(capabilities)
+    for codec in SUPPORTED_CODECS:
+        if codec.name in offered:
+            return codec
+    return JSON
+
+
+# First bytes of a MessagePack map or array; JSON objects start with "{"
+_MSGPACK_LEADS = frozenset(range(0x80, 0xA0)) | {0xDC, 0xDD, 0xDE, 0xDF}
+
+
+def decode_packet(payload: bytes) -> Optional[Dict[str, Any]]:
+    """Decode an inbound packet in whichever codec it was sent."""
+    if payload and payload[0] in _MSGPACK_LEADS:
+        if MSGPACK is None:
+            raise ValueError("MessagePack packet received but msgpack is not installed")
+        return MSGPACK.decode(payload)
+    return JSON.decode(payload)
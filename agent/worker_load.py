@@ -0,0 +1,336 @@
+"""
+Worker load from measured per-session CPU, event-loop lag and memory.
+
+Each session runs a LoadProbe in its job process. It times how late a short
+ticker wakes up on the session's event loop and writes the recent p95 to a
+small file in PROBE_DIR, named after the process. The worker process samples
+CPU and RSS for itself and all its children with psutil. It also reads the
+probes of the children that are running a session. Each measurement is taken
+against its budget (SB_LOAD_CPU_PERCENT, SB_LOAD_LAG_MS, SB_LOAD_RSS_MB). The
+load is the largest of those fractions, so 1.0 means some budget is used up.
+
+`worker_load()` is the worker's load_fnc. LiveKit stops dispatching to the
+worker once that load passes load_threshold (SB_LOAD_DRAIN_PERCENT), so new
+rooms go to healthier workers while running sessions carry on. `admit()` is
+the request_fnc, covering jobs offered before the next load report. It
+rejects a job when one more session of the size currently measured would
+overrun a budget, or when the worker already runs SB_MAX_SESSIONS. The
+dispatcher then offers the job to another worker.
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from dataclasses import asdict, dataclass
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+import psutil
+from livekit.agents import JobRequest
+from livekit.agents.utils.hw import get_cpu_monitor
+
+import settings
+from structured_log import get_logger
+
+# Shared by the job processes of every worker on the machine; each worker
+# only reads the probes of its own children
+PROBE_DIR = os.path.join(tempfile.gettempdir(), "sb-load")
+
+# Seconds between probe ticks and between probe writes; lag is the p95 of
+# the last PROBE_WINDOW ticks
+PROBE_TICK = 0.05
+PROBE_WRITE_INTERVAL = 1.0
+PROBE_WINDOW = 40
+
+# Seconds between worker samples; load averages the last SAMPLE_WINDOW
+SAMPLE_INTERVAL = 0.5
+SAMPLE_WINDOW = 5
+
+# Seconds an accepted job counts as a session before its probe shows up
+STARTING_SECONDS = 3.0
+
+
+class LoadProbe:
+    """Publishes one session's event-loop lag for the worker process to read."""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.path = os.path.join(PROBE_DIR, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.json")
+        self._lags: Deque[float] = deque(maxlen=PROBE_WINDOW)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="load-probe")
+
+    async def aclose(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def lag(self) -> float:
+        """p95 of recent loop lag, in seconds."""
+        if not self._lags:
+            return 0.0
+        ordered = sorted(self._lags)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        written = 0.0
+        while True:
+            expected = loop.time() + PROBE_TICK
+            await asyncio.sleep(PROBE_TICK)
+            now = loop.time()
+            self._lags.append(max(0.0, now - expected))
+            if now - written >= PROBE_WRITE_INTERVAL:
+                written = now
+                self._write()
+
+    def _write(self):
+        record = {"label": self.label, "lag": round(self.lag(), 4), "at": time.time()}
+        tmp = f"{self.path}.tmp"
+        try:
+            os.makedirs(PROBE_DIR, exist_ok=True)
+            with open(tmp, "w") as f:
+                json.dump(record, f)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass  # the worker sees no probe and falls back to CPU and memory
+
+
+def read_probes(pids: Iterable[int]) -> List[Tuple[int, float]]:
+    """(pid, lag) of every session probe written by one of `pids`.
+
+    A probe that stopped being rewritten belongs to a session whose loop is
+    blocked, so its age counts as lag. Files left by dead processes are removed.
+    """
+    pids = set(pids)
+    probes = []
+    now = time.time()
+    try:
+        names = os.listdir(PROBE_DIR)
+    except OSError:
+        return probes
+    for name in names:
+        head, sep, rest = name.partition("-")
+        if not sep or not rest.endswith(".json") or not head.isdigit():
+            continue
+        pid = int(head)
+        path = os.path.join(PROBE_DIR, name)
+        if pid not in pids:
+            if not psutil.pid_exists(pid):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            continue
+        try:
+            with open(path) as f:
+                record = json.load(f)
+            lag = max(float(record["lag"]), now - float(record["at"]) - PROBE_WRITE_INTERVAL)
+        except (OSError, ValueError, KeyError, TypeError):
+            continue
+        probes.append((pid, lag))
+    return probes
+
+
+def memory_limit() -> int:
+    """Bytes of memory available to this container: its cgroup limit, else physical memory."""
+    physical = psutil.virtual_memory().total
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.isdigit() and int(value) < physical:
+            return int(value)
+    return physical
+
+
+@dataclass
+class LoadSample:
+    cpu: float  # fraction of the cores available to the container, whole worker
+    rss: int  # bytes, whole worker
+    lag: float  # seconds, worst session
+    sessions: int
+    session_cpu: float  # per session, as cpu
+    session_rss: int  # per session, bytes
+
+
+class WorkerLoad:
+    """Background sampler of the worker's processes, shared by load_fnc and request_fnc."""
+
+    _instance: Optional["WorkerLoad"] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.cpu_count = max(get_cpu_monitor().cpu_count(), 0.01)
+        self.rss_budget = settings.LOAD_RSS_MB * 1024 * 1024 or int(memory_limit() * 0.8)
+        self.log = get_logger("load")
+        self._me = psutil.Process()
+        self._procs: Dict[int, psutil.Process] = {self._me.pid: self._me}
+        self._samples: Deque[LoadSample] = deque(maxlen=SAMPLE_WINDOW)
+        self._starting: Deque[float] = deque()  # when recently accepted jobs were taken
+        self._draining = False
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="sb_worker_load")
+        self._thread.start()
+
+    @classmethod
+    def instance(cls) -> "WorkerLoad":
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = WorkerLoad()
+        return cls._instance
+
+    def current(self) -> Optional[LoadSample]:
+        """Recent samples averaged (CPU, lag); the latest for memory and sessions."""
+        with self._lock:
+            samples = list(self._samples)
+        if not samples:
+            return None
+        latest = samples[-1]
+        return LoadSample(
+            cpu=sum(s.cpu for s in samples) / len(samples),
+            rss=latest.rss,
+            lag=sum(s.lag for s in samples) / len(samples),
+            sessions=latest.sessions,
+            session_cpu=sum(s.session_cpu for s in samples) / len(samples),
+            session_rss=latest.session_rss,
+        )
+
+    def ratios(self, cpu: float, lag: float, rss: int) -> Dict[str, float]:
+        """Each measurement as a fraction of its budget (budgets set to 0 are left out)."""
+        ratios = {"rss": rss / self.rss_budget}
+        if settings.LOAD_CPU_PERCENT > 0:
+            ratios["cpu"] = cpu * 100 / settings.LOAD_CPU_PERCENT
+        if settings.LOAD_LAG_MS > 0:
+            ratios["lag"] = lag * 1000 / settings.LOAD_LAG_MS
+        return ratios
+
+    def load(self) -> float:
+        sample = self.current()
+        if sample is None:
+            return 0.0
+        return min(1.0, max(self.ratios(sample.cpu, sample.lag, sample.rss).values()))
+
+    def admission(self) -> Optional[str]:
+        """Why one more session should be refused right now, or None to take it."""
+        sample = self.current()
+        with self._lock:
+            now = time.monotonic()
+            while self._starting and now - self._starting[0] > STARTING_SECONDS:
+                self._starting.popleft()
+            starting = len(self._starting)
+        sessions = (sample.sessions if sample else 0) + starting
+        if settings.MAX_SESSIONS and sessions >= settings.MAX_SESSIONS:
+            return "max_sessions"
+        if sample is None:
+            return None
+        # The new session and any still starting, each the size of a running one
+        extra = 1 + starting
+        ratios = self.ratios(
+            sample.cpu + sample.session_cpu * extra,
+            sample.lag,
+            sample.rss + sample.session_rss * extra,
+        )
+        over = [name for name, ratio in ratios.items() if ratio >= 1.0]
+        return ",".join(sorted(over)) or None
+
+    def accepted(self):
+        with self._lock:
+            self._starting.append(time.monotonic())
+
+    def summary(self) -> Dict[str, float]:
+        sample = self.current()
+        if sample is None:
+            return {}
+        summary = asdict(sample)
+        summary["cpu"] = round(sample.cpu, 3)
+        summary["session_cpu"] = round(sample.session_cpu, 3)
+        summary["lag_ms"] = round(summary.pop("lag") * 1000, 1)
+        summary["load"] = round(self.load(), 3)
+        return summary
+
+    def _run(self):
+        while True:
+            try:
+                sample = self._sample()
+            except Exception as e:
+                self.log.warning("Load sampling failed", error=str(e))
+            else:
+                with self._lock:
+                    self._samples.append(sample)
+                self._check_drain()
+            time.sleep(SAMPLE_INTERVAL)
+
+    def _sample(self) -> LoadSample:
+        procs = {self._me.pid: self._me}
+        for child in self._me.children(recursive=True):
+            # Reuse Process objects: cpu_percent() measures since the last call on each
+            procs[child.pid] = self._procs.get(child.pid, child)
+        self._procs = procs
+
+        cpu: Dict[int, float] = {}
+        rss: Dict[int, int] = {}
+        for pid, proc in procs.items():
+            try:
+                with proc.oneshot():
+                    cpu[pid] = proc.cpu_percent(None) / 100 / self.cpu_count
+                    rss[pid] = proc.memory_info().rss
+            except psutil.Error:
+                continue  # exited since children() was listed
+
+        probes = read_probes(cpu)
+        per_process = Counter(pid for pid, _ in probes)
+        sessions = len(probes)
+        # A process running several sessions (thread executor) splits its usage
+        session_cpu = sum(cpu[pid] for pid in per_process) / sessions if sessions else 0.0
+        session_rss = sum(rss[pid] for pid in per_process) // sessions if sessions else 0
+        return LoadSample(
+            cpu=sum(cpu.values()),
+            rss=sum(rss.values()),
+            lag=max((lag for _, lag in probes), default=0.0),
+            sessions=sessions,
+            session_cpu=session_cpu,
+            session_rss=session_rss,
+        )
+
+    def _check_drain(self):
+        draining = self.load() * 100 >= settings.LOAD_DRAIN_PERCENT
+        if draining != self._draining:
+            self._draining = draining
+            if draining:
+                self.log.warning("Worker over its load threshold; not taking new jobs", **self.summary())
+            else:
+                self.log.info("Worker back under its load threshold", **self.summary())
+
+
+def worker_load() -> float:
+    """load_fnc: the worker's load, 1.0 when any budget is used up."""
+    return WorkerLoad.instance().load()
+
+
+async def admit(request: JobRequest):
+    """request_fnc: take the job unless one more session would overrun the worker."""
+    load = WorkerLoad.instance()
+    reason = load.admission()
+    if reason:
+        load.log.warning("Rejecting job", reason=reason, room=request.room.name, **load.summary())
+        # terminate=False: the dispatcher offers the job to another worker
+        await request.reject(terminate=False)
+        return
+    load.accepted()
+    await request.accept()
@@ -7,6 +7,12 @@ import {
   fetchKnowledge,
   fetchFileContent,
 } from "@/lib/api";
+import {
+  buildFileContentPackets,
+  SUPPORTED_ENCODINGS,
+  type ContentEncoding,
+} from "@/lib/file-transfer";
+import { decodeAgentPacket, SUPPORTED_CODECS } from "@/lib/wire-codec";
 
 // Command types from agent
 interface NavigateCommand {
@@ -25,13 +31,45 @@ interface ShowFileCommand {
   featureName?: string;
 }
 
-interface RequestFileCommand {
+// Optional line window and content encoding the agent asks for
+interface FileRequestOptions {
+  startLine?: number;
+  endLine?: number;
+  encoding?: ContentEncoding;
+}
+
+interface RequestFileCommand extends FileRequestOptions {
   type: "request-file";
   path: string;
   requestId: string;
 }
 
-type AgentCommand = NavigateCommand | ShowFileCommand | RequestFileCommand;
+interface RequestFilesCommand extends FileRequestOptions {
+  type: "request-files";
+  paths: string[];
+  requestId: string;
+}
+
+type AgentCommand =
+  | NavigateCommand
+  | ShowFileCommand
+  | RequestFileCommand
+  | RequestFilesCommand;
+
+// Commands the agent issued within one frame, in order
+interface BatchCommand {
+  type: "batch";
+  commands: AgentCommand[];
+}
+
+// Protocol extensions this bridge understands, advertised to the agent
+const CAPABILITIES = [
+  "request-files",
+  "line-range",
+  "command-batch",
+  ...SUPPORTED_ENCODINGS,
+  ...SUPPORTED_CODECS,
+];
 
 interface UseAgentCommandsReturn {
   guidedState: GuidedViewState | null;
@@ -75,6 +113,7 @@ export function useAgentCommands(): UseAgentCommandsReturn {
           if (session) {
             const baseContext = {
               type: "onboarding-context",
+              capabilities: CAPABILITIES,
               session: {
                 userName: session.userName,
                 goal: session.goal,
@@ -131,22 +170,21 @@ export function useAgentCommands(): UseAgentCommandsReturn {
                 (k) => k.sourceFile === firstFilePath
               );
 
-              const fileContext = {
-                type: "file-content",
-                path: firstFilePath,
-                content: fileData.content,
-                knowledge: knowledge?.content?.raw,
-                totalLines: fileData.totalLines,
-              };
-
-              const filePayload = new TextEncoder().encode(
-                JSON.stringify(fileContext)
+              const packets = await buildFileContentPackets(
+                {
+                  path: firstFilePath,
+                  knowledge: knowledge?.content?.raw,
+                  totalLines: fileData.totalLines,
+                },
+                fileData.content
               );
 
-              await send(filePayload, {
-                reliable: true,
-                destinationIdentities: [participant.identity],
-              });
+              for (const packet of packets) {
+                await send(new TextEncoder().encode(JSON.stringify(packet)), {
+                  reliable: true,
+                  destinationIdentities: [participant.identity],
+                });
+              }
             }
             setIsReady(true);
           } else {
@@ -193,55 +231,91 @@ export function useAgentCommands(): UseAgentCommandsReturn {
     };
   }, [room, send]);
 
+  const sendFileContent = useCallback(
+    async (requestId: string, path: string, options: FileRequestOptions) => {
+      try {
+        const ranged =
+          options.startLine !== undefined && options.endLine !== undefined;
+        const fileData = ranged
+          ? await fetchFileContent(path, options.startLine, options.endLine)
+          : await fetchFileContent(path);
+        const packets = await buildFileContentPackets(
+          {
+            requestId,
+            path,
+            totalLines: fileData.totalLines,
+            startLine: fileData.startLine,
+            endLine: fileData.endLine,
+          },
+          fileData.content,
+          options.encoding
+        );
+
+        for (const packet of packets) {
+          await send(new TextEncoder().encode(JSON.stringify(packet)), {
+            reliable: true,
+          });
+        }
+        console.log("[ContextBridge] Sent file content to agent:", path);
+      } catch (err) {
+        console.error("[ContextBridge] Failed to fetch requested file:", err);
+      }
+    },
+    [send]
+  );
+
+  const handleCommand = useCallback(
+    async (command: AgentCommand) => {
+      console.log("[AgentCommand] Received:", command);
+      setLastCommand(command);
+
+      if (command.type === "showFile") {
+        setGuidedState({
+          file: command.file,
+          title: command.title,
+          explanation: command.explanation,
+          startLine: command.startLine,
+          endLine: command.endLine,
+          highlightLines: command.highlightLines,
+          featureName: command.featureName,
+        });
+      } else if (command.type === "request-file") {
+        console.log("[ContextBridge] Agent requested file:", command.path);
+        await sendFileContent(command.requestId, command.path, command);
+      } else if (command.type === "request-files") {
+        console.log("[ContextBridge] Agent requested files:", command.paths);
+        // Reply per path as each file resolves; the agent matches by path
+        await Promise.all(
+          command.paths.map((path) =>
+            sendFileContent(command.requestId, path, command)
+          )
+        );
+      }
+    },
+    [sendFileContent]
+  );
+
   // Handle data received (requests from agent)
   const onMessage = useCallback(
     async (msg: any) => {
       try {
         const payload = msg.payload || msg;
-        const text = new TextDecoder().decode(payload);
-        const command = JSON.parse(text) as AgentCommand;
-
-        console.log("[AgentCommand] Received:", command);
-        setLastCommand(command);
-
-        if (command.type === "showFile") {
-          setGuidedState({
-            file: command.file,
-            title: command.title,
-            explanation: command.explanation,
-            startLine: command.startLine,
-            endLine: command.endLine,
-            highlightLines: command.highlightLines,
-            featureName: command.featureName,
-          });
-        } else if (command.type === "request-file") {
-          console.log("[ContextBridge] Agent requested file:", command.path);
-          try {
-            const fileData = await fetchFileContent(command.path);
-            const response = {
-              type: "file-content",
-              requestId: command.requestId,
-              path: command.path,
-              content: fileData.content,
-              totalLines: fileData.totalLines,
-            };
+        const packet = decodeAgentPacket(payload) as
+          | AgentCommand
+          | BatchCommand;
 
-            await send(new TextEncoder().encode(JSON.stringify(response)), {
-              reliable: true,
-            });
-            console.log("[ContextBridge] Sent file content to agent");
-          } catch (err) {
-            console.error(
-              "[ContextBridge] Failed to fetch requested file:",
-              err
-            );
+        if (packet.type === "batch") {
+          for (const command of packet.commands) {
+            await handleCommand(command);
           }
+        } else {
+          await handleCommand(packet);
         }
       } catch (error) {
         console.error("[AgentCommand] Failed to parse:", error);
       }
     },
-    [send]
+    [handleCommand]
   );
 
   // Listen for agent commands
@@ -0,0 +1,86 @@
+/**
+ * Encoding of file-content packets sent to the voice agent.
+ *
+ * Payloads above CHUNK_SIZE are split into several `file-content` packets
+ * carrying `seq`/`chunks`; the agent reassembles them by requestId and path.
+ */
+
+// Stay well under LiveKit's reliable packet limit (~15 KiB). Base64 is one
+// byte per char; raw text can take up to three bytes per char in UTF-8.
+const CHUNK_SIZE = 12_000;
+const TEXT_CHUNK_SIZE = CHUNK_SIZE / 3;
+
+export type ContentEncoding = "identity" | "zlib";
+
+export const SUPPORTED_ENCODINGS: ContentEncoding[] =
+  typeof CompressionStream !== "undefined" ? ["zlib"] : [];
+
+async function zlibBase64(text: string): Promise<string> {
+  // "deflate" in CompressionStream is the zlib-wrapped format
+  const stream = new Blob([text])
+    .stream()
+    .pipeThrough(new CompressionStream("deflate"));
+  const bytes = new Uint8Array(await new Response(stream).arrayBuffer());
+  let binary = "";
+  for (let i = 0; i < bytes.length; i += 0x8000) {
+    binary += String.fromCharCode(...bytes.subarray(i, i + 0x8000));
+  }
+  return btoa(binary);
+}
+
+function splitChunks(data: string, size: number): string[] {
+  const parts: string[] = [];
+  let start = 0;
+  while (start < data.length) {
+    let end = Math.min(start + size, data.length);
+    // Don't split a surrogate pair across packets
+    const code = data.charCodeAt(end - 1);
+    if (end < data.length && code >= 0xd800 && code <= 0xdbff) end -= 1;
+    parts.push(data.slice(start, end));
+    start = end;
+  }
+  return parts.length ? parts : [""];
+}
+
+/**
+ * Build the packet(s) for one file. Small identity payloads keep the
+ * original single-packet shape so older agents still understand them.
+ */
+export async function buildFileContentPackets(
+  meta: Record<string, unknown>,
+  content: string,
+  encoding: ContentEncoding = "identity"
+): Promise<Record<string, unknown>[]> {
+  const useZlib = encoding === "zlib" && SUPPORTED_ENCODINGS.includes("zlib");
+  if (!useZlib && content.length <= TEXT_CHUNK_SIZE) {
+    return [{ type: "file-content", ...meta, content }];
+  }
+
+  const parts = useZlib
+    ? splitChunks(await zlibBase64(content), CHUNK_SIZE)
+    : splitChunks(content, TEXT_CHUNK_SIZE);
+  const chunks = parts.length;
+  const packets: Record<string, unknown>[] = [];
+  parts.forEach((slice, seq) => {
+    packets.push(
+      seq === 0
+        ? {
+            type: "file-content",
+            ...meta,
+            encoding: useZlib ? "zlib" : "identity",
+            seq,
+            chunks,
+            data: slice,
+          }
+        : {
+            type: "file-content",
+            requestId: meta.requestId,
+            path: meta.path,
+            seq,
+            chunks,
+            data: slice,
+          }
+    );
+  });
+  return packets;
+}
@@ -0,0 +1,154 @@
+/**
+ * Decoding of agent -> UI packets on the `agent-commands` topic.
+ *
+ * Packets are JSON unless we list "msgpack/1" in our capabilities, in which
+ * case the agent sends MessagePack: UI commands as `[tag, ...fields]` using
+ * COMMAND_LAYOUTS below (mirrors COMMAND_TYPES in agent/commands.py), batches
+ * as `{type: "batch", commands: [[tag, ...], ...]}`, other messages as plain
+ * maps. The first byte tells JSON and MessagePack apart.
+ */
+
+export const SUPPORTED_CODECS = ["msgpack/1"];
+
+// Index = tag; fields in dataclass order, without "type". Append only.
+const COMMAND_LAYOUTS: [string, string[]][] = [
+  ["navigate", ["to"]],
+  ["showConnections", ["file"]],
+  ["expandSection", ["file", "section"]],
+  ["highlightCode", ["file", "lines"]],
+  ["openSidebar", []],
+  [
+    "showFile",
+    [
+      "file",
+      "title",
+      "explanation",
+      "startLine",
+      "endLine",
+      "highlightLines",
+      "featureName",
+    ],
+  ],
+];
+
+const textDecoder = new TextDecoder();
+
+// Minimal MessagePack reader: nil, booleans, numbers, strings, binary,
+// arrays and maps (no extension types, which the agent never sends)
+class Reader {
+  private view: DataView;
+  private offset = 0;
+
+  constructor(private bytes: Uint8Array) {
+    this.view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+  }
+
+  read(): unknown {
+    const byte = this.view.getUint8(this.offset++);
+    if (byte <= 0x7f) return byte;
+    if (byte >= 0xe0) return byte - 0x100;
+    if (byte >= 0xa0 && byte <= 0xbf) return this.str(byte & 0x1f);
+    if (byte >= 0x90 && byte <= 0x9f) return this.array(byte & 0x0f);
+    if (byte >= 0x80 && byte <= 0x8f) return this.map(byte & 0x0f);
+
+    switch (byte) {
+      case 0xc0: return null;
+      case 0xc2: return false;
+      case 0xc3: return true;
+      case 0xc4: return this.bin(this.uint(1));
+      case 0xc5: return this.bin(this.uint(2));
+      case 0xc6: return this.bin(this.uint(4));
+      case 0xca: return this.advance(4, (o) => this.view.getFloat32(o));
+      case 0xcb: return this.advance(8, (o) => this.view.getFloat64(o));
+      case 0xcc: return this.uint(1);
+      case 0xcd: return this.uint(2);
+      case 0xce: return this.uint(4);
+      case 0xcf: return Number(this.advance(8, (o) => this.view.getBigUint64(o)));
+      case 0xd0: return this.advance(1, (o) => this.view.getInt8(o));
+      case 0xd1: return this.advance(2, (o) => this.view.getInt16(o));
+      case 0xd2: return this.advance(4, (o) => this.view.getInt32(o));
+      case 0xd3: return Number(this.advance(8, (o) => this.view.getBigInt64(o)));
+      case 0xd9: return this.str(this.uint(1));
+      case 0xda: return this.str(this.uint(2));
+      case 0xdb: return this.str(this.uint(4));
+      case 0xdc: return this.array(this.uint(2));
+      case 0xdd: return this.array(this.uint(4));
+      case 0xde: return this.map(this.uint(2));
+      case 0xdf: return this.map(this.uint(4));
+    }
+    throw new Error(`Unsupported MessagePack type 0x${byte.toString(16)}`);
+  }
+
+  private advance<T>(size: number, get: (offset: number) => T): T {
+    const value = get(this.offset);
+    this.offset += size;
+    return value;
+  }
+
+  private uint(size: 1 | 2 | 4): number {
+    if (size === 1) return this.advance(1, (o) => this.view.getUint8(o));
+    if (size === 2) return this.advance(2, (o) => this.view.getUint16(o));
+    return this.advance(4, (o) => this.view.getUint32(o));
+  }
+
+  private str(length: number): string {
+    const value = textDecoder.decode(
+      this.bytes.subarray(this.offset, this.offset + length)
+    );
+    this.offset += length;
+    return value;
+  }
+
+  private bin(length: number): Uint8Array {
+    const value = this.bytes.slice(this.offset, this.offset + length);
+    this.offset += length;
+    return value;
+  }
+
+  private array(length: number): unknown[] {
+    const items = new Array(length);
+    for (let i = 0; i < length; i++) items[i] = this.read();
+    return items;
+  }
+
+  private map(length: number): Record<string, unknown> {
+    const result: Record<string, unknown> = {};
+    for (let i = 0; i < length; i++) {
+      const key = String(this.read());
+      result[key] = this.read();
+    }
+    return result;
+  }
+}
+
+function expandCommand(values: unknown[]): Record<string, unknown> {
+  const layout = COMMAND_LAYOUTS[values[0] as number];
+  if (!layout) throw new Error(`Unknown command tag ${values[0]}`);
+  const [type, fields] = layout;
+  const command: Record<string, unknown> = { type };
+  fields.forEach((field, i) => {
+    // Trailing unset fields are left off the wire
+    if (i + 1 < values.length && values[i + 1] !== null) {
+      command[field] = values[i + 1];
+    }
+  });
+  return command;
+}
+
+/** Decode one agent packet, JSON or MessagePack. */
+export function decodeAgentPacket(payload: Uint8Array): unknown {
+  const lead = payload[0];
+  const isMsgpack =
+    (lead >= 0x80 && lead <= 0x9f) || (lead >= 0xdc && lead <= 0xdf);
+  if (!isMsgpack) return JSON.parse(textDecoder.decode(payload));
+
+  const value = new Reader(payload).read();
+  if (Array.isArray(value)) return expandCommand(value);
+  const message = value as Record<string, unknown>;
+  if (message.type === "batch" && Array.isArray(message.commands)) {
+    message.commands = message.commands.map((command) =>
+      Array.isArray(command) ? expandCommand(command) : command
+    );
+  }
+  return message;
+}